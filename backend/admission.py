@@ -0,0 +1,329 @@
+"""
+Memory-budgeted admission control for the processing pipeline.
+
+Before anything is decoded, the image header gives us the dimensions; from
+those and the requested output we estimate the peak working set of the
+pipeline. A request is then admitted (its estimate is reserved against a
+global budget), queued until enough budget is free, or rejected:
+- 413 if the input is too large to ever fit (pixel limit or estimate > budget)
+- 429 if the queue is full or the request waited too long
+Background jobs reserve through admit_background instead: they never join
+the queue and only take budget no waiting request needs.
+
+The budget ledger is a small JSON file guarded by an flock, so all Gunicorn
+workers in the container share one budget, one queue and one set of
+counters. Without fcntl (Windows) the ledger is only shared between threads.
+Entries carry the start time of their process and the ledger its boot id,
+so entries of dead processes are dropped even after a restart reused their
+pids.
+"""
+
+from contextlib import contextmanager
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+
+from resolution import DEFAULT_QUALITY, REDUCE_MODES, plan_processing_size, reduce_factor
+from tiled import DEFAULT_STRIP_ROWS, LANCZOS_SUPPORT, working_geometry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development setups
+    fcntl = None
+
+# Seconds between budget checks of background work waiting for memory
+BACKGROUND_POLL_INTERVAL = 0.5
+
+# Identifies the running kernel; the ledger is reset when it changes (reboot)
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
+# Bytes per pixel of the decoded source per mode (anything else counts as 4);
+# Pillow stores LA and RGB pixels in 4 bytes like RGBA
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 4, 'RGB': 4, 'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def estimate_peak_bytes(width, height, mode='RGBA', size=300, quality=DEFAULT_QUALITY, renders=1):
+    """Rough peak working set of prepare_planes + render_planes for one input
+
+    Counts the decoded source, the full-size copy the box reduction makes (a premultiplied
+    copy for LA/RGBA, an RGB(A) conversion for modes reduce() cannot handle), the reduced
+    RGBA copy, the upscaled RGBA image with its grayscale/alpha planes, and per render the
+    mapped 8-bit planes, the coverage canvases and the RGBA output.
+    """
+    max_dim = max(width, height, 1)
+    factor = reduce_factor(max_dim, size, quality)
+    work_w, work_h = width // factor or 1, height // factor or 1
+    work_max = max(work_w, work_h)
+
+    processing_size = plan_processing_size(work_max, size, quality)
+    if work_max < processing_size * 0.8:
+        scale = processing_size / work_max
+        work_w, work_h = int(work_w * scale), int(work_h * scale)
+    working_pixels = work_w * work_h
+
+    source = width * height * MODE_BYTES.get(mode, 4)
+    if factor == 1 or mode in ('L', 'RGB'):
+        reduce_copy = 0
+    else:
+        reduce_copy = width * height * (MODE_BYTES[mode] if mode in REDUCE_MODES else 4)
+    rgba = (width // factor or 1) * (height // factor or 1) * 4
+    planes = working_pixels * (4 + 1 + 1)  # upscaled RGBA + grayscale + alpha
+    return source + reduce_copy + rgba + planes + estimate_render_bytes(work_w, work_h, size, renders)
+
+
+def estimate_render_bytes(work_w, work_h, size=300, renders=1):
+    """Rough working set of render_planes on already prepared planes of work_w x work_h"""
+    per_render = work_w * work_h * (1 + 1 + 1) + size * size * (1 + 1 + 4)  # LUT planes, canvases, output
+    return per_render * max(1, renders)
+
+
+def estimate_tiled_bytes(width, height, mode='RGBA', size=300, quality=DEFAULT_QUALITY, renders=1,
+                         strip_rows=DEFAULT_STRIP_ROWS):
+    """Rough peak working set of processing.render_tiled: the decoded source plus one strip
+
+    Per strip: the cropped source rows and their RGBA copy, the reduced RGBA strip with its
+    grayscale/alpha planes, and per render the mapped strip, the downsampler's row buffer
+    (strip plus filter margin) and the output canvases.
+    """
+    factor, work_w, work_h = working_geometry(width, height, size, quality) or (1, width, height)
+    margin = 2 * int(LANCZOS_SUPPORT * max(work_w, work_h) / size) + 2
+    source = width * height * MODE_BYTES.get(mode, 4)
+    strip_source = width * strip_rows * factor * (MODE_BYTES.get(mode, 4) + 4)
+    strip_planes = work_w * strip_rows * (4 + 1 + 1)
+    per_render = work_w * strip_rows * 3 + work_w * (2 * strip_rows + margin) + size * size * (1 + 1 + 4)
+    return source + strip_source + strip_planes + per_render * max(1, renders)
+
+
+def estimate_animation_bytes(width, height, mode='RGBA', size=300, quality=DEFAULT_QUALITY, frames=1, workers=1):
+    """Rough peak working set of processing.process_animation
+
+    All decoded RGBA frames, one pipeline run (see estimate_peak_bytes) per frame
+    worker, and per frame the coverage canvas and the RGBA output.
+    """
+    decoded = width * height * 4 * frames
+    pipelines = estimate_peak_bytes(width, height, 'RGBA', size, quality) * max(1, min(workers, frames))
+    return decoded + pipelines + size * size * (1 + 4) * frames
+
+
+def estimate_atlas_bytes(width, height):
+    """Rough working set of packing and encoding an atlas: the processed cells, the RGBA atlas
+    and the encoder's copy of it
+    """
+    return width * height * 4 * 3
+
+
+def process_start(pid):
+    """Start time of a process in clock ticks since boot, None if it is gone or there is no /proc
+
+    Together with the pid it identifies a process: a reused pid gets a new start time.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the command name (which may contain spaces), starttime is field 22
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def boot_id():
+    """Id of the running kernel boot, '' without /proc"""
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+class MemoryBudget:
+    """Global memory budget shared between worker processes through a locked ledger file"""
+
+    def __init__(self, budget_bytes, state_dir=None, max_queue=8, queue_timeout=10.0,
+                 max_input_pixels=100_000_000, poll_interval=0.05):
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_input_pixels = max_input_pixels
+        self.poll_interval = poll_interval
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), 'imagescale-admission')
+        os.makedirs(self.state_dir, exist_ok=True)
+        self._ledger_path = os.path.join(self.state_dir, 'ledger.json')
+        self._lock_path = os.path.join(self.state_dir, 'ledger.lock')
+        self._thread_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def __getstate__(self):
+        # Job pool processes get their own copy: same ledger file, fresh lock and entry ids
+        state = self.__dict__.copy()
+        del state['_thread_lock'], state['_ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._thread_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    @contextmanager
+    def _ledger(self):
+        """Read-modify-write access to the shared ledger"""
+        with self._thread_lock, open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._ledger_path) as f:
+                        ledger = json.load(f)
+                except (OSError, ValueError):
+                    ledger = {}
+                if ledger.get('boot') != boot_id():
+                    # Every process of the previous boot is gone, whatever pids they had
+                    ledger.update(boot=boot_id(), reserved={}, waiting={})
+                ledger.setdefault('reserved', {})
+                ledger.setdefault('waiting', {})
+                ledger.setdefault('stats', {})
+                self._drop_dead(ledger)
+                try:
+                    yield ledger
+                finally:
+                    # Persist even when the block raises (rejections update counters)
+                    tmp_path = self._ledger_path + f'.{os.getpid()}'
+                    with open(tmp_path, 'w') as f:
+                        json.dump(ledger, f)
+                    os.replace(tmp_path, self._ledger_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _drop_dead(ledger):
+        """Release entries of worker processes that died while holding them
+        With /proc an entry is dead once its pid is gone or belongs to a newer process
+        """
+        for table in ('reserved', 'waiting'):
+            for entry_id in list(ledger[table]):
+                pid, start = entry_id.split('-')[:2]
+                pid = int(pid)
+                if os.path.isdir('/proc'):
+                    if process_start(pid) != start:
+                        del ledger[table][entry_id]
+                    continue
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    del ledger[table][entry_id]
+                except OSError:
+                    pass  # Exists but belongs to someone else
+
+    @staticmethod
+    def _count(ledger, name):
+        ledger['stats'][name] = ledger['stats'].get(name, 0) + 1
+
+    def check_pixels(self, width, height):
+        """Reject inputs over the pixel limit straight from the header"""
+        if self.max_input_pixels and width * height > self.max_input_pixels:
+            with self._ledger() as ledger:
+                self._count(ledger, 'rejected_too_large')
+            raise AdmissionRejected(
+                f'Image too large: {width}x{height} exceeds {self.max_input_pixels} pixels', 413)
+
+    def check_estimate(self, estimate_bytes):
+        """Reject work whose estimate could never fit the budget"""
+        if estimate_bytes > self.budget_bytes:
+            with self._ledger() as ledger:
+                self._count(ledger, 'rejected_too_large')
+            raise AdmissionRejected(
+                f'Image needs about {estimate_bytes // (1024 * 1024)} MB, budget is '
+                f'{self.budget_bytes // (1024 * 1024)} MB', 413)
+
+    def _entry_id(self):
+        pid = os.getpid()
+        return f'{pid}-{process_start(pid)}-{threading.get_ident()}-{next(self._ids)}'
+
+    @contextmanager
+    def admit(self, estimate_bytes):
+        """Reserve estimate_bytes of the budget for the duration of the block (may wait)"""
+        entry_id = self._entry_id()
+        self.check_estimate(estimate_bytes)
+
+        deadline = time.monotonic() + self.queue_timeout
+        queued_since = None
+        while True:
+            with self._ledger() as ledger:
+                in_use = sum(ledger['reserved'].values())
+                # Waiting requests are served first-come-first-served
+                ahead = [other for other, since in ledger['waiting'].items()
+                         if queued_since is None or (since, other) < (queued_since, entry_id)]
+                queued = queued_since is not None
+                if in_use + estimate_bytes <= self.budget_bytes and not ahead:
+                    ledger['waiting'].pop(entry_id, None)
+                    ledger['reserved'][entry_id] = estimate_bytes
+                    self._count(ledger, 'admitted_after_wait' if queued else 'admitted')
+                    break
+                if not queued:
+                    if len(ledger['waiting']) >= self.max_queue:
+                        self._count(ledger, 'rejected_queue_full')
+                        raise AdmissionRejected('Server busy, queue is full', 429, retry_after=1)
+                    queued_since = time.time()
+                    ledger['waiting'][entry_id] = queued_since
+                    self._count(ledger, 'queued')
+                elif time.monotonic() > deadline:
+                    ledger['waiting'].pop(entry_id, None)
+                    self._count(ledger, 'rejected_timeout')
+                    raise AdmissionRejected('Server busy, timed out waiting for memory', 429,
+                                            retry_after=max(1, int(self.queue_timeout)))
+            time.sleep(self.poll_interval)
+
+        try:
+            yield
+        finally:
+            with self._ledger() as ledger:
+                ledger['reserved'].pop(entry_id, None)
+
+    @contextmanager
+    def admit_background(self, estimate_bytes, timeout=None):
+        """Reserve estimate_bytes for background work (jobs) for the duration of the block
+
+        Waits without joining the request queue and only takes free budget while no request
+        waits, so a batch never crowds interactive uploads out of the queue. Raises
+        AdmissionRejected 413 if the estimate can never fit, 429 after timeout seconds.
+        """
+        entry_id = self._entry_id()
+        self.check_estimate(estimate_bytes)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._ledger() as ledger:
+                in_use = sum(ledger['reserved'].values())
+                if in_use + estimate_bytes <= self.budget_bytes and not ledger['waiting']:
+                    ledger['reserved'][entry_id] = estimate_bytes
+                    self._count(ledger, 'admitted_background')
+                    break
+            if deadline is not None and time.monotonic() > deadline:
+                raise AdmissionRejected('Timed out waiting for memory', 429)
+            time.sleep(max(self.poll_interval, BACKGROUND_POLL_INTERVAL))
+
+        try:
+            yield
+        finally:
+            with self._ledger() as ledger:
+                ledger['reserved'].pop(entry_id, None)
+
+    def snapshot(self):
+        """Budget usage, queue depth and admission/rejection counters of all workers"""
+        with self._ledger() as ledger:
+            snapshot = dict(ledger['stats'])
+            snapshot['budget_bytes'] = self.budget_bytes
+            snapshot['reserved_bytes'] = sum(ledger['reserved'].values())
+            snapshot['active'] = len(ledger['reserved'])
+            snapshot['queue_depth'] = len(ledger['waiting'])
+        return snapshot
@@ -0,0 +1,59 @@
+"""
+Animated inputs (GIF, WebP, APNG): frame extraction and the frame pool.
+
+Frames are decoded in order through ImageSequence (GIF and APNG frames
+build on their predecessors), then every frame runs through the still-image
+pipeline on a thread pool. Pillow releases the GIL in its conversion,
+resize and point operations, so frames really run in parallel and nothing
+has to be pickled. processing.process_animation crops all frames with one
+union bounding box, so the logo does not jump between frames.
+"""
+
+from collections import namedtuple
+import concurrent.futures
+import contextvars
+import os
+
+from PIL import ImageSequence
+
+# Threads per animated request
+DEFAULT_FRAME_WORKERS = min(4, os.cpu_count() or 1)
+
+# Frame duration in ms when the input does not specify one
+DEFAULT_FRAME_DURATION = 100
+
+# Processed frames (RGBA images) with their durations in ms and the loop count (0 = forever)
+Animation = namedtuple('Animation', ('frames', 'durations', 'loop'))
+
+
+def is_animated(img):
+    """True for inputs with more than one frame"""
+    return bool(getattr(img, 'is_animated', False)) and frame_count(img) > 1
+
+
+def frame_count(img):
+    """Number of frames (1 for still images)"""
+    return getattr(img, 'n_frames', 1)
+
+
+def read_frames(img):
+    """All frames as RGBA images (composited as a viewer shows them) and their durations in ms"""
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(img):
+        frames.append(frame.convert('RGBA'))
+        # Read after decoding - WebP only sets the frame duration on load
+        durations.append(frame.info.get('duration') or DEFAULT_FRAME_DURATION)
+    return frames, durations
+
+
+def map_frames(function, items, workers=DEFAULT_FRAME_WORKERS):
+    """[function(item) for item in items] on a thread pool, in order
+
+    Each call runs in a copy of the caller's context, so logs and spans still go
+    to the trace of the current request.
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, function, item) for item in items]
+        return [future.result() for future in futures]
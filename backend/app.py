@@ -1,28 +1,291 @@
 from flask import Flask, request, send_file, jsonify, send_from_directory
 from flask_cors import CORS
-from PIL import Image, ImageOps
+from contextlib import contextmanager
+from PIL import Image, ImageColor, ImageOps
+import base64
+import gc
 import io
 import os
+import sys
+import tempfile
+import time
+
+# Allow sibling imports both as `python backend/app.py` and as `backend.app:app` (Gunicorn)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from admission import (AdmissionRejected, MemoryBudget, estimate_animation_bytes, estimate_atlas_bytes,
+                       estimate_peak_bytes, estimate_render_bytes, estimate_tiled_bytes)
+from animation import DEFAULT_FRAME_WORKERS, Animation, frame_count, is_animated
+from atlas import atlas_grid, cell_origin, pack_atlas, parse_columns, parse_padding
+from codec_registry import parse_codecs, registered_codecs, restrict_codecs
+from encoding import OUTPUT_FORMATS, encode_animation, parse_effort, parse_output_format
+from jobs import JobQueueFull, JobRunner, job_estimate
+from processing import (ARCHIVE_MIMETYPES, encode_icon_set, encode_png, DEFAULT_ALPHA_THRESHOLD, DEFAULT_THRESHOLD,
+                        parse_archive, parse_size, parse_sizes, parse_threshold, process_animation, process_icon_set,
+                        recolor, render_tiled)
+from processing import process_image  # noqa: F401 - re-exported for debug_alpha.py
+from geometry import DEFAULT_GEOMETRY, parse_geometry
+from pipeline import new_state, parse_strategy, run_pipeline, warm_up
+from resolution import DEFAULT_QUALITY, max_input_dimension, parse_quality
+from result_cache import PlaneCache, ResultCache, cache_key, content_hash, is_upload_id
+from tiled import TILED_MIN_PIXELS as DEFAULT_TILED_MIN_PIXELS, use_tiled
+from tracing import (current_trace, finish_trace, log as trace_log, record_upload, recent_traces, render_metrics,
+                     server_timing, start_trace, trace_header, upload_stats)
 
 app = Flask(__name__, static_folder='../frontend')
 CORS(app)  # Enable CORS for all routes
 
-# Global debug log collector
-debug_logs = []
+# Accepted input formats: only their Pillow plugins are loaded ('all' loads every plugin, see codec_registry.py)
+CODECS = parse_codecs(os.environ.get('IMAGESCALE_CODECS'))
+if CODECS is not None:
+    restrict_codecs(CODECS)
 
-def debug_print(message):
-    """Custom debug print that collects logs"""
-    print(message)  # Still print to console
-    debug_logs.append(message)
+# Result cache: in-memory LRU per worker, optional disk tier shared by all Gunicorn workers
+result_cache = ResultCache(
+    max_memory_bytes=int(os.environ.get('IMAGESCALE_CACHE_MEMORY_MB', 64)) * 1024 * 1024,
+    disk_dir=os.environ.get('IMAGESCALE_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('IMAGESCALE_CACHE_DISK_MB', 512)) * 1024 * 1024,
+)
+
+# Uploaded originals by content hash (= upload_id), so follow-up requests need not re-send the file.
+# With IMAGESCALE_UPLOAD_DIR all Gunicorn workers share them.
+upload_store = ResultCache(
+    max_memory_bytes=int(os.environ.get('IMAGESCALE_UPLOAD_MEMORY_MB', 64)) * 1024 * 1024,
+    disk_dir=os.environ.get('IMAGESCALE_UPLOAD_DIR') or None,
+    max_disk_bytes=int(os.environ.get('IMAGESCALE_UPLOAD_DISK_MB', 1024)) * 1024 * 1024,
+)
+
+# Decoded and upscaled grayscale/alpha planes per upload, size, quality, geometry and strategy (per worker):
+# threshold changes only re-run mapping, resize and bounding box
+plane_cache = PlaneCache(max_bytes=int(os.environ.get('IMAGESCALE_PLANE_CACHE_MB', 256)) * 1024 * 1024)
+
+# Pipeline strategy of requests without 'strategy' parameter (see pipeline.py)
+STRATEGY = parse_strategy(os.environ.get('IMAGESCALE_STRATEGY'))
+
+# Inputs from this many pixels on are processed in strips with bounded memory (see tiled.py)
+TILED_MIN_PIXELS = int(os.environ.get('IMAGESCALE_TILED_MIN_PIXELS', DEFAULT_TILED_MIN_PIXELS))
+
+# Animated inputs: frames processed in parallel per request, longer animations are rejected (413)
+FRAME_WORKERS = int(os.environ.get('IMAGESCALE_FRAME_WORKERS', DEFAULT_FRAME_WORKERS))
+MAX_FRAMES = int(os.environ.get('IMAGESCALE_MAX_FRAMES', 300))
+
+# Admission control: global memory budget shared by all Gunicorn workers (see admission.py)
+memory_budget = MemoryBudget(
+    budget_bytes=int(os.environ.get('IMAGESCALE_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024,
+    state_dir=os.environ.get('IMAGESCALE_ADMISSION_DIR') or None,
+    max_queue=int(os.environ.get('IMAGESCALE_QUEUE_MAX', 8)),
+    queue_timeout=float(os.environ.get('IMAGESCALE_QUEUE_TIMEOUT', 10)),
+    max_input_pixels=int(os.environ.get('IMAGESCALE_MAX_INPUT_PIXELS', 100_000_000)),
+)
 
-def clear_debug_logs():
-    """Clear the debug log"""
-    global debug_logs
-    debug_logs = []
+# Asynchronous jobs: local process pool per worker, status/results in SQLite shared by all workers
+job_runner = JobRunner(
+    db_path=os.environ.get('IMAGESCALE_JOBS_DB') or os.path.join(tempfile.gettempdir(), 'imagescale-jobs.sqlite3'),
+    ttl=int(os.environ.get('IMAGESCALE_JOB_TTL', 3600)),
+    timeout=int(os.environ.get('IMAGESCALE_JOB_TIMEOUT', 600)),
+    max_workers=int(os.environ.get('IMAGESCALE_JOB_WORKERS', 2)),
+    max_pending=int(os.environ.get('IMAGESCALE_JOB_MAX_PENDING', 32)),
+    codecs=CODECS,
+    memory_budget=memory_budget,
+)
+# Maximum number of files in one batch job
+MAX_JOB_FILES = int(os.environ.get('IMAGESCALE_JOB_MAX_FILES', 100))
+# Maximum number of images in one /atlas request
+MAX_ATLAS_FILES = int(os.environ.get('IMAGESCALE_ATLAS_MAX_FILES', 100))
+
+# Upper bound for the opt-in X-Debug-Trace response header
+TRACE_HEADER_BYTES = int(os.environ.get('IMAGESCALE_TRACE_HEADER_BYTES', 8192))
+
+# Lookup tables and encoders of the default settings are built at import: with `gunicorn --preload`
+# once in the master, and the forked workers share them copy-on-write
+if os.environ.get('IMAGESCALE_WARMUP', '1') != '0':
+    warm_up([(DEFAULT_THRESHOLD, invert, DEFAULT_ALPHA_THRESHOLD) for invert in (False, True)])
+    # Keep the garbage collector of the workers away from everything loaded so far,
+    # its bookkeeping writes would copy the shared pages into every worker
+    gc.freeze()
+
+def debug_print(message):
+    """Custom debug print that collects logs in the trace of the current request"""
+    trace_log(message)
 
 def get_debug_logs():
-    """Get current debug logs"""
-    return debug_logs.copy()
+    """Get debug logs of the current request"""
+    trace = current_trace()
+    return list(trace.logs) if trace is not None else []
+
+@app.before_request
+def begin_request_trace():
+    """Every request gets its own trace (logs + stage timings)"""
+    start_trace(request.endpoint or 'unknown')
+
+@app.after_request
+def end_request_trace(response):
+    """Fold the trace into /metrics and attach it as header if the client asked for it"""
+    trace = current_trace()
+    if trace is None:
+        return response
+    finish_trace(trace)
+    if trace.pipeline:
+        response.headers['Server-Timing'] = server_timing(trace)
+    if request.headers.get('X-Debug-Trace') or request.values.get('debug'):
+        response.headers['X-Debug-Trace'] = trace_header(trace, TRACE_HEADER_BYTES)
+    return response
+
+@app.teardown_request
+def drop_request_trace(exc):
+    """Detach traces of requests that failed before after_request ran"""
+    trace = current_trace()
+    if trace is not None:
+        finish_trace(trace)
+
+@contextmanager
+def admitted(img, size, quality=DEFAULT_QUALITY, renders=1):
+    """Admission control from the image header, before anything is decoded
+    Raises AdmissionRejected (413/429) if the request does not fit the memory budget
+    """
+    memory_budget.check_pixels(img.width, img.height)
+    estimate = estimate_peak_bytes(img.width, img.height, img.mode, size, quality, renders)
+    debug_print(f"Estimated peak memory: {estimate / (1024 * 1024):.1f} MB")
+    with memory_budget.admit(estimate):
+        yield
+
+def read_upload():
+    """(bytes, upload_id) of the request's image: a new 'image' file or an earlier 'upload_id'
+    The bytes are None for upload_id requests - load them with upload_bytes() only when needed.
+    Files shrunk by the client (see /upload-limits) carry the size of the original in 'original_bytes'.
+    Raises ValueError if neither is given
+    """
+    if 'image' in request.files:
+        data = request.files['image'].read()
+        original = request.form.get('original_bytes', '').strip()
+        if original and not original.isdigit():
+            raise ValueError('Invalid original_bytes')
+        original = int(original) if original else None
+        record_upload(len(data), original)
+        if original is not None:
+            debug_print(f"Pre-shrunk upload: {len(data)} bytes instead of {original} "
+                        f"({request.form.get('original_width', '?')}x{request.form.get('original_height', '?')} original)")
+        upload_id = content_hash(data)
+        upload_store.put(upload_id, data)
+        return data, upload_id
+    upload_id = request.form.get('upload_id', '').strip().lower()
+    if not upload_id:
+        raise ValueError('No image uploaded')
+    if not is_upload_id(upload_id):
+        raise ValueError('Invalid upload_id')
+    return None, upload_id
+
+def upload_bytes(data, upload_id):
+    """Bytes of an upload; raises LookupError if an upload_id is no longer stored"""
+    if data is None:
+        data = upload_store.get(upload_id)
+        if data is None:
+            raise LookupError('Unknown or expired upload_id, please send the image again')
+    return data
+
+def render_settings(planes, size, settings, geometry=DEFAULT_GEOMETRY, strategy=STRATEGY):
+    """Render (threshold, invert, alpha_threshold) settings from prepared planes
+    (pipeline stages map to fit). None thresholds are chosen automatically;
+    returns [(image, (threshold, alpha_threshold))]
+    """
+    results = []
+    for threshold, invert, alpha_threshold in settings:
+        state = new_state(size=size, threshold=threshold, invert=invert, alpha_threshold=alpha_threshold,
+                          geometry=geometry)
+        state['gray'], state['alpha'] = planes
+        run_pipeline(strategy, state, 'map', 'fit')
+        results.append((state['output'], (state['threshold'], state['alpha_threshold'])))
+    return results
+
+def render_upload(data, upload_id, size, quality, settings, animate=False, geometry=DEFAULT_GEOMETRY,
+                  strategy=STRATEGY):
+    """Render settings of an upload under admission control, see render_settings
+    Reuses the planes of an earlier request with the same upload, size, quality, geometry and
+    strategy (threshold tuning); otherwise runs the pipeline stages decode and normalize and
+    keeps the planes for the next request.
+    Very large inputs are processed in strips (render_tiled, smart strategy with staged geometry
+    only) and their planes are not kept.
+    animate: animated inputs give one animation.Animation for the (single) setting instead of
+    the first frame (smart strategy, always staged geometry)
+    """
+    key = cache_key(upload_id, size=size, quality=quality, geometry=geometry, strategy=strategy)
+    planes = plane_cache.get(key)
+    if planes is not None:
+        gray, _ = planes
+        debug_print(f"Reusing decoded planes {gray.size} of upload {upload_id[:12]}")
+        with memory_budget.admit(estimate_render_bytes(gray.width, gray.height, size, len(settings))):
+            return render_settings(planes, size, settings, geometry, strategy)
+    
+    img = Image.open(io.BytesIO(upload_bytes(data, upload_id)))
+    debug_print(f"Original image size: {img.size}, mode: {img.mode}")
+    if animate and strategy == 'smart' and is_animated(img):
+        [(threshold, invert, alpha_threshold)] = settings
+        frames = frame_count(img)
+        if frames > MAX_FRAMES:
+            raise AdmissionRejected(f'Too many frames: {frames} (max {MAX_FRAMES})', 413)
+        memory_budget.check_pixels(img.width, img.height)
+        estimate = estimate_animation_bytes(img.width, img.height, img.mode, size, quality, frames, FRAME_WORKERS)
+        debug_print(f"Estimated peak memory ({frames} frames): {estimate / (1024 * 1024):.1f} MB")
+        with memory_budget.admit(estimate):
+            return [process_animation(img, size, threshold, invert, alpha_threshold, quality, FRAME_WORKERS)]
+    if strategy == 'smart' and geometry == 'staged' and use_tiled(img, size, quality, TILED_MIN_PIXELS):
+        memory_budget.check_pixels(img.width, img.height)
+        estimate = estimate_tiled_bytes(img.width, img.height, img.mode, size, quality, len(settings))
+        debug_print(f"Estimated peak memory (strip processing): {estimate / (1024 * 1024):.1f} MB")
+        with memory_budget.admit(estimate):
+            return render_tiled(img, size, settings, quality)
+    with admitted(img, size, quality, len(settings)):
+        animated = is_animated(img)
+        state = run_pipeline(strategy, new_state(img, size, quality=quality, geometry=geometry), stop='normalize')
+        planes = state['gray'], state['alpha']
+        if not animated:  # Cached planes would stand in for the whole animation
+            plane_cache.put(key, planes)
+        return render_settings(planes, size, settings, geometry, strategy)
+
+def remember_thresholds(key, threshold, alpha_threshold):
+    """Keep the thresholds used for a cached result, so cache hits of 'auto' requests can report them"""
+    result_cache.put(cache_key(key, chosen='thresholds'), f'{threshold},{alpha_threshold}'.encode('ascii'))
+
+def remembered_thresholds(key):
+    """(threshold, alpha_threshold) stored by remember_thresholds, or None"""
+    value = result_cache.get(cache_key(key, chosen='thresholds'))
+    if value is None:
+        return None
+    threshold, alpha_threshold = value.decode('ascii').split(',')
+    return int(threshold), int(alpha_threshold)
+
+def expired_upload_response(error):
+    """404 for an upload_id that is no longer stored, the client should send the file again"""
+    debug_print(f"ERROR: {str(error)}")
+    return jsonify({'error': str(error), 'upload_expired': True, 'debug_logs': get_debug_logs()}), 404
+
+def unsupported_format_response(error):
+    """415 for uploads that are no image in one of the accepted formats"""
+    debug_print(f"ERROR: {str(error)}")
+    return jsonify({'error': f"Unsupported image format (accepted: {', '.join(registered_codecs())})",
+                    'debug_logs': get_debug_logs()}), 415
+
+def processing_error_response(error):
+    """Error response of the processing routes (/upload, /upload-variants, /atlas):
+    404 expired upload_id, 413/429 admission control, 415 unsupported format, 500 otherwise
+    """
+    if isinstance(error, LookupError):
+        return expired_upload_response(error)
+    if isinstance(error, (AdmissionRejected, Image.DecompressionBombError)):
+        return rejection_response(error)
+    if isinstance(error, Image.UnidentifiedImageError):
+        return unsupported_format_response(error)
+    debug_print(f"ERROR: {str(error)}")
+    return jsonify({'error': f'Image processing failed: {str(error)}', 'debug_logs': get_debug_logs()}), 500
+
+def rejection_response(error):
+    """JSON error for requests refused by admission control"""
+    status_code = getattr(error, 'status_code', 413)
+    debug_print(f"REJECTED ({status_code}): {str(error)}")
+    response = jsonify({'error': str(error), 'debug_logs': get_debug_logs()})
+    response.status_code = status_code
+    if getattr(error, 'retry_after', None):
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 @app.route('/')
 def index():
@@ -34,239 +297,536 @@ def static_files(filename):
     """Serve static files from frontend folder"""
     return send_from_directory('../frontend', filename)
 
-def process_image(img, size=300, threshold=50, invert=False, alpha_threshold=30):
-    """Process image: convert all colors to white, make transparent based on brightness
-    Uses high-resolution processing to avoid pixelation in larger outputs
-    alpha_threshold: Pixels with alpha below this value become fully transparent (0-255)
+@app.route('/upload-limits', methods=['GET'])
+def upload_limits():
+    """Largest useful input for a size and quality tier (clients shrink bigger images before uploading)
+    and the accepted input formats
     """
+    try:
+        size = parse_size(request.args.get('size'))
+        quality = parse_quality(request.args.get('quality'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify({'size': size, 'quality': quality, 'max_dimension': max_input_dimension(size, quality),
+                        'formats': registered_codecs()})
+    response.cache_control.max_age = 3600
+    return response
+
+@app.route('/upload', methods=['POST'])
+def upload_image():
+    """Process one upload ('image' file, or 'upload_id' of an earlier upload) into one PNG/WebP or icon set"""
+    try:
+        data, upload_id = read_upload()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Convert to RGBA if not already
-    img = img.convert('RGBA')
-    
-    # For better quality, process at higher resolution if the original is large enough
-    # or if output size is large
-    original_w, original_h = img.size
-    max_original_dim = max(original_w, original_h)
-    
-    # Determine processing resolution - use at least 2x the output size or original size, whichever is larger
-    processing_size = max(size * 2, max_original_dim, 1024)
-    
-    # Only upscale if original is significantly smaller than processing size
-    if max_original_dim < processing_size * 0.8:
-        # Upscale original image for better processing quality
-        scale_factor = processing_size / max_original_dim
-        new_w = int(original_w * scale_factor)
-        new_h = int(original_h * scale_factor)
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-    
-    # Convert to grayscale to measure brightness/darkness
-    gray = img.convert('L')
-    
-    # Create result image: all visible pixels become white, preserve original transparency
-    result_data = []
-    gray_data = gray.getdata()
-    rgba_data = img.getdata()
+    # Get optional parameters
+    version = request.form.get('version', 'normal')
+    invert = version == 'inverted'
+    try:
+        size = parse_size(request.form.get('size'))
+        # 'auto' (None) picks the value from the image histograms, see processing.auto_thresholds
+        threshold = parse_threshold(request.form.get('threshold'), DEFAULT_THRESHOLD)
+        alpha_threshold = parse_threshold(request.form.get('alpha_threshold'), DEFAULT_ALPHA_THRESHOLD)
+        quality = parse_quality(request.form.get('quality'))
+        geometry = parse_geometry(request.form.get('geometry'))
+        strategy = parse_strategy(request.form.get('strategy'), STRATEGY)
+        # Optional icon set: several sizes from one pipeline run, returned as ZIP or ICO
+        sizes = parse_sizes(request.form.get('sizes', ''))
+        archive = parse_archive(request.form.get('archive', 'zip'), sizes)
+        # Output encoding of single images: explicit format, else negotiated from the Accept header
+        if sizes and request.form.get('format'):
+            raise ValueError('format applies to single images, icon sets use archive')
+        if sizes and request.form.get('strategy') and strategy != 'smart':
+            raise ValueError('icon sets always use the smart strategy')
+        output_format = parse_output_format(request.form.get('format'), request.accept_mimetypes)
+        effort = parse_effort(request.form.get('effort'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    negotiated = not sizes and not request.form.get('format')
     
-    alpha_threshold = alpha_threshold  # Use the parameter value instead of hardcoded
+    # Content-addressed cache key: uploaded bytes + normalized parameters
+    key = cache_key(upload_id, size=size, threshold=threshold,
+                    alpha_threshold=alpha_threshold, invert=invert, fill='', quality=quality, geometry=geometry,
+                    strategy='smart' if sizes else strategy, sizes=','.join(map(str, sizes)),
+                    archive=archive if sizes else '',
+                    format='' if sizes else output_format, effort='' if sizes else effort)
+    if request.if_none_match.contains(key):
+        response = not_modified(key)
+        if negotiated:
+            response.vary.add('Accept')
+        return response
     
-    for i, pixel_brightness in enumerate(gray_data):
-        # Get original alpha channel
-        original_alpha = rgba_data[i][3] if len(rgba_data[i]) == 4 else 255
-        
-        # If original pixel was transparent or nearly transparent, keep it transparent
-        if original_alpha <= alpha_threshold:
-            result_data.append((255, 255, 255, 0))
-            continue
-            
-        # Apply inversion if requested
+    if sizes:
+        filename = 'band_logo_inverted_icons' if invert else 'band_logo_icons'
+        filename += f'.{archive}'
+        mimetype = ARCHIVE_MIMETYPES[archive]
+    else:
+        extension = OUTPUT_FORMATS[output_format]['extension']
         if invert:
-            pixel_brightness = 255 - pixel_brightness
+            filename = f'band_logo_inverted_{size}x{size}.{extension}'
+        else:
+            filename = f'band_logo_{size}x{size}.{extension}'
+        mimetype = OUTPUT_FORMATS[output_format]['mimetype']
+    
+    encode_seconds = render_seconds = frames = None
+    auto = threshold is None or alpha_threshold is None
+    chosen = None if auto else (threshold, alpha_threshold)
+    try:
+        payload = result_cache.get(key)
+        if payload is not None and auto and not sizes:
+            # Automatic thresholds are reported with the result; recompute if they were evicted
+            chosen = remembered_thresholds(key)
+            if chosen is None:
+                payload = None
+        if payload is not None:
+            debug_print(f"Cache hit for {filename}")
+        elif sizes:
+            img = Image.open(io.BytesIO(upload_bytes(data, upload_id)))
+            debug_print(f"Original image size: {img.size}, mode: {img.mode}")
+            debug_print(f"Parameters - size={size}, threshold={threshold}, alpha_threshold={alpha_threshold}, quality={quality}")
             
-        if pixel_brightness > threshold:
-            # Bright enough → white pixel with original opacity
-            final_alpha = original_alpha
+            with admitted(img, sizes[0], quality):
+                debug_print(f"Icon set sizes={sizes}, archive={archive}")
+                icons = process_icon_set(img, sizes, threshold, invert=invert, alpha_threshold=alpha_threshold,
+                                         quality=quality, geometry=geometry)
+                payload = encode_icon_set(icons, archive, invert)
+            result_cache.put(key, payload)
         else:
-            # Too dark → make transparent, but respect original transparency
-            # Gradual transparency based on brightness for smoother edges
-            calculated_alpha = max(0, min(255, int((pixel_brightness / threshold) * 255)))
-            # Use the minimum of calculated and original alpha to preserve transparency
-            final_alpha = min(calculated_alpha, original_alpha)
-        
-        # KRITISCH: Apply alpha threshold to ALL final results
-        # This prevents grayscale areas from interfering with bounding box
-        if final_alpha <= alpha_threshold:
-            final_alpha = 0
-        
-        # ZUSÄTZLICH: Auch bei der Helligkeitsbewertung Alpha-Schwelle anwenden
-        # Wenn das resultierende Alpha zu schwach wäre, mache Pixel komplett transparent
-        if pixel_brightness <= threshold:
-            # Für dunkle Pixel: Prüfe ob die berechnete Transparenz über der Schwelle liegt
-            test_alpha = int((pixel_brightness / threshold) * 255)
-            if test_alpha <= alpha_threshold:
-                final_alpha = 0  # Komplett transparent wenn zu schwach
+            debug_print(f"Parameters - size={size}, threshold={threshold}, alpha_threshold={alpha_threshold}, quality={quality}")
             
-        result_data.append((255, 255, 255, final_alpha))
-    
-    # Create new image with white + transparency
-    white_img = Image.new('RGBA', img.size)
-    white_img.putdata(result_data)
-    
-    # Scale to final size FIRST, then apply bounding box logic
-    # Calculate scaling to fit in target size while maintaining aspect ratio
-    img_w, img_h = white_img.size
-    scale = min(size / img_w, size / img_h)
-    new_w = int(img_w * scale)
-    new_h = int(img_h * scale)
-    
-    # Resize the processed image to target size
-    if scale != 1.0:
-        resized_img = white_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-    else:
-        resized_img = white_img
-    
-    # Create final canvas
-    result = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    
-    # Center the resized image on canvas
-    x_offset = (size - new_w) // 2
-    y_offset = (size - new_h) // 2
-    result.paste(resized_img, (x_offset, y_offset), resized_img)
-    
-    # NOW apply the new smart bounding box logic on the final result
-    # Use alpha_threshold as brightness threshold (0-100 -> 150-240 mapping)
-    # This ensures even high values still find bright content
-    brightness_threshold = 150 + (alpha_threshold * 0.9)  # Map 0-100 to 150-240
-    debug_print(f"Mapped alpha_threshold {alpha_threshold} to brightness_threshold {int(brightness_threshold)}")
-    return apply_smart_bounding_box(result, size, int(brightness_threshold))
-
-def apply_smart_bounding_box(img, target_size, brightness_threshold=200):
+            # Process with or without inversion (same as process_image, planes may be reused);
+            # animated inputs keep their animation
+            started = time.perf_counter()
+            [(processed_img, chosen)] = render_upload(data, upload_id, size, quality,
+                                                      [(threshold, invert, alpha_threshold)], animate=True,
+                                                      geometry=geometry, strategy=strategy)
+            render_seconds = time.perf_counter() - started
+            if auto:
+                remember_thresholds(key, *chosen)
+            started = time.perf_counter()
+            if isinstance(processed_img, Animation):
+                frames = len(processed_img.frames)
+                debug_print(f"Processed {frames} frames in {render_seconds * 1000:.1f} ms")
+                payload = encode_animation(processed_img, output_format, effort)
+            else:
+                state = new_state(size=size, output_format=output_format, effort=effort)
+                state['output'] = processed_img
+                payload = run_pipeline(strategy, state, 'encode', 'encode')['payload']
+            encode_seconds = time.perf_counter() - started
+            debug_print(f"Encoded {output_format} (effort {effort}): {len(payload)} bytes "
+                        f"in {encode_seconds * 1000:.1f} ms")
+            result_cache.put(key, payload)
+        
+        # Debug logs and stage timings are available through the opt-in X-Debug-Trace header
+        response = send_file(io.BytesIO(payload), mimetype=mimetype, as_attachment=True, download_name=filename)
+        response.set_etag(key)
+        response.headers['X-Upload-Id'] = upload_id
+        if chosen is not None:
+            response.headers['X-Threshold'], response.headers['X-Alpha-Threshold'] = map(str, chosen)
+        response.headers['X-Encoded-Bytes'] = str(len(payload))
+        if encode_seconds is not None:
+            response.headers['X-Encode-Time-Ms'] = f'{encode_seconds * 1000:.2f}'
+        if render_seconds is not None:
+            response.headers['X-Render-Time-Ms'] = f'{render_seconds * 1000:.2f}'
+        if frames is not None:
+            response.headers['X-Frame-Count'] = str(frames)
+        if negotiated:
+            response.vary.add('Accept')
+        return response
+    except Exception as e:
+        return processing_error_response(e)
+
+# Maximum number of variants per /upload-variants request
+MAX_VARIANTS = 8
+
+def parse_variants(spec):
+    """Parse a variants list like "normal,inverted,inverted:#ff6b35"
+    Returns a list of (name, invert, fill_color) tuples, fill_color is None for plain white
     """
-    Apply smart bounding box that only considers very bright pixels
-    with 5 pixel padding around the content
+    variants = []
+    for token in spec.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        name, _, color = token.partition(':')
+        if name not in ('normal', 'inverted'):
+            raise ValueError(f"Unknown variant '{name}' (use normal or inverted)")
+        fill_color = ImageColor.getrgb(color)[:3] if color else None
+        variants.append((token, name == 'inverted', fill_color))
+    if not variants:
+        raise ValueError('No variants requested')
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f'Too many variants (max {MAX_VARIANTS})')
+    return variants
+
+def variant_filename(invert, fill_color, size):
+    """Download name for a variant, matching the names used by /upload"""
+    parts = ['band_logo']
+    if invert:
+        parts.append('inverted')
+    if fill_color:
+        parts.append('%02x%02x%02x' % fill_color)
+    parts.append(f'{size}x{size}.png')
+    return '_'.join(parts)
+
+@app.route('/upload-variants', methods=['POST'])
+def upload_variants():
+    """Process one upload into several variants (normal, inverted, coloured fills)
+    Decoding, RGBA conversion and upscaling happen only once for all variants,
+    and are reused by later requests for the same upload_id (threshold tuning)
     """
-    debug_print(f"Applying smart bounding box with brightness_threshold={brightness_threshold}")
+    try:
+        data, upload_id = read_upload()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Convert to grayscale to find bright pixels
-    gray = img.convert('L')
-    width, height = img.size
+    # Get optional parameters
+    try:
+        size = parse_size(request.form.get('size'))
+        threshold = parse_threshold(request.form.get('threshold'), DEFAULT_THRESHOLD)
+        alpha_threshold = parse_threshold(request.form.get('alpha_threshold'), DEFAULT_ALPHA_THRESHOLD)
+        variants = parse_variants(request.form.get('variants', 'normal,inverted'))
+        quality = parse_quality(request.form.get('quality'))
+        geometry = parse_geometry(request.form.get('geometry'))
+        strategy = parse_strategy(request.form.get('strategy'), STRATEGY)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Find all very bright pixels (brightness > threshold)
-    min_x, min_y, max_x, max_y = width, height, 0, 0
-    found_bright = False
+    # One cache entry per variant, one ETag for the whole response
+    digest = upload_id
+    keys = {}
+    for token, invert, fill_color in variants:
+        fill = '%02x%02x%02x' % fill_color if fill_color else ''
+        keys[token] = cache_key(digest, size=size, threshold=threshold,
+                                alpha_threshold=alpha_threshold, invert=invert, fill=fill, quality=quality,
+                                geometry=geometry, strategy=strategy)
+    etag = cache_key(digest, variants=','.join(keys[token] for token, _, _ in variants))
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
     
-    for y in range(height):
-        for x in range(width):
-            # Check if pixel is bright enough and not transparent
-            gray_val = gray.getpixel((x, y))
-            alpha_val = img.getpixel((x, y))[3] if img.mode == 'RGBA' else 255
+    auto = threshold is None or alpha_threshold is None
+    try:
+        encoded = {token: result_cache.get(key) for token, key in keys.items()}
+        # Thresholds used per variant; automatic ones are stored next to the cached result
+        chosen = {}
+        for token, key in keys.items():
+            chosen[token] = remembered_thresholds(key) if auto else (threshold, alpha_threshold)
+            if chosen[token] is None:
+                encoded[token] = None
+        
+        missing = []
+        for token, invert, fill_color in variants:
+            if encoded[token] is not None:
+                debug_print(f"Cache hit for variant '{token}'")
+            else:
+                missing.append((token, invert, fill_color))
+        
+        if missing:
+            debug_print(f"Parameters - size={size}, threshold={threshold}, alpha_threshold={alpha_threshold}, quality={quality}")
             
-            if gray_val > brightness_threshold and alpha_val > 100:  # Bright and opaque
-                found_bright = True
-                min_x = min(min_x, x)
-                min_y = min(min_y, y)
-                max_x = max(max_x, x)
-                max_y = max(max_y, y)
-    
-    if not found_bright:
-        debug_print(f"No pixels found above brightness {brightness_threshold}, trying fallback with 200")
-        # Fallback: Try with lower threshold
-        fallback_threshold = 200
-        for y in range(height):
-            for x in range(width):
-                gray_val = gray.getpixel((x, y))
-                alpha_val = img.getpixel((x, y))[3] if img.mode == 'RGBA' else 255
+            # Shared work: decode, RGBA, upscale, grayscale - once for all variants (or cached from earlier);
+            # colourways share the alpha mask (and thresholds) of their base variant
+            inverts = sorted({invert for _, invert, _ in missing})
+            rendered = dict(zip(inverts, render_upload(data, upload_id, size, quality,
+                                                       [(threshold, invert, alpha_threshold) for invert in inverts],
+                                                       geometry=geometry, strategy=strategy)))
+            for token, invert, fill_color in missing:
+                debug_print(f"Rendering variant '{token}'")
+                processed_img, used = rendered[invert]
+                if fill_color:
+                    processed_img = recolor(processed_img, fill_color)
                 
-                if gray_val > fallback_threshold and alpha_val > 100:
-                    found_bright = True
-                    min_x = min(min_x, x)
-                    min_y = min(min_y, y)
-                    max_x = max(max_x, x)
-                    max_y = max(max_y, y)
+                encoded[token] = encode_png(processed_img)
+                chosen[token] = used
+                result_cache.put(keys[token], encoded[token])
+                if auto:
+                    remember_thresholds(keys[token], *used)
         
-        if not found_bright:
-            debug_print("Even fallback threshold failed, returning original")
-            return img
-        else:
-            debug_print(f"Fallback successful with threshold {fallback_threshold}")
+        results = {}
+        for token, invert, fill_color in variants:
+            results[token] = {
+                'filename': variant_filename(invert, fill_color, size),
+                'mimetype': 'image/png',
+                'threshold': chosen[token][0],
+                'alpha_threshold': chosen[token][1],
+                'data': base64.b64encode(encoded[token]).decode('ascii'),
+            }
+        
+        response = jsonify({'variants': results, 'upload_id': upload_id, 'debug_logs': get_debug_logs()})
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        return processing_error_response(e)
+
+@app.route('/atlas', methods=['POST'])
+def create_atlas():
+    """Process many uploads ('image' files and/or 'upload_id's, both repeatable) into one atlas PNG/WebP
+    Takes the parameters of /upload for all logos plus 'columns' and 'padding' (see atlas.py).
+    Identical inputs (same content hash) share one cell; the JSON answer carries the atlas
+    and the cell of every input in request order
+    """
+    files = request.files.getlist('image')
+    upload_ids = [value.strip().lower() for value in request.form.getlist('upload_id') if value.strip()]
+    if not files and not upload_ids:
+        return jsonify({'error': 'No image uploaded'}), 400
+    if len(files) + len(upload_ids) > MAX_ATLAS_FILES:
+        return jsonify({'error': f'Too many images (max {MAX_ATLAS_FILES})'}), 400
+    
+    try:
+        size = parse_size(request.form.get('size'))
+        invert = request.form.get('version', 'normal') == 'inverted'
+        threshold = parse_threshold(request.form.get('threshold'), DEFAULT_THRESHOLD)
+        alpha_threshold = parse_threshold(request.form.get('alpha_threshold'), DEFAULT_ALPHA_THRESHOLD)
+        quality = parse_quality(request.form.get('quality'))
+        geometry = parse_geometry(request.form.get('geometry'))
+        strategy = parse_strategy(request.form.get('strategy'), STRATEGY)
+        output_format = parse_output_format(request.form.get('format'), request.accept_mimetypes)
+        effort = parse_effort(request.form.get('effort'))
+        columns = parse_columns(request.form.get('columns'))
+        padding = parse_padding(request.form.get('padding'))
+        if not all(is_upload_id(upload_id) for upload_id in upload_ids):
+            raise ValueError('Invalid upload_id')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    negotiated = not request.form.get('format')
     
-    # Add 5 pixel padding around bright content
-    padding = 5
-    crop_x1 = max(0, min_x - padding)
-    crop_y1 = max(0, min_y - padding)
-    crop_x2 = min(width, max_x + 1 + padding)
-    crop_y2 = min(height, max_y + 1 + padding)
+    # Inputs in request order as (name, bytes or None, upload_id); one cell per distinct upload_id
+    inputs = []
+    for file in files:
+        data = file.read()
+        record_upload(len(data))
+        upload_id = content_hash(data)
+        upload_store.put(upload_id, data)
+        inputs.append((file.filename or f'image{len(inputs) + 1}', data, upload_id))
+    inputs += [(upload_id, None, upload_id) for upload_id in upload_ids]
+    uploads = {}
+    for _, data, upload_id in inputs:
+        if uploads.get(upload_id) is None:
+            uploads[upload_id] = data
+    cells = list(uploads)
+    try:
+        columns, rows, width, height = atlas_grid(len(cells), size, columns, padding)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    debug_print(f"Atlas of {len(inputs)} image(s), {len(cells)} distinct: {columns}x{rows} cells, {width}x{height}")
+    
+    # Cached per distinct inputs and parameters; the ETag also covers the names in the index
+    key = cache_key(','.join(cells), size=size, threshold=threshold, alpha_threshold=alpha_threshold,
+                    invert=invert, quality=quality, geometry=geometry, strategy=strategy, format=output_format,
+                    effort=effort, columns=columns, padding=padding, atlas=True)
+    etag = cache_key(key, index=','.join(f'{name}={upload_id}' for name, _, upload_id in inputs))
+    if request.if_none_match.contains(etag):
+        response = not_modified(etag)
+        if negotiated:
+            response.vary.add('Accept')
+        return response
     
-    crop_bbox = (crop_x1, crop_y1, crop_x2, crop_y2)
-    debug_print(f"Bright pixel bounds: ({min_x}, {min_y}, {max_x}, {max_y})")
-    debug_print(f"Crop with padding: {crop_bbox}")
+    try:
+        payload = result_cache.get(key)
+        # Thresholds used per cell, stored next to the atlas as "threshold,alpha_threshold;..."
+        chosen = result_cache.get(cache_key(key, chosen='thresholds'))
+        if payload is not None and chosen is not None:
+            debug_print("Cache hit for atlas")
+            chosen = [tuple(map(int, pair.split(','))) for pair in chosen.decode('ascii').split(';')]
+        else:
+            debug_print(f"Parameters - size={size}, threshold={threshold}, alpha_threshold={alpha_threshold}, quality={quality}")
     
-    # Crop to bright content with padding
-    cropped = img.crop(crop_bbox)
+            # Each distinct input runs the /upload pipeline (with its own admission and plane cache)
+            images, chosen = [], []
+            for upload_id in cells:
+                [(processed_img, used)] = render_upload(uploads[upload_id], upload_id, size, quality,
+                                                        [(threshold, invert, alpha_threshold)],
+                                                        geometry=geometry, strategy=strategy)
+                images.append(processed_img)
+                chosen.append(used)
     
-    # Make it square and center it
-    crop_w, crop_h = cropped.size
-    if crop_w != crop_h:
-        max_dim = max(crop_w, crop_h)
-        square_img = Image.new('RGBA', (max_dim, max_dim), (0, 0, 0, 0))
-        x_center = (max_dim - crop_w) // 2
-        y_center = (max_dim - crop_h) // 2
-        square_img.paste(cropped, (x_center, y_center), cropped)
-        cropped = square_img
+            # One atlas, encoded once
+            with memory_budget.admit(estimate_atlas_bytes(width, height)):
+                atlas, _ = pack_atlas(images, size, columns, padding)
+                state = new_state(size=size, output_format=output_format, effort=effort)
+                state['output'] = atlas
+                payload = run_pipeline(strategy, state, 'encode', 'encode')['payload']
+            debug_print(f"Encoded {output_format} atlas (effort {effort}): {len(payload)} bytes")
+            result_cache.put(key, payload)
+            result_cache.put(cache_key(key, chosen='thresholds'),
+                             ';'.join(f'{t},{a}' for t, a in chosen).encode('ascii'))
     
-    # Scale to final target size
-    final_result = cropped.resize((target_size, target_size), Image.Resampling.LANCZOS)
+        index = []
+        for name, _, upload_id in inputs:
+            cell = cells.index(upload_id)
+            x, y = cell_origin(cell, size, columns, padding)
+            index.append({
+                'name': name,
+                'upload_id': upload_id,
+                'cell': cell,
+                'x': x,
+                'y': y,
+                'width': size,
+                'height': size,
+                'threshold': chosen[cell][0],
+                'alpha_threshold': chosen[cell][1],
+            })
     
-    debug_print(f"Final result size: {final_result.size}")
-    return final_result
+        extension = OUTPUT_FORMATS[output_format]['extension']
+        response = jsonify({
+            'atlas': {
+                'filename': f"band_logos{'_inverted' if invert else ''}_atlas_{size}x{size}.{extension}",
+                'mimetype': OUTPUT_FORMATS[output_format]['mimetype'],
+                'width': width,
+                'height': height,
+                'columns': columns,
+                'rows': rows,
+                'padding': padding,
+                'data': base64.b64encode(payload).decode('ascii'),
+            },
+            'images': index,
+            'cells': len(cells),
+            'duplicates': len(inputs) - len(cells),
+            'debug_logs': get_debug_logs(),
+        })
+        response.set_etag(etag)
+        response.headers['X-Encoded-Bytes'] = str(len(payload))
+        if negotiated:
+            response.vary.add('Accept')
+        return response
+    except Exception as e:
+        return processing_error_response(e)
 
-@app.route('/upload', methods=['POST'])
-def upload_image():
-    if 'image' not in request.files:
+def not_modified(etag):
+    """Empty 304 response for clients that already hold the result for this ETag"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue one or more uploaded images (field `image`, repeatable) for background processing
+    Takes the same parameters as /upload and answers 202 with the job id and its status URL
+    """
+    files = request.files.getlist('image')
+    if not files:
         return jsonify({'error': 'No image uploaded'}), 400
+    if len(files) > MAX_JOB_FILES:
+        return jsonify({'error': f'Too many files (max {MAX_JOB_FILES})'}), 400
     
-    file = request.files['image']
-    
-    # Get optional parameters
-    size = int(request.form.get('size', 300))
-    threshold = int(request.form.get('threshold', 50))
-    alpha_threshold = int(request.form.get('alpha_threshold', 30))
-    version = request.form.get('version', 'normal')
+    try:
+        sizes = parse_sizes(request.form.get('sizes', ''))
+        params = {
+            'size': parse_size(request.form.get('size')),
+            'threshold': parse_threshold(request.form.get('threshold'), DEFAULT_THRESHOLD),
+            'alpha_threshold': parse_threshold(request.form.get('alpha_threshold'), DEFAULT_ALPHA_THRESHOLD),
+            'version': 'inverted' if request.form.get('version') == 'inverted' else 'normal',
+            'quality': parse_quality(request.form.get('quality')),
+            'geometry': parse_geometry(request.form.get('geometry')),
+            'strategy': parse_strategy(request.form.get('strategy'), STRATEGY),
+            'sizes': sizes,
+            'archive': parse_archive(request.form.get('archive', 'zip'), sizes),
+        }
+        if sizes and request.form.get('strategy') and params['strategy'] != 'smart':
+            raise ValueError('icon sets always use the smart strategy')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    inputs = []
     try:
-        clear_debug_logs()  # Clear previous logs
-        img = Image.open(file.stream)
-        debug_print(f"Original image size: {img.size}, mode: {img.mode}")
-        debug_print(f"Parameters - size={size}, threshold={threshold}, alpha_threshold={alpha_threshold}")
-        
-        # Process with or without inversion
-        if version == 'inverted':
-            processed_img = process_image(img, size, threshold, invert=True, alpha_threshold=alpha_threshold)
-            filename = f'band_logo_inverted_{size}x{size}.png'
-        else:
-            processed_img = process_image(img, size, threshold, invert=False, alpha_threshold=alpha_threshold)
-            filename = f'band_logo_{size}x{size}.png'
-            
-        output = io.BytesIO()
-        processed_img.save(output, format='PNG')
-        output.seek(0)
-        
-        # Create response with debug logs
-        response = send_file(output, mimetype='image/png', as_attachment=True, download_name=filename)
-        
-        # Add debug logs as custom header (JSON encoded)
-        import json
-        debug_data = json.dumps(get_debug_logs())
-        response.headers['X-Debug-Logs'] = debug_data
-        
+        for file in files:
+            data = file.read()
+            try:
+                img = Image.open(io.BytesIO(data))
+            except (Image.UnidentifiedImageError, OSError) as e:
+                return jsonify({'error': f'Could not queue job: {str(e)}'}), 400
+            # Reject oversized inputs from the header before they reach the pool
+            memory_budget.check_pixels(img.width, img.height)
+            memory_budget.check_estimate(job_estimate(img, params))
+            inputs.append((file.filename, data))
+        job_id = job_runner.submit(inputs, params)
+    except (AdmissionRejected, Image.DecompressionBombError) as e:
+        return rejection_response(e)
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
         return response
-    except Exception as e:
-        debug_print(f"ERROR: {str(e)}")
-        return jsonify({'error': f'Image processing failed: {str(e)}', 'debug_logs': get_debug_logs()}), 500
+    
+    debug_print(f"Queued job {job_id} with {len(inputs)} file(s)")
+    response = jsonify({'id': job_id, 'status': 'queued', 'status_url': f'/jobs/{job_id}'})
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status; finished jobs link to their result until the TTL expires"""
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if job['status'] == 'done':
+        job['result_url'] = f'/jobs/{job_id}/result'
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download the result of a finished job"""
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    row = job_runner.store.result(job_id)
+    if row is None:
+        return jsonify({'error': f"Job is {job['status']}", 'status': job['status']}), 409
+    payload, mimetype, filename = row
+    return send_file(io.BytesIO(payload), mimetype=mimetype, as_attachment=True, download_name=filename)
+
+@app.route('/job-stats', methods=['GET'])
+def job_stats_endpoint():
+    """Get job counts per status as JSON"""
+    return jsonify(job_runner.snapshot())
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats_endpoint():
+    """Get result, plane and upload cache counters (with bytes saved by pre-shrinking) of this worker as JSON"""
+    snapshot = result_cache.snapshot()
+    snapshot['planes'] = plane_cache.snapshot()
+    snapshot['uploads'] = upload_store.snapshot()
+    snapshot['uploads'].update(upload_stats())
+    return jsonify(snapshot)
 
 @app.route('/debug-logs', methods=['GET'])
 def get_debug_logs_endpoint():
-    """Get current debug logs as JSON"""
-    return jsonify({'logs': get_debug_logs()})
+    """Get logs and stage timings of the most recent requests of this worker as JSON"""
+    return jsonify({'traces': recent_traces()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this worker: stage latency histograms and cache counters"""
+    cache = result_cache.snapshot()
+    lines = ['# HELP imagescale_cache_events_total Result cache events',
+             '# TYPE imagescale_cache_events_total counter']
+    for event in ('memory_hits', 'disk_hits', 'misses', 'stores', 'memory_evictions', 'disk_evictions'):
+        lines.append(f'imagescale_cache_events_total{{event="{event}"}} {cache[event]}')
+    planes = plane_cache.snapshot()
+    lines += ['# HELP imagescale_plane_cache_events_total Decoded plane cache events (threshold tuning)',
+              '# TYPE imagescale_plane_cache_events_total counter']
+    for event in ('hits', 'misses', 'stores', 'evictions'):
+        lines.append(f'imagescale_plane_cache_events_total{{event="{event}"}} {planes[event]}')
+    admission = memory_budget.snapshot()
+    lines += ['# HELP imagescale_admission_events_total Admission control decisions (all workers)',
+              '# TYPE imagescale_admission_events_total counter']
+    for event in ('admitted', 'queued', 'admitted_after_wait', 'rejected_too_large',
+                  'rejected_queue_full', 'rejected_timeout'):
+        lines.append(f'imagescale_admission_events_total{{event="{event}"}} {admission.get(event, 0)}')
+    lines += ['# HELP imagescale_admission_queue_depth Requests waiting for memory budget (all workers)',
+              '# TYPE imagescale_admission_queue_depth gauge',
+              f'imagescale_admission_queue_depth {admission["queue_depth"]}',
+              '# HELP imagescale_admission_reserved_bytes Memory budget currently reserved (all workers)',
+              '# TYPE imagescale_admission_reserved_bytes gauge',
+              f'imagescale_admission_reserved_bytes {admission["reserved_bytes"]}']
+    return app.response_class(render_metrics(lines), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats_endpoint():
+    """Get memory budget usage, queue depth and rejection counters as JSON"""
+    return jsonify(memory_budget.snapshot())
 
 if __name__ == '__main__':
     # Development server
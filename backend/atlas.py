@@ -0,0 +1,83 @@
+"""
+Sprite sheets (atlases) of processed logos.
+
+Stage overlays load dozens of logos per show. An atlas packs their uniform
+size x size outputs into one image on a grid, so a client makes one fetch
+and one texture upload instead of one per logo, and the server encodes
+once. Identical inputs (same content hash) share one cell; the index maps
+every input to its cell.
+
+Cells are laid out row by row, left to right. 'padding' leaves transparent
+pixels between the cells, so texture filtering at a cell's edge does not
+pick up its neighbours.
+"""
+
+import math
+
+from PIL import Image
+
+from tracing import span
+
+# Largest atlas edge; bigger textures are refused by many GPUs
+MAX_ATLAS_DIMENSION = 8192
+
+# Upper bound for the transparent gap between cells
+MAX_PADDING = 64
+
+
+def parse_columns(value):
+    """Grid columns from a request, empty means automatic (near-square grid)"""
+    if value is None or str(value).strip() == '':
+        return None
+    columns = int(value)
+    if columns < 1:
+        raise ValueError('columns must be at least 1')
+    return columns
+
+
+def parse_padding(value):
+    """Transparent pixels between cells from a request, empty means none"""
+    if value is None or str(value).strip() == '':
+        return 0
+    padding = int(value)
+    if not 0 <= padding <= MAX_PADDING:
+        raise ValueError(f'padding must be between 0 and {MAX_PADDING}')
+    return padding
+
+
+def atlas_grid(cells, size, columns=None, padding=0):
+    """(columns, rows, width, height) of an atlas with the given number of cells
+
+    Without columns the grid is as square as possible. Raises ValueError if the
+    atlas would exceed MAX_ATLAS_DIMENSION.
+    """
+    columns = min(columns or math.ceil(math.sqrt(cells)), cells)
+    rows = math.ceil(cells / columns)
+    width = columns * size + (columns - 1) * padding
+    height = rows * size + (rows - 1) * padding
+    if max(width, height) > MAX_ATLAS_DIMENSION:
+        raise ValueError(f'Atlas of {width}x{height} exceeds {MAX_ATLAS_DIMENSION} pixels per side '
+                         f'(fewer images, a smaller size or other columns)')
+    return columns, rows, width, height
+
+
+def cell_origin(cell, size, columns, padding=0):
+    """Top left corner (x, y) of a cell"""
+    row, column = divmod(cell, columns)
+    return column * (size + padding), row * (size + padding)
+
+
+def pack_atlas(images, size, columns=None, padding=0):
+    """Paste size x size RGBA images into a transparent atlas, one cell each in order
+
+    Returns (atlas, [(x, y)] per image).
+    """
+    columns, _, width, height = atlas_grid(len(images), size, columns, padding)
+    with span('atlas', width * height):
+        atlas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        origins = []
+        for cell, img in enumerate(images):
+            origin = cell_origin(cell, size, columns, padding)
+            atlas.paste(img, origin)
+            origins.append(origin)
+    return atlas, origins
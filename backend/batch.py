@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Batch processing of whole logo directories without Flask.
+
+Runs the same pipeline as /upload (pipeline.render_image with the chosen
+strategy, icon sets always with the smart one) over every image in a
+directory on a multiprocessing pool with one process per core. Results are
+written to the output directory as each file finishes. Files whose outputs are newer than the input and were
+made with the same parameters are skipped.
+
+    python backend/batch.py logos/ out/ --size 512 --version both
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from PIL import Image
+
+# Allow sibling imports when run as `python backend/batch.py`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geometry import DEFAULT_GEOMETRY, GEOMETRIES
+from pipeline import DEFAULT_STRATEGY, STRATEGIES, render_image
+from processing import (DEFAULT_ALPHA_THRESHOLD, DEFAULT_THRESHOLD, encode_icon_set, encode_png, parse_archive,
+                        parse_sizes, parse_threshold, process_icon_set)
+from resolution import QUALITY_TIERS, parse_quality
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+
+# Remembers which parameters produced each output, so parameter changes are not skipped
+MANIFEST_NAME = '.imagescale-batch.json'
+
+
+def find_images(input_dir, recursive=False):
+    """Relative paths of all images below input_dir, sorted"""
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        if not recursive:
+            dirs[:] = []
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(found)
+
+
+def output_names(rel_path, params):
+    """Output file names (relative to the output dir) for one input"""
+    stem = os.path.splitext(rel_path)[0]
+    names = []
+    for version in params['versions']:
+        suffix = '_inverted' if version == 'inverted' else ''
+        if params['sizes']:
+            names.append(f'{stem}{suffix}_icons.{params["archive"]}')
+        else:
+            names.append(f'{stem}{suffix}_{params["size"]}x{params["size"]}.png')
+    return names
+
+
+def params_digest(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def is_up_to_date(input_path, output_dir, names, digest, manifest):
+    """All outputs exist, are newer than the input and were made with the same parameters"""
+    input_mtime = os.path.getmtime(input_path)
+    for name in names:
+        output_path = os.path.join(output_dir, name)
+        if manifest.get(name) != digest or not os.path.exists(output_path):
+            return False
+        if os.path.getmtime(output_path) < input_mtime:
+            return False
+    return True
+
+
+def write_atomic(path, data):
+    """Write via a temp file so interrupted runs never leave half-written outputs"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def process_file(task):
+    """Pool worker: process one input into all requested versions"""
+    input_path, output_dir, names, params = task
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # Pipeline debug output
+            for version, name in zip(params['versions'], names):
+                img = Image.open(input_path)
+                invert = version == 'inverted'
+                if params['sizes']:
+                    icons = process_icon_set(img, params['sizes'], params['threshold'], invert,
+                                             params['alpha_threshold'], params['quality'], params['geometry'])
+                    data = encode_icon_set(icons, params['archive'], invert)
+                else:
+                    processed_img = render_image(img, params['size'], params['threshold'], invert,
+                                                 params['alpha_threshold'], params['quality'], params['geometry'],
+                                                 params['strategy'])
+                    data = encode_png(processed_img)
+                write_atomic(os.path.join(output_dir, name), data)
+    except Exception as e:
+        return input_path, time.perf_counter() - start, str(e)
+    return input_path, time.perf_counter() - start, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Process a directory of band logos like /upload does')
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--size', type=int, default=300)
+    parser.add_argument('--threshold', type=lambda value: parse_threshold(value, DEFAULT_THRESHOLD),
+                        default=DEFAULT_THRESHOLD, help="brightness threshold or 'auto'")
+    parser.add_argument('--alpha-threshold', type=lambda value: parse_threshold(value, DEFAULT_ALPHA_THRESHOLD),
+                        default=DEFAULT_ALPHA_THRESHOLD, help="alpha threshold or 'auto'")
+    parser.add_argument('--version', choices=['normal', 'inverted', 'both'], default='normal')
+    parser.add_argument('--quality', choices=list(QUALITY_TIERS), default=None)
+    parser.add_argument('--geometry', choices=list(GEOMETRIES), default=DEFAULT_GEOMETRY,
+                        help="'single': bounding box at full resolution and one resample")
+    parser.add_argument('--strategy', choices=list(STRATEGIES), default=DEFAULT_STRATEGY,
+                        help="'tight': crop to every visible pixel, no padding (icon sets always use smart)")
+    parser.add_argument('--sizes', default='', help='icon set sizes, e.g. 32,64,128 (writes ZIP or ICO)')
+    parser.add_argument('--archive', choices=['zip', 'ico'], default='zip')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='pool size (default: cores)')
+    parser.add_argument('--recursive', action='store_true', help='include subdirectories')
+    parser.add_argument('--force', action='store_true', help='reprocess files that are up to date')
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = parse_sizes(args.sizes)
+        params = {
+            'size': args.size,
+            'threshold': args.threshold,
+            'alpha_threshold': args.alpha_threshold,
+            'versions': ['normal', 'inverted'] if args.version == 'both' else [args.version],
+            'quality': parse_quality(args.quality),
+            'geometry': args.geometry,
+            'strategy': args.strategy,
+            'sizes': sizes,
+            'archive': parse_archive(args.archive, sizes),
+        }
+        if sizes and args.strategy != 'smart':
+            raise ValueError('icon sets always use the smart strategy')
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    digest = params_digest(params)
+    tasks, skipped = [], 0
+    for rel_path in find_images(args.input_dir, args.recursive):
+        input_path = os.path.join(args.input_dir, rel_path)
+        names = output_names(rel_path, params)
+        if not args.force and is_up_to_date(input_path, args.output_dir, names, digest, manifest):
+            skipped += 1
+            continue
+        tasks.append((input_path, args.output_dir, names, params))
+
+    print(f"{len(tasks)} file(s) to process, {skipped} up to date, {args.workers} worker(s)")
+    failed = 0
+    start = time.perf_counter()
+    if tasks:
+        with multiprocessing.Pool(processes=min(args.workers, len(tasks))) as pool:
+            # Results are written by the workers and reported as soon as each file is done
+            for input_path, seconds, error in pool.imap_unordered(process_file, tasks):
+                if error:
+                    failed += 1
+                    print(f"  FAILED {input_path}: {error}")
+                    continue
+                print(f"  {seconds * 1000:8.1f} ms  {input_path}")
+                for name in output_names(os.path.relpath(input_path, args.input_dir), params):
+                    manifest[name] = digest
+                write_atomic(manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    elapsed = time.perf_counter() - start
+
+    done = len(tasks) - failed
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {done} file(s) in {elapsed:.2f} s ({rate:.2f} images/s), "
+          f"{skipped} skipped, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
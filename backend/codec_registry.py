@@ -0,0 +1,75 @@
+"""
+Restricted Pillow codec registry.
+
+Image.open() first tries five preloaded plugins and, for anything else,
+imports all of Pillow's ~40 format plugins. restrict_codecs() imports only
+the plugins of the accepted input formats and of the output formats (PNG,
+WebP and ICO for icon sets), drops every other decoder and encoder from
+Pillow's registry and marks Pillow as initialized, so no further plugins are
+ever imported. Other formats are refused by Image.open() with
+UnidentifiedImageError; the output encoders stay registered whatever the
+input formats are.
+
+Call it once at startup - in the Gunicorn master with --preload, so all
+workers share the imported plugins copy-on-write.
+"""
+
+import importlib
+
+from PIL import Image
+
+# Input formats accepted by default (IMAGESCALE_CODECS)
+DEFAULT_CODECS = ('PNG', 'JPEG', 'WEBP', 'GIF')
+
+# Formats the app writes (encoding.py, icon sets), registered for saving whatever the input formats are
+OUTPUT_CODECS = ('PNG', 'WEBP', 'ICO')
+
+# Pillow plugin module per format
+PLUGINS = {
+    'BMP': 'BmpImagePlugin',
+    'GIF': 'GifImagePlugin',
+    'ICO': 'IcoImagePlugin',
+    'JPEG': 'JpegImagePlugin',
+    'PNG': 'PngImagePlugin',
+    'TIFF': 'TiffImagePlugin',
+    'WEBP': 'WebPImagePlugin',
+}
+
+
+def parse_codecs(value):
+    """Accepted input formats from a comma separated list, empty means the defaults, 'all' means no restriction
+
+    Returns a tuple of format names, or None for 'all'. Raises ValueError for unknown formats.
+    """
+    value = (value or '').strip().upper()
+    if value == 'ALL':
+        return None
+    codecs = tuple(name.strip() for name in value.split(',') if name.strip()) or DEFAULT_CODECS
+    unknown = [name for name in codecs if name not in PLUGINS]
+    if unknown:
+        raise ValueError(f"Unknown codecs {', '.join(unknown)} (use {', '.join(PLUGINS)} or all)")
+    return codecs
+
+
+def restrict_codecs(codecs=DEFAULT_CODECS):
+    """Register only the decoders of the given input formats and the encoders of the output formats"""
+    for name in codecs + OUTPUT_CODECS:
+        importlib.import_module(f'PIL.{PLUGINS[name]}')
+    readable = set(codecs)
+    writable = set(OUTPUT_CODECS)
+    Image.ID[:] = [name for name in Image.ID if name in readable]
+    for registry, keep in ((Image.OPEN, readable), (Image.MIME, readable | writable), (Image.SAVE, writable),
+                           (Image.SAVE_ALL, writable)):
+        for name in list(registry):
+            if name not in keep:
+                del registry[name]
+    for extension, name in list(Image.EXTENSION.items()):
+        if name not in writable:
+            del Image.EXTENSION[extension]
+    # preinit()/init() would import further plugins on the next open or save
+    Image._initialized = 2
+
+
+def registered_codecs():
+    """Formats Image.open() currently accepts"""
+    return sorted(Image.OPEN)
@@ -0,0 +1,117 @@
+"""
+Output encoders with format and effort options.
+
+All encoders are lossless, so every format decodes to the same pixels:
+- png:  RGBA PNG; effort 'fast' uses low zlib compression for latency,
+        'small' writes the smallest exact variant (palette or LA) with optimize
+- webp: lossless WebP; effort maps to the encoder method/quality
+Animations (see animation.py) are written as animated WebP or as APNG.
+Without an explicit format the request's Accept header decides (WebP if the
+client lists it with at least the quality of PNG, PNG otherwise). PNG with
+effort 'default' is the historical output, byte for byte.
+"""
+
+import io
+
+from PIL import Image, features
+
+from tracing import animation_frames, encoded_bytes, span
+
+OUTPUT_FORMATS = {
+    'png': {'mimetype': 'image/png', 'extension': 'png'},
+    'webp': {'mimetype': 'image/webp', 'extension': 'webp'},
+}
+
+EFFORTS = ('fast', 'default', 'small')
+
+DEFAULT_FORMAT = 'png'
+DEFAULT_EFFORT = 'default'
+
+# Encoder options per effort
+PNG_OPTIONS = {'fast': {'compress_level': 1}, 'default': {}, 'small': {'optimize': True}}
+WEBP_OPTIONS = {
+    'fast': {'method': 0, 'quality': 0},
+    'default': {'method': 4, 'quality': 80},
+    'small': {'method': 6, 'quality': 100},
+}
+
+
+def available_formats():
+    """Output formats the installed Pillow can write and has an encoder registered for (see codec_registry)"""
+    Image.init()  # No-op once codec_registry has restricted the plugins
+    return [name for name in OUTPUT_FORMATS
+            if name.upper() in Image.SAVE and (name != 'webp' or features.check('webp'))]
+
+
+def parse_output_format(value, accept=None):
+    """Validate an explicit format; without one, negotiate from the request's Accept header
+    (request.accept_mimetypes): WebP if the client lists it explicitly with a quality at least
+    that of PNG, so 'image/webp;q=0' or wildcards alone keep PNG
+    """
+    if value:
+        output_format = value.strip().lower()
+        if output_format not in available_formats():
+            raise ValueError(f"Unknown format '{value}' (use {', '.join(available_formats())})")
+        return output_format
+    if accept and 'webp' in available_formats():
+        webp = max((quality for mimetype, quality in accept if mimetype.lower() == 'image/webp'), default=0)
+        if webp > 0 and webp >= accept.quality('image/png'):
+            return 'webp'
+    return DEFAULT_FORMAT
+
+
+def parse_effort(value):
+    """Validate an effort level from a request, empty means the default"""
+    effort = (value or DEFAULT_EFFORT).strip().lower()
+    if effort not in EFFORTS:
+        raise ValueError(f"Unknown effort '{value}' (use {', '.join(EFFORTS)})")
+    return effort
+
+
+def smallest_png_variant(img):
+    """Exact lower-channel version of an RGBA image: palette if it has at most 256 colours,
+    LA if all pixels are gray, otherwise the image itself
+    """
+    if img.mode != 'RGBA':
+        return img
+    if img.getcolors(256) is not None:
+        paletted = img.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        # Quantizing is only used when it reproduces every pixel
+        if paletted.convert('RGBA').tobytes() == img.tobytes():
+            return paletted
+    red, green, blue, alpha = img.split()
+    if red.tobytes() == green.tobytes() == blue.tobytes():
+        return Image.merge('LA', (red, alpha))
+    return img
+
+
+def encode_image(img, output_format=DEFAULT_FORMAT, effort=DEFAULT_EFFORT):
+    """Encode a processed image, returns the encoded bytes"""
+    with span('encode', img.width * img.height):
+        output = io.BytesIO()
+        if output_format == 'webp':
+            img.save(output, format='WEBP', lossless=True, exact=True, **WEBP_OPTIONS[effort])
+        else:
+            if effort == 'small':
+                img = smallest_png_variant(img)
+            img.save(output, format='PNG', **PNG_OPTIONS[effort])
+        payload = output.getvalue()
+    encoded_bytes.inc(len(payload), output_format, effort)
+    return payload
+
+
+def encode_animation(animation, output_format=DEFAULT_FORMAT, effort=DEFAULT_EFFORT):
+    """Encode processed frames (animation.Animation) as animated WebP or, for 'png', as APNG"""
+    frames = animation.frames
+    with span('encode', sum(frame.width * frame.height for frame in frames)):
+        output = io.BytesIO()
+        options = {'save_all': True, 'append_images': frames[1:], 'duration': list(animation.durations),
+                   'loop': animation.loop}
+        if output_format == 'webp':
+            frames[0].save(output, format='WEBP', lossless=True, exact=True, **WEBP_OPTIONS[effort], **options)
+        else:
+            frames[0].save(output, format='PNG', **PNG_OPTIONS[effort], **options)
+        payload = output.getvalue()
+    encoded_bytes.inc(len(payload), output_format, effort)
+    animation_frames.observe(len(frames), output_format)
+    return payload
@@ -0,0 +1,88 @@
+"""
+Single-resample geometry planner.
+
+The staged pipeline (the historical default) resamples up to three times:
+the upscale in prepare_planes, the fit into the size x size canvas and the
+final resize of the squared bounding box crop - and it measures the bounding
+box on the already downscaled canvas. With geometry 'single' the bright
+bounds are measured on the mapped alpha at working resolution instead, and
+crop, padding, square framing and scale are derived analytically from the
+same rules (5 px padding on the fit canvas, crop clamped to the canvas,
+square centered on the crop). The mapped plane is then resampled exactly
+once, straight from the working resolution to the target size.
+
+- staged: historical output, bit-identical (default)
+- single: one LANCZOS resample, sharper edges, no upscale of small inputs
+"""
+
+from PIL import Image
+
+GEOMETRIES = ('staged', 'single')
+
+DEFAULT_GEOMETRY = 'staged'
+
+# Padding around the bright content, in pixels of the size x size fit canvas
+PADDING = 5
+
+
+def parse_geometry(value):
+    """Validate a geometry name from a request, empty means the default"""
+    geometry = (value or DEFAULT_GEOMETRY).strip().lower()
+    if geometry not in GEOMETRIES:
+        raise ValueError(f"Unknown geometry '{value}' (use {', '.join(GEOMETRIES)})")
+    return geometry
+
+
+def plan_resample(width, height, size, bounds, padding=PADDING):
+    """Plan the single resample of a width x height plane into a size x size output
+
+    bounds: inclusive (min_x, min_y, max_x, max_y) of the bright content in plane pixels,
+    or None to frame the whole plane (like the staged pipeline without bounding box).
+    Returns (source box, output width, output height, paste offset) - the region of the
+    plane to resample and where it lands in the output - or None if nothing is visible.
+    """
+    # Fit canvas of the staged pipeline: the plane scaled into size x size and centered
+    fit = min(size / width, size / height)
+    fit_w, fit_h = int(width * fit), int(height * fit)
+    scale_x, scale_y = fit_w / width, fit_h / height
+    canvas_x, canvas_y = (size - fit_w) // 2, (size - fit_h) // 2
+
+    # Crop box with padding on the fit canvas, clamped to it
+    if bounds is None:
+        crop = (0.0, 0.0, float(size), float(size))
+    else:
+        min_x, min_y, max_x, max_y = bounds
+        crop = (max(0.0, canvas_x + min_x * scale_x - padding), max(0.0, canvas_y + min_y * scale_y - padding),
+                min(float(size), canvas_x + (max_x + 1) * scale_x + padding),
+                min(float(size), canvas_y + (max_y + 1) * scale_y + padding))
+
+    # Square around the crop box, scaled to the output
+    side = max(crop[2] - crop[0], crop[3] - crop[1])
+    square_x = crop[0] - (side - (crop[2] - crop[0])) / 2
+    square_y = crop[1] - (side - (crop[3] - crop[1])) / 2
+    scale = size / side
+
+    # Visible part: crop box and plane area on the canvas, rounded to whole output pixels
+    left = round((max(crop[0], canvas_x) - square_x) * scale)
+    top = round((max(crop[1], canvas_y) - square_y) * scale)
+    right = round((min(crop[2], canvas_x + fit_w) - square_x) * scale)
+    bottom = round((min(crop[3], canvas_y + fit_h) - square_y) * scale)
+    if right <= left or bottom <= top:
+        return None
+
+    # Source box of exactly those output pixels
+    box = (max(0.0, (left / scale + square_x - canvas_x) / scale_x),
+           max(0.0, (top / scale + square_y - canvas_y) / scale_y),
+           min(float(width), (right / scale + square_x - canvas_x) / scale_x),
+           min(float(height), (bottom / scale + square_y - canvas_y) / scale_y))
+    return box, right - left, bottom - top, (left, top)
+
+
+def resample_once(plane, size, bounds, padding=PADDING):
+    """Crop, frame and scale an 'L' plane to size x size with one LANCZOS resample (see plan_resample)"""
+    output = Image.new('L', (size, size), 0)
+    plan = plan_resample(plane.width, plane.height, size, bounds, padding)
+    if plan is not None:
+        box, out_w, out_h, offset = plan
+        output.paste(plane.resize((out_w, out_h), Image.Resampling.LANCZOS, box=box), offset)
+    return output
@@ -0,0 +1,277 @@
+"""
+Asynchronous processing jobs on a local process pool.
+
+POST /jobs stores a job row and hands the uploaded files to a
+concurrent.futures process pool, so large or batch jobs run outside the web
+workers (and outside their GIL and request timeout). Status and results
+live in a small SQLite database that all Gunicorn workers share, so any
+worker can answer GET /jobs/<id>. Finished jobs expire after a TTL; jobs
+stuck queued or running past a timeout (e.g. their pool process died) are
+marked as failed and expire the same way.
+No Flask imports - the pool processes only load the pipeline.
+"""
+
+import concurrent.futures
+from contextlib import nullcontext
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+
+from PIL import Image
+
+from admission import estimate_peak_bytes
+from codec_registry import restrict_codecs
+from geometry import DEFAULT_GEOMETRY
+from pipeline import DEFAULT_STRATEGY, render_image
+from processing import ARCHIVE_MIMETYPES, encode_icon_set, encode_png, process_icon_set
+from tracing import finish_trace, start_trace
+
+
+class JobQueueFull(Exception):
+    """Raised when a worker already has too many pending jobs"""
+
+
+class JobStore:
+    """Job status and results in SQLite, shared by all processes on the host"""
+
+    def __init__(self, path, ttl=3600, timeout=600):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                inputs INTEGER NOT NULL,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                error TEXT,
+                timings TEXT,
+                mimetype TEXT,
+                filename TEXT,
+                result BLOB
+            )''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, params, inputs):
+        """Insert a queued job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as db:
+            db.execute('INSERT INTO jobs (id, status, params, inputs, created) VALUES (?, ?, ?, ?, ?)',
+                       (job_id, 'queued', json.dumps(params), inputs, time.time()))
+        return job_id
+
+    def start(self, job_id):
+        """Mark a queued job as running; False if it is no longer queued (failed as stale)"""
+        with self._connect() as db:
+            cursor = db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'",
+                                (time.time(), job_id))
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, result, mimetype, filename, timings):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'done', finished = ?, result = ?, mimetype = ?, filename = ?, "
+                       "timings = ? WHERE id = ? AND status = 'running'",
+                       (time.time(), result, mimetype, filename, json.dumps(timings), job_id))
+
+    def fail(self, job_id, error):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? "
+                       "WHERE id = ? AND status IN ('queued', 'running')", (time.time(), error, job_id))
+
+    def get(self, job_id):
+        """Job status as dict (without the result bytes), or None if unknown/expired"""
+        self.purge_expired()
+        with self._connect() as db:
+            row = db.execute('SELECT id, status, params, inputs, created, started, finished, error, timings, '
+                             'mimetype, filename, length(result) FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'params': json.loads(row[2]),
+            'inputs': row[3],
+            'created': row[4],
+            'started': row[5],
+            'finished': row[6],
+            'error': row[7],
+            'timings': json.loads(row[8]) if row[8] else None,
+            'mimetype': row[9],
+            'filename': row[10],
+            'result_bytes': row[11],
+        }
+
+    def result(self, job_id):
+        """(bytes, mimetype, filename) of a finished job, or None"""
+        with self._connect() as db:
+            return db.execute("SELECT result, mimetype, filename FROM jobs WHERE id = ? AND status = 'done'",
+                              (job_id,)).fetchone()
+
+    def purge_expired(self):
+        """Fail jobs queued or running for longer than the timeout, drop finished jobs older than the TTL"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? "
+                       "WHERE status IN ('queued', 'running') AND COALESCE(started, created) < ?",
+                       (now, f'Job timed out after {self.timeout} s', now - self.timeout))
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (now - self.ttl,))
+
+    def count(self, status):
+        with self._connect() as db:
+            return db.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (status,)).fetchone()[0]
+
+
+def job_estimate(img, params):
+    """Peak working set of one job input (see admission.estimate_peak_bytes); icon sets render
+    at their largest size
+    """
+    size = max(params['sizes']) if params['sizes'] else params['size']
+    return estimate_peak_bytes(img.width, img.height, img.mode, size, params['quality'])
+
+
+def reserved(memory_budget, estimate_bytes, timeout=None):
+    """Budget reservation of one job input (see MemoryBudget.admit_background), none without a budget"""
+    if memory_budget is None:
+        return nullcontext()
+    return memory_budget.admit_background(estimate_bytes, timeout)
+
+
+def render_job(inputs, params, memory_budget=None, timeout=None):
+    """Run the pipeline for all inputs of a job, returns (bytes, mimetype, filename)
+
+    One input without sizes gives a PNG (any strategy), one input with sizes an icon
+    set (ZIP or ICO, smart strategy); several inputs are bundled into one ZIP. With memory_budget
+    every input holds its estimate against the budget of the web workers,
+    waiting up to timeout seconds for it; an estimate over the budget fails the job.
+    """
+    invert = params['version'] == 'inverted'
+    sizes = params['sizes']
+    outputs = []
+    for name, data in inputs:
+        img = Image.open(io.BytesIO(data))
+        stem = os.path.splitext(os.path.basename(name or 'logo'))[0] or 'logo'
+        with reserved(memory_budget, job_estimate(img, params), timeout):
+            if sizes:
+                icons = process_icon_set(img, sizes, params['threshold'], invert, params['alpha_threshold'],
+                                         params['quality'], params.get('geometry', DEFAULT_GEOMETRY))
+                if params['archive'] == 'ico':
+                    outputs.append((f'{stem}.ico', encode_icon_set(icons, 'ico', invert)))
+                else:
+                    for size in sorted(icons, reverse=True):
+                        outputs.append((f'{stem}/{stem}_{size}x{size}.png', encode_png(icons[size])))
+            else:
+                size = params['size']
+                processed_img = render_image(img, size, params['threshold'], invert, params['alpha_threshold'],
+                                             params['quality'], params.get('geometry', DEFAULT_GEOMETRY),
+                                             params.get('strategy', DEFAULT_STRATEGY))
+                outputs.append((f'{stem}_{size}x{size}.png', encode_png(processed_img)))
+
+    if len(inputs) == 1 and not sizes:
+        return outputs[0][1], 'image/png', outputs[0][0]
+    if len(inputs) == 1 and params['archive'] == 'ico':
+        return outputs[0][1], ARCHIVE_MIMETYPES['ico'], outputs[0][0]
+
+    output = io.BytesIO()
+    # PNGs are already compressed, store them as-is
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive_file:
+        for filename, payload in outputs:
+            archive_file.writestr(filename, payload)
+    return output.getvalue(), ARCHIVE_MIMETYPES['zip'], 'band_logos.zip'
+
+
+def run_job(db_path, ttl, job_id, inputs, params, memory_budget=None, timeout=600):
+    """Entry point inside the pool process"""
+    store = JobStore(db_path, ttl, timeout)
+    if not store.start(job_id):
+        return  # Timed out while queued
+    trace = start_trace('job')
+    try:
+        payload, mimetype, filename = render_job(inputs, params, memory_budget, timeout)
+    except Exception as e:
+        finish_trace(trace)
+        store.fail(job_id, f'Image processing failed: {str(e)}')
+        return
+    finish_trace(trace)
+    timings = trace.to_dict()
+    timings.pop('logs')
+    store.finish(job_id, payload, mimetype, filename, timings)
+
+
+class JobRunner:
+    """Lazily started process pool plus the shared store
+
+    The pool is created on first use, i.e. inside each Gunicorn worker after the fork.
+    Pool processes are spawned fresh, so they never inherit the web worker's threads or locks;
+    with codecs they accept the same input formats as the web workers (see codec_registry).
+    With memory_budget the jobs reserve their estimates against the same budget as the requests.
+    """
+
+    def __init__(self, db_path, ttl=3600, max_workers=2, max_pending=32, codecs=None,
+                 memory_budget=None, timeout=600):
+        self.store = JobStore(db_path, ttl, timeout)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.codecs = codecs
+        self.memory_budget = memory_budget
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=restrict_codecs if self.codecs else None,
+                initargs=(self.codecs,) if self.codecs else ())
+        return self._executor
+
+    def submit(self, inputs, params):
+        """Queue a job and return its id; raises JobQueueFull if this worker has too many pending jobs"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f'Too many pending jobs (max {self.max_pending})')
+            self._pending += 1
+        job_id = self.store.create(params, len(inputs))
+        try:
+            with self._lock:
+                future = self._get_executor().submit(run_job, self.db_path, self.ttl, job_id, inputs, params,
+                                                     self.memory_budget, self.store.timeout)
+        except Exception as e:
+            self._done(job_id, None, error=e)
+            raise
+        future.add_done_callback(lambda f: self._done(job_id, f))
+        return job_id
+
+    def _done(self, job_id, future, error=None):
+        with self._lock:
+            self._pending -= 1
+        if future is not None and future.exception() is not None:
+            error = future.exception()
+            if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                with self._lock:
+                    self._executor = None  # Start a fresh pool for the next job
+        if error is not None:
+            self.store.fail(job_id, f'Job worker failed: {str(error)}')
+
+    def snapshot(self):
+        """Pending jobs of this worker and job counts of all workers"""
+        self.store.purge_expired()
+        snapshot = {status: self.store.count(status) for status in ('queued', 'running', 'done', 'failed')}
+        with self._lock:
+            snapshot['pending_in_worker'] = self._pending
+        snapshot['pid'] = os.getpid()
+        return snapshot
@@ -0,0 +1,278 @@
+"""
+Staged pipeline engine with selectable strategies.
+
+Every request runs through the same stages:
+
+    decode -> normalize -> map -> bbox -> fit -> encode
+
+A strategy supplies one function per stage. Stage functions work on a state
+dict (source image, grayscale/alpha planes, mapped alpha, bounds, output,
+payload) and update it in place, so callers can run part of the pipeline
+and resume later - the plane cache in app.py keeps the state after
+'normalize' and resumes at 'map'.
+
+A strategy may also supply one function for a run of adjacent stages. With
+fuse=True (default) the engine uses it whenever all of those stages run,
+and reports them as one timing ('map+bbox+fit'); fuse=False runs the single
+stages, e.g. to see where the time goes. Stage times go to the current
+trace (Server-Timing header, X-Debug-Trace) and to the
+imagescale_pipeline_stage_seconds histogram.
+
+Strategies:
+- smart: bright-pixel bounding box with padding - process_image (default)
+- tight: tight getbbox() crop around every visible pixel, no padding and no
+         upscale (the algorithm of the former app_new.py)
+"""
+
+import contextlib
+import io
+import time
+
+from PIL import Image
+
+from encoding import available_formats, encode_image
+from geometry import DEFAULT_GEOMETRY, GEOMETRIES, resample_once
+from pixel_engine import coverage_bboxes, map_alpha, white_with_alpha
+from processing import (FALLBACK_THRESHOLD, auto_thresholds, bbox_brightness_threshold, canvas_coverage,
+                        crop_coverage, prepare_planes, render_planes, render_tiled, smart_crop_box, working_bounds)
+from resolution import DEFAULT_QUALITY, draft_for_processing
+from tiled import use_tiled
+from tracing import log as debug_print, record_pipeline_stage, set_input_pixels, span
+
+STAGES = ('decode', 'normalize', 'map', 'bbox', 'fit', 'encode')
+
+DEFAULT_STRATEGY = 'smart'
+
+
+class Strategy:
+    """One processing algorithm: a function per stage, optionally fused functions for runs of stages"""
+
+    def __init__(self, name, stages, fused=None):
+        self.name = name
+        self.stages = stages
+        self.fused = fused or {}
+
+    def plan(self, start='decode', stop='encode', fuse=True):
+        """[(label, function)] for the stages from start to stop (inclusive)"""
+        names = STAGES[STAGES.index(start):STAGES.index(stop) + 1]
+        steps = []
+        i = 0
+        while i < len(names):
+            run = next((run for run in self.fused if fuse and names[i:i + len(run)] == run), None)
+            if run is None:
+                steps.append((names[i], self.stages[names[i]]))
+                i += 1
+            else:
+                steps.append(('+'.join(run), self.fused[run]))
+                i += len(run)
+        return steps
+
+
+STRATEGIES = {}
+
+
+def register_strategy(strategy):
+    """Make a strategy selectable by name"""
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+
+def parse_strategy(value, default=DEFAULT_STRATEGY):
+    """Validate a strategy name from a request, empty means the default"""
+    strategy = (value or default).strip().lower()
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{value}' (use {', '.join(STRATEGIES)})")
+    return strategy
+
+
+def new_state(img=None, size=300, threshold=50, invert=False, alpha_threshold=30, quality=DEFAULT_QUALITY,
+              geometry=DEFAULT_GEOMETRY, output_format='png', effort='default'):
+    """Initial state of a pipeline run; thresholds None are chosen automatically in 'map'"""
+    return {'img': img, 'size': size, 'threshold': threshold, 'invert': invert, 'alpha_threshold': alpha_threshold,
+            'quality': quality, 'geometry': geometry, 'format': output_format, 'effort': effort}
+
+
+def run_pipeline(strategy, state, start='decode', stop='encode', fuse=True):
+    """Run the stages start..stop of a strategy on state (updated in place) and return it"""
+    for label, function in STRATEGIES[strategy].plan(start, stop, fuse):
+        started = time.perf_counter()
+        function(state)
+        record_pipeline_stage(strategy, label, time.perf_counter() - started)
+    return state
+
+
+def render_image(img, size=300, threshold=50, invert=False, alpha_threshold=30, quality=DEFAULT_QUALITY,
+                 geometry=DEFAULT_GEOMETRY, strategy=DEFAULT_STRATEGY):
+    """One output image of a strategy, for callers without plane cache (jobs, batch.py)
+
+    Very large inputs with the smart strategy and staged geometry are processed in strips
+    (processing.render_tiled) like in process_image; everything else runs the stages decode to fit.
+    """
+    if strategy == 'smart' and geometry == 'staged' and use_tiled(img, size, quality):
+        return render_tiled(img, size, [(threshold, invert, alpha_threshold)], quality)[0][0]
+    state = new_state(img, size, threshold, invert, alpha_threshold, quality, geometry)
+    return run_pipeline(strategy, state, stop='fit')['output']
+
+
+def warm_up(settings, size=64):
+    """Run every strategy and geometry once on a small logo, without trace or metrics
+
+    Builds the lookup tables of the given (threshold, invert, alpha_threshold) settings
+    and initializes the PNG/WebP encoders, e.g. in the Gunicorn master before it forks.
+    """
+    img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    img.paste((255, 255, 255, 255), (size // 4, size // 4, size * 3 // 4, size * 3 // 4))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for strategy in STRATEGIES.values():
+            for geometry in GEOMETRIES:
+                for threshold, invert, alpha_threshold in settings:
+                    state = new_state(img.copy(), size, threshold, invert, alpha_threshold, geometry=geometry)
+                    for _, function in strategy.plan(stop='fit'):
+                        function(state)
+        # Encoders directly, encode() would count the bytes in /metrics
+        for output_format in available_formats():
+            state['output'].save(io.BytesIO(), format=output_format)
+
+
+def upscales(strategy, geometry=DEFAULT_GEOMETRY):
+    """True if the strategy's normalize stage upscales small inputs"""
+    return strategy == 'smart' and geometry == 'staged'
+
+
+# Stages shared by both strategies
+
+def decode(state):
+    """Open lazily, decode once (reduced-size JPEG decode where the quality tier allows it)"""
+    img = state['img']
+    set_input_pixels(img.width * img.height)
+    img = draft_for_processing(img, state['size'], state['quality'])
+    with span('load', img.width * img.height):
+        img.load()
+    state['img'] = img
+
+
+def map_stage(state):
+    """Resolve automatic thresholds, then map brightness to the result alpha"""
+    gray, alpha = state['gray'], state['alpha']
+    if state['threshold'] is None or state['alpha_threshold'] is None:
+        state['threshold'], state['alpha_threshold'] = auto_thresholds(
+            gray, alpha, state['threshold'], state['alpha_threshold'], state['invert'])
+    with span('map', gray.width * gray.height):
+        state['mapped'] = map_alpha(gray, alpha, state['threshold'], state['invert'], state['alpha_threshold'])
+
+
+def encode(state):
+    state['payload'] = encode_image(state['output'], state['format'], state['effort'])
+
+
+# Strategy 'smart'
+
+def smart_normalize(state):
+    state['gray'], state['alpha'] = prepare_planes(state.pop('img'), state['size'], state['quality'],
+                                                   upscale=upscales('smart', state['geometry']))
+
+
+def smart_bbox(state):
+    """Bright pixel bounds: on the fit canvas (staged) or at working resolution (single)"""
+    threshold = bbox_brightness_threshold(state['alpha_threshold'])
+    if state['geometry'] == 'single':
+        state['bounds'] = working_bounds(state['mapped'], threshold)
+        return
+    coverage = canvas_coverage(state['mapped'], state['size'])
+    with span('bbox', coverage.width * coverage.height):
+        bounds, fallback_bounds = coverage_bboxes(coverage, (threshold, FALLBACK_THRESHOLD))
+    state['coverage'] = coverage
+    state['crop'] = smart_crop_box(bounds, fallback_bounds, threshold, coverage.width, coverage.height)
+
+
+def smart_fit(state):
+    if state['geometry'] == 'single':
+        with span('resize', state['size'] * state['size']):
+            state['output'] = white_with_alpha(resample_once(state['mapped'], state['size'], state['bounds']))
+    else:
+        state['output'] = crop_coverage(state['coverage'], state['crop'], state['size'])
+
+
+def smart_render(state):
+    """map + bbox + fit in one call: render_planes carries a single coverage plane throughout"""
+    gray, alpha = state['gray'], state['alpha']
+    if state['threshold'] is None or state['alpha_threshold'] is None:
+        state['threshold'], state['alpha_threshold'] = auto_thresholds(
+            gray, alpha, state['threshold'], state['alpha_threshold'], state['invert'])
+    state['output'] = render_planes(gray, alpha, state['size'], state['threshold'], state['invert'],
+                                    state['alpha_threshold'], state['geometry'])
+
+
+register_strategy(Strategy('smart', {
+    'decode': decode,
+    'normalize': smart_normalize,
+    'map': map_stage,
+    'bbox': smart_bbox,
+    'fit': smart_fit,
+    'encode': encode,
+}, fused={('map', 'bbox', 'fit'): smart_render}))
+
+
+# Strategy 'tight'
+
+def tight_normalize(state):
+    state['gray'], state['alpha'] = prepare_planes(state.pop('img'), state['size'], state['quality'], upscale=False)
+
+
+def tight_bbox(state):
+    """Tight bounds of every visible pixel"""
+    mapped = state['mapped']
+    with span('bbox', mapped.width * mapped.height):
+        bbox = mapped.getbbox()
+    state['bounds'] = (bbox[0], bbox[1], bbox[2] - 1, bbox[3] - 1) if bbox else None
+    debug_print(f"Visible pixel bounds: {state['bounds']}")
+
+
+def tight_fit(state):
+    """Crop to the bounds, square, fit into size x size and center"""
+    size = state['size']
+    bounds = state['bounds']
+    with span('final_resize', size * size):
+        result = Image.new('L', (size, size), 0)
+        if bounds is not None:
+            cropped = state['mapped'].crop((bounds[0], bounds[1], bounds[2] + 1, bounds[3] + 1))
+            crop_w, crop_h = cropped.size
+            if crop_w != crop_h:
+                max_dim = max(crop_w, crop_h)
+                square_img = Image.new('L', (max_dim, max_dim), 0)
+                square_img.paste(cropped, ((max_dim - crop_w) // 2, (max_dim - crop_h) // 2))
+                cropped = square_img
+            resized = cropped.resize((size, size), Image.Resampling.LANCZOS)
+            result.paste(resized, (0, 0))
+        state['output'] = white_with_alpha(result)
+
+
+def tight_bbox_fit(state):
+    """bbox + fit in one call: the square around the bounds is cropped straight from the mapped plane
+
+    crop() fills the area outside the plane with zeros, so the intermediate crop and the
+    square canvas of tight_fit are skipped and the output is the same.
+    """
+    tight_bbox(state)
+    size = state['size']
+    bounds = state['bounds']
+    with span('final_resize', size * size):
+        if bounds is None:
+            result = Image.new('L', (size, size), 0)
+        else:
+            crop_w, crop_h = bounds[2] - bounds[0] + 1, bounds[3] - bounds[1] + 1
+            side = max(crop_w, crop_h)
+            left, top = bounds[0] - (side - crop_w) // 2, bounds[1] - (side - crop_h) // 2
+            square = state['mapped'].crop((left, top, left + side, top + side))
+            result = square.resize((size, size), Image.Resampling.LANCZOS)
+        state['output'] = white_with_alpha(result)
+
+
+register_strategy(Strategy('tight', {
+    'decode': decode,
+    'normalize': tight_normalize,
+    'map': map_stage,
+    'bbox': tight_bbox,
+    'fit': tight_fit,
+    'encode': encode,
+}, fused={('bbox', 'fit'): tight_bbox_fit}))
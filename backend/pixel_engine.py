@@ -0,0 +1,178 @@
+"""
+Whole-image pixel operations for the logo pipeline.
+
+Everything in here works on complete image planes through Pillow's
+point()/ImageChops primitives instead of Python per-pixel loops.
+No Flask imports - safe to use from scripts and worker processes.
+"""
+
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+
+
+@lru_cache(maxsize=256)
+def brightness_lut(threshold, invert, alpha_threshold):
+    """Lookup table: grayscale value -> maximum alpha allowed by brightness
+
+    Encodes the brightness half of the original per-pixel loop:
+    - bright pixels (> threshold) keep their original alpha (255 = no limit)
+    - dark pixels get the gradual edge alpha int(brightness / threshold * 255)
+    - dark pixels whose "test_alpha" is <= alpha_threshold become transparent
+    A threshold <= 0 has no dark pixels (the edge alpha would divide by zero): every
+    pixel counts as bright.
+    """
+    lut = []
+    for value in range(256):
+        pixel_brightness = 255 - value if invert else value
+        if pixel_brightness > threshold or threshold <= 0:
+            lut.append(255)
+            continue
+        test_alpha = int((pixel_brightness / threshold) * 255)
+        if test_alpha <= alpha_threshold:
+            lut.append(0)
+        else:
+            lut.append(max(0, min(255, test_alpha)))
+    return tuple(lut)
+
+
+@lru_cache(maxsize=256)
+def alpha_cut_lut(alpha_threshold):
+    """Lookup table: alpha -> alpha, everything <= alpha_threshold becomes 0"""
+    return tuple(0 if value <= alpha_threshold else value for value in range(256))
+
+
+def map_alpha(gray, alpha, threshold, invert=False, alpha_threshold=30):
+    """Map a grayscale plane and an alpha plane (both mode 'L') to the result alpha
+
+    Bit-identical to the old loop in process_image:
+        final = min(brightness_lut[gray], alpha), cut at alpha_threshold
+    """
+    limit = gray.point(list(brightness_lut(threshold, bool(invert), alpha_threshold)))
+    combined = ImageChops.darker(limit, alpha)
+    return combined.point(list(alpha_cut_lut(alpha_threshold)))
+
+
+def white_with_alpha(alpha):
+    """Build an RGBA image that is pure white with the given alpha plane"""
+    white = Image.new('L', alpha.size, 255)
+    return Image.merge('RGBA', (white, white, white, alpha))
+
+
+@lru_cache(maxsize=2)
+def coverage_luts(squared=False):
+    """Lookup tables: coverage -> (gray, alpha, premultiplied gray) of the RGBA pipeline
+
+    The pipeline used to carry white RGBA images and paste them onto transparent
+    canvases with themselves as mask; Pillow blends every channel on such a paste,
+    so the colour and alpha of each pixel are fixed functions of the resampled
+    alpha ("coverage"). The tables are derived by running exactly those pastes on
+    a 0-255 ramp, so they match the installed Pillow's rounding bit for bit.
+    squared: include the second paste onto the square canvas of the bounding box step
+    """
+    ramp = Image.frombytes('L', (256, 1), bytes(range(256)))
+    white = white_with_alpha(ramp)
+    pasted = Image.new('RGBA', white.size, (0, 0, 0, 0))
+    pasted.paste(white, (0, 0), white)
+    if squared:
+        square = Image.new('RGBA', white.size, (0, 0, 0, 0))
+        square.paste(pasted, (0, 0), pasted)
+        pasted = square
+    premultiplied = pasted.convert('RGBa')
+    return (tuple(pasted.getchannel('R').getdata()), tuple(pasted.getchannel('A').getdata()),
+            tuple(premultiplied.getchannel(0).getdata()))
+
+
+def expand_coverage(coverage, squared=False, size=None):
+    """Expand a coverage plane to the RGBA image the old pipeline produced
+
+    With size, the result is also LANCZOS-resized: like Image.resize on RGBA,
+    the premultiplied gray and the alpha plane are resampled and then
+    un-premultiplied, but only two 8-bit planes are resampled instead of four.
+    """
+    gray_lut, alpha_lut, premultiplied_lut = coverage_luts(squared)
+    alpha = coverage.point(list(alpha_lut))
+    if size is None or size == coverage.size:
+        gray = coverage.point(list(gray_lut))
+        return Image.merge('RGBA', (gray, gray, gray, alpha))
+    premultiplied = coverage.point(list(premultiplied_lut)).resize(size, Image.Resampling.LANCZOS)
+    alpha = alpha.resize(size, Image.Resampling.LANCZOS)
+    return Image.merge('RGBa', (premultiplied, premultiplied, premultiplied, alpha)).convert('RGBA')
+
+
+@lru_cache(maxsize=256)
+def above_lut(threshold):
+    """Lookup table: value -> 255 if value > threshold else 0"""
+    return tuple(255 if value > threshold else 0 for value in range(256))
+
+
+def bright_bboxes(img, thresholds, min_alpha=100):
+    """Find the extent of bright and opaque pixels for several thresholds at once
+
+    A pixel counts when its grayscale value is > threshold and its alpha is > min_alpha
+    (images without alpha count as fully opaque). The grayscale and opacity planes are
+    derived once and shared; each threshold then only costs one LUT pass and getbbox().
+
+    Returns one inclusive (min_x, min_y, max_x, max_y) tuple per threshold, or None
+    where no pixel qualifies.
+    """
+    gray = img.convert('L')
+    opaque = None
+    if img.mode == 'RGBA':
+        opaque = img.getchannel('A').point(list(above_lut(min_alpha)))
+
+    results = []
+    for threshold in thresholds:
+        mask = gray.point(list(above_lut(threshold)))
+        if opaque is not None:
+            mask = ImageChops.darker(mask, opaque)
+        bbox = mask.getbbox()
+        results.append((bbox[0], bbox[1], bbox[2] - 1, bbox[3] - 1) if bbox else None)
+    return results
+
+
+@lru_cache(maxsize=256)
+def coverage_bright_lut(threshold, min_alpha=100):
+    """Lookup table: coverage -> 255 where the expanded pixel is brighter than threshold and opaque enough"""
+    gray_lut, alpha_lut, _ = coverage_luts()
+    return tuple(255 if gray > threshold and alpha > min_alpha else 0 for gray, alpha in zip(gray_lut, alpha_lut))
+
+
+def coverage_bboxes(coverage, thresholds, min_alpha=100):
+    """bright_bboxes for a coverage plane: same bounds as on expand_coverage(coverage),
+    but one LUT pass per threshold on a single plane
+    """
+    results = []
+    for threshold in thresholds:
+        bbox = coverage.point(list(coverage_bright_lut(threshold, min_alpha))).getbbox()
+        results.append((bbox[0], bbox[1], bbox[2] - 1, bbox[3] - 1) if bbox else None)
+    return results
+
+
+def otsu_threshold(histogram):
+    """Otsu's method on a 256-bin histogram
+
+    Returns the split t (one class is values <= t, the other values > t) that maximizes
+    the between-class variance, or None if fewer than two levels are populated.
+    """
+    histogram = histogram[:256]
+    if sum(1 for count in histogram if count) < 2:
+        return None
+    total = sum(histogram)
+    total_sum = sum(value * count for value, count in enumerate(histogram))
+    weight_low = sum_low = 0
+    best_split, best_variance = None, -1.0
+    for value, count in enumerate(histogram[:-1]):
+        weight_low += count
+        sum_low += value * count
+        weight_high = total - weight_low
+        if weight_low == 0:
+            continue
+        if weight_high == 0:
+            break
+        mean_low = sum_low / weight_low
+        mean_high = (total_sum - sum_low) / weight_high
+        variance = weight_low * weight_high * (mean_low - mean_high) ** 2
+        if variance > best_variance:
+            best_split, best_variance = value, variance
+    return best_split
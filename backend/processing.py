@@ -0,0 +1,515 @@
+"""
+The logo processing pipeline: brightness->alpha mapping, smart bounding box,
+icon sets and encoding.
+
+No Flask imports - used by the web app (app.py) as well as job workers and
+scripts. Logs and stage timings go to the current trace (see tracing.py).
+"""
+
+from PIL import Image
+import io
+import zipfile
+
+from animation import DEFAULT_FRAME_WORKERS, Animation, frame_count, map_frames, read_frames
+from encoding import encode_image
+from geometry import DEFAULT_GEOMETRY, resample_once
+from pixel_engine import (above_lut, bright_bboxes, coverage_bboxes, expand_coverage, map_alpha, otsu_threshold,
+                          white_with_alpha)
+from resolution import DEFAULT_QUALITY, draft_for_processing, plan_processing_size, reduce_for_processing
+from tiled import DEFAULT_STRIP_ROWS, StripDownsampler, use_tiled, working_geometry, working_strips
+from tracing import log as debug_print, set_input_pixels, span
+
+def process_image(img, size=300, threshold=50, invert=False, alpha_threshold=30, quality=DEFAULT_QUALITY,
+                  geometry=DEFAULT_GEOMETRY):
+    """Process image: convert all colors to white, make transparent based on brightness
+    Uses high-resolution processing to avoid pixelation in larger outputs
+    alpha_threshold: Pixels with alpha below this value become fully transparent (0-255)
+    threshold / alpha_threshold None: chosen from the image histograms (see auto_thresholds)
+    quality: 'max' (default), 'balanced' or 'fast' - see resolution.QUALITY_TIERS
+    geometry: 'staged' (default) or 'single' - see geometry.py
+    Very large inputs are processed in strips with bounded memory (see render_tiled)
+    """
+    if geometry == 'staged' and use_tiled(img, size, quality):
+        return render_tiled(img, size, [(threshold, invert, alpha_threshold)], quality)[0][0]
+    gray, alpha = prepare_planes(img, size, quality, upscale=geometry == 'staged')
+    return render_planes(gray, alpha, size, threshold, invert, alpha_threshold, geometry)
+
+def prepare_planes(img, size=300, quality=DEFAULT_QUALITY, upscale=True):
+    """Shared part of process_image that does not depend on threshold/invert:
+    RGBA conversion and high-resolution upscale, split into grayscale and alpha planes
+    upscale False keeps small inputs at their size (single-resample geometry)
+    """
+    
+    set_input_pixels(img.width * img.height)
+    
+    # Reduced-size JPEG decode if the quality tier allows it (no-op for 'max')
+    img = draft_for_processing(img, size, quality)
+    
+    with span('decode') as stage:
+        # Shrink sources that are far larger than needed (no-op for 'max') before the RGBA copy,
+        # so the reduced tiers never hold a full-size RGBA image
+        img = reduce_for_processing(img, size, quality)
+        
+        # Convert to RGBA if not already
+        img = img.convert('RGBA')
+        stage['pixels'] = img.width * img.height
+    
+    # For better quality, process at higher resolution if the original is large enough
+    # or if output size is large
+    original_w, original_h = img.size
+    max_original_dim = max(original_w, original_h)
+    
+    # Determine processing resolution - for 'max' at least 2x the output size or original size, whichever is larger
+    processing_size = plan_processing_size(max_original_dim, size, quality)
+    
+    # Only upscale if original is significantly smaller than processing size
+    if upscale and max_original_dim < processing_size * 0.8:
+        # Upscale original image for better processing quality
+        scale_factor = processing_size / max_original_dim
+        new_w = int(original_w * scale_factor)
+        new_h = int(original_h * scale_factor)
+        with span('upscale', new_w * new_h):
+            img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    
+    # Convert to grayscale to measure brightness/darkness
+    with span('grayscale', img.width * img.height):
+        gray = img.convert('L')
+        return gray, img.getchannel('A')
+
+# Ranges of the frontend sliders - automatic thresholds stay inside them
+THRESHOLD_RANGE = (20, 200)
+ALPHA_THRESHOLD_RANGE = (0, 100)
+DEFAULT_THRESHOLD = 50
+DEFAULT_ALPHA_THRESHOLD = 30
+# Minimum share of faint visible pixels (haze) for an automatic alpha_threshold
+MIN_HAZE_SHARE = 0.05
+
+def parse_threshold(value, default):
+    """Parse a threshold parameter: an integer, or 'auto' (returned as None)"""
+    if value is None or str(value).strip() == '':
+        return default
+    if str(value).strip().lower() == 'auto':
+        return None
+    return int(value)
+
+def threshold_from_histogram(histogram, invert=False):
+    """Automatic threshold from the grayscale histogram of the visible pixels"""
+    split = otsu_threshold(histogram)
+    if split is None:
+        threshold = DEFAULT_THRESHOLD
+    else:
+        # Inverted: dark pixels (<= split) are the bright ones, brightness 255 - value > threshold
+        threshold = 254 - split if invert else split
+        threshold = max(THRESHOLD_RANGE[0], min(THRESHOLD_RANGE[1], threshold))
+    debug_print(f"Automatic threshold: {threshold} (Otsu split {split})")
+    return threshold
+
+def alpha_threshold_from_histogram(histogram):
+    """Automatic alpha_threshold from the histogram of the mapped alpha (cut at 0)"""
+    split = otsu_threshold([0] + histogram[1:])
+    if split is not None and sum(histogram[1:split + 1]) < MIN_HAZE_SHARE * sum(histogram[1:]):
+        split = None
+    if split is None:
+        alpha_threshold = DEFAULT_ALPHA_THRESHOLD
+    else:
+        alpha_threshold = max(ALPHA_THRESHOLD_RANGE[0], min(ALPHA_THRESHOLD_RANGE[1], split))
+    debug_print(f"Automatic alpha_threshold: {alpha_threshold} (Otsu split {split})")
+    return alpha_threshold
+
+def auto_thresholds(gray, alpha, threshold=None, alpha_threshold=None, invert=False):
+    """Choose the thresholds left as None (auto) from the histograms of the prepared planes
+    threshold: Otsu split of the grayscale histogram of all visible pixels
+    alpha_threshold: Otsu split of the mapped alpha of all visible pixels (faint haze such as a
+    dark background vs. solid content); default if the faint class is too small to be haze
+    (e.g. just the anti-aliased edges of a clean logo)
+    Returns (threshold, alpha_threshold)
+    """
+    with span('auto_threshold', gray.width * gray.height):
+        if threshold is None:
+            threshold = threshold_from_histogram(gray.histogram(mask=alpha.point(list(above_lut(0)))), invert)
+        if alpha_threshold is None:
+            alpha_threshold = alpha_threshold_from_histogram(
+                map_alpha(gray, alpha, threshold, invert, 0).histogram())
+    return threshold, alpha_threshold
+
+def render_tiled(img, size, settings, quality=DEFAULT_QUALITY, strip_rows=DEFAULT_STRIP_ROWS):
+    """Strip-by-strip version of process_image for very large inputs (see tiled.py)
+    Apart from the decoded source, memory stays bounded by one strip plus the output canvases.
+    settings: list of (threshold, invert, alpha_threshold) - several variants share one pass;
+    None thresholds are chosen automatically (extra histogram passes over the strips)
+    Returns one (image, (threshold, alpha_threshold)) pair per setting, with the thresholds used;
+    images match process_image up to rounding in the downsampling (see bench_tiled.py)
+    """
+    set_input_pixels(img.width * img.height)
+    img = draft_for_processing(img, size, quality)
+    geometry = working_geometry(img.width, img.height, size, quality)
+    if geometry is None:
+        raise ValueError('Input too small for strip processing')
+    factor, work_w, work_h = geometry
+    debug_print(f"Strip processing {img.size} at {work_w}x{work_h} in strips of {strip_rows} rows")
+    
+    with span('decode', img.width * img.height):
+        img.load()
+    
+    settings = list(settings)
+    with span('auto_threshold', work_w * work_h):
+        if any(threshold is None for threshold, _, _ in settings):
+            histogram = [0] * 256
+            for gray, alpha in working_strips(img, factor, strip_rows):
+                strip_histogram = gray.histogram(mask=alpha.point(list(above_lut(0))))
+                histogram = [total + count for total, count in zip(histogram, strip_histogram)]
+            settings = [(threshold_from_histogram(histogram, invert) if threshold is None else threshold,
+                         invert, alpha_threshold) for threshold, invert, alpha_threshold in settings]
+        if any(alpha_threshold is None for _, _, alpha_threshold in settings):
+            histograms = [[0] * 256 for _ in settings]
+            for gray, alpha in working_strips(img, factor, strip_rows):
+                for histogram, (threshold, invert, _) in zip(histograms, settings):
+                    strip_histogram = map_alpha(gray, alpha, threshold, invert, 0).histogram()
+                    histogram[:] = [total + count for total, count in zip(histogram, strip_histogram)]
+            settings = [(threshold, invert,
+                         alpha_threshold_from_histogram(histogram) if alpha_threshold is None else alpha_threshold)
+                        for histogram, (threshold, invert, alpha_threshold) in zip(histograms, settings)]
+    
+    # Same fit-into-size geometry as render_planes
+    scale = min(size / work_w, size / work_h)
+    new_w = int(work_w * scale)
+    new_h = int(work_h * scale)
+    x_offset = (size - new_w) // 2
+    y_offset = (size - new_h) // 2
+    
+    coverages = [Image.new('L', (size, size), 0) for _ in settings]
+    samplers = [StripDownsampler(work_w, work_h, new_w, new_h) for _ in settings]
+    with span('strips', work_w * work_h):
+        # Map each strip for every variant and stream it into the output-size canvases
+        for gray, alpha in working_strips(img, factor, strip_rows):
+            for coverage, sampler, (threshold, invert, alpha_threshold) in zip(coverages, samplers, settings):
+                for row, band in sampler.feed(map_alpha(gray, alpha, threshold, invert, alpha_threshold)):
+                    coverage.paste(band, (x_offset, y_offset + row))
+        for coverage, sampler in zip(coverages, samplers):
+            for row, band in sampler.finish():
+                coverage.paste(band, (x_offset, y_offset + row))
+    
+    results = []
+    for coverage, (threshold, invert, alpha_threshold) in zip(coverages, settings):
+        brightness_threshold = bbox_brightness_threshold(alpha_threshold)
+        debug_print(f"Mapped alpha_threshold {alpha_threshold} to brightness_threshold {brightness_threshold}")
+        results.append((fit_coverage(coverage, size, brightness_threshold), (threshold, alpha_threshold)))
+    return results
+
+def bbox_brightness_threshold(alpha_threshold):
+    """Brightness threshold of the smart bounding box: alpha_threshold 0-100 mapped to 150-240
+    (rounded down), so even high values still find bright content
+    """
+    return int(150 + (alpha_threshold * 0.9))
+
+def render_planes(gray, alpha, size=300, threshold=50, invert=False, alpha_threshold=30, geometry=DEFAULT_GEOMETRY):
+    """Per-variant part of process_image: brightness mapping, resize and smart bounding box
+    Works on a single 8-bit coverage plane (the result alpha); the RGBA output is only
+    expanded at the end, at output size (see pixel_engine.expand_coverage)
+    threshold / alpha_threshold None: chosen automatically (see auto_thresholds)
+    geometry 'single': bounding box at working resolution and one resample (see render_single)
+    """
+    
+    if threshold is None or alpha_threshold is None:
+        threshold, alpha_threshold = auto_thresholds(gray, alpha, threshold, alpha_threshold, invert)
+    if geometry == 'single':
+        return render_single(gray, alpha, size, threshold, invert, alpha_threshold)
+    
+    coverage = render_coverage(gray, alpha, size, threshold, invert, alpha_threshold)
+    
+    # NOW apply the new smart bounding box logic on the final result
+    brightness_threshold = bbox_brightness_threshold(alpha_threshold)
+    debug_print(f"Mapped alpha_threshold {alpha_threshold} to brightness_threshold {brightness_threshold}")
+    return fit_coverage(coverage, size, brightness_threshold)
+
+def render_single(gray, alpha, size, threshold, invert, alpha_threshold):
+    """render_planes with the single-resample geometry planner (see geometry.py)
+    The bright bounds are measured on the mapped alpha at working resolution; crop, square
+    framing and scale are planned from them and the plane is resampled once to the target size.
+    The result is pure white with the resampled alpha.
+    """
+    with span('map', gray.width * gray.height):
+        mapped = map_alpha(gray, alpha, threshold, invert, alpha_threshold)
+    
+    bounds = working_bounds(mapped, bbox_brightness_threshold(alpha_threshold))
+    with span('resize', size * size):
+        coverage = resample_once(mapped, size, bounds)
+    return white_with_alpha(coverage)
+
+def working_bounds(mapped, brightness_threshold):
+    """Bright pixel bounds of a mapped alpha plane at working resolution (fallback threshold if none)"""
+    with span('bbox', mapped.width * mapped.height):
+        # Working-resolution planes are large - the fallback threshold is only scanned when needed
+        [bounds] = coverage_bboxes(mapped, (brightness_threshold,))
+        if bounds is None:
+            debug_print(f"No pixels found above brightness {brightness_threshold}, "
+                        f"using fallback {FALLBACK_THRESHOLD}")
+            [bounds] = coverage_bboxes(mapped, (FALLBACK_THRESHOLD,))
+    debug_print(f"Bright pixel bounds at {mapped.size}: {bounds}")
+    return bounds
+
+def render_coverage(gray, alpha, size, threshold, invert, alpha_threshold):
+    """Brightness mapping and resize of render_planes: the coverage plane centered on the size x size canvas"""
+    
+    # Create result alpha: all visible pixels become white, preserve original transparency
+    # Whole-plane LUT mapping (see pixel_engine.map_alpha), same result as the old per-pixel loop
+    with span('map', gray.width * gray.height):
+        alpha = map_alpha(gray, alpha, threshold, invert, alpha_threshold)
+    return canvas_coverage(alpha, size)
+
+def canvas_coverage(alpha, size):
+    """Resize a mapped alpha plane to fit size x size and center it on an empty canvas"""
+    
+    # Scale to final size FIRST, then apply bounding box logic
+    # Calculate scaling to fit in target size while maintaining aspect ratio
+    img_w, img_h = alpha.size
+    scale = min(size / img_w, size / img_h)
+    new_w = int(img_w * scale)
+    new_h = int(img_h * scale)
+    
+    with span('resize', size * size):
+        # Resize the alpha plane to target size - the colour channels are implied by it
+        if scale != 1.0:
+            resized_alpha = alpha.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        else:
+            resized_alpha = alpha
+        
+        # Create final canvas and center the resized plane on it
+        coverage = Image.new('L', (size, size), 0)
+        x_offset = (size - new_w) // 2
+        y_offset = (size - new_h) // 2
+        coverage.paste(resized_alpha, (x_offset, y_offset))
+    return coverage
+
+# Brightness threshold tried when nothing is above the requested one
+FALLBACK_THRESHOLD = 200
+
+def smart_crop_box(bounds, fallback_bounds, brightness_threshold, width, height):
+    """Crop box with 5 pixel padding around the bright pixel bounds, or None if nothing is bright"""
+    if bounds is None:
+        debug_print(f"No pixels found above brightness {brightness_threshold}, trying fallback with {FALLBACK_THRESHOLD}")
+        # Fallback: Try with lower threshold
+        bounds = fallback_bounds
+        
+        if bounds is None:
+            debug_print("Even fallback threshold failed, returning original")
+            return None
+        else:
+            debug_print(f"Fallback successful with threshold {FALLBACK_THRESHOLD}")
+    
+    min_x, min_y, max_x, max_y = bounds
+    
+    # Add 5 pixel padding around bright content
+    padding = 5
+    crop_x1 = max(0, min_x - padding)
+    crop_y1 = max(0, min_y - padding)
+    crop_x2 = min(width, max_x + 1 + padding)
+    crop_y2 = min(height, max_y + 1 + padding)
+    
+    crop_bbox = (crop_x1, crop_y1, crop_x2, crop_y2)
+    debug_print(f"Bright pixel bounds: ({min_x}, {min_y}, {max_x}, {max_y})")
+    debug_print(f"Crop with padding: {crop_bbox}")
+    return crop_bbox
+
+def fit_coverage(coverage, target_size, brightness_threshold=200):
+    """Smart bounding box on a coverage plane, expanded to the final RGBA image
+    Same result as apply_smart_bounding_box(expand_coverage(coverage), ...)
+    """
+    debug_print(f"Applying smart bounding box with brightness_threshold={brightness_threshold}")
+    
+    width, height = coverage.size
+    
+    with span('bbox', width * height):
+        bounds, fallback_bounds = coverage_bboxes(coverage, (brightness_threshold, FALLBACK_THRESHOLD))
+    
+    crop_bbox = smart_crop_box(bounds, fallback_bounds, brightness_threshold, width, height)
+    return crop_coverage(coverage, crop_bbox, target_size)
+
+def crop_coverage(coverage, crop_bbox, target_size):
+    """Crop a coverage plane to crop_bbox, square it and expand it to the final RGBA image
+    crop_bbox None keeps the whole plane
+    """
+    if crop_bbox is None:
+        return expand_coverage(coverage)
+    
+    with span('final_resize', target_size * target_size):
+        # Crop to bright content with padding
+        cropped = coverage.crop(crop_bbox)
+        
+        # Make it square and center it
+        crop_w, crop_h = cropped.size
+        squared = crop_w != crop_h
+        if squared:
+            max_dim = max(crop_w, crop_h)
+            square_img = Image.new('L', (max_dim, max_dim), 0)
+            x_center = (max_dim - crop_w) // 2
+            y_center = (max_dim - crop_h) // 2
+            square_img.paste(cropped, (x_center, y_center))
+            cropped = square_img
+        
+        # Expand to RGBA while scaling to final target size
+        final_result = expand_coverage(cropped, squared, (target_size, target_size))
+    
+    debug_print(f"Final result size: {final_result.size}")
+    return final_result
+
+def apply_smart_bounding_box(img, target_size, brightness_threshold=200):
+    """
+    Apply smart bounding box that only considers very bright pixels
+    with 5 pixel padding around the content
+    """
+    debug_print(f"Applying smart bounding box with brightness_threshold={brightness_threshold}")
+    
+    width, height = img.size
+    
+    # Find all very bright pixels (brightness > threshold) - primary and fallback bounds in one go
+    with span('bbox', width * height):
+        bounds, fallback_bounds = bright_bboxes(img, (brightness_threshold, FALLBACK_THRESHOLD))
+    
+    crop_bbox = smart_crop_box(bounds, fallback_bounds, brightness_threshold, width, height)
+    if crop_bbox is None:
+        return img
+    
+    with span('final_resize', target_size * target_size):
+        # Crop to bright content with padding
+        cropped = img.crop(crop_bbox)
+        
+        # Make it square and center it
+        crop_w, crop_h = cropped.size
+        if crop_w != crop_h:
+            max_dim = max(crop_w, crop_h)
+            square_img = Image.new('RGBA', (max_dim, max_dim), (0, 0, 0, 0))
+            x_center = (max_dim - crop_w) // 2
+            y_center = (max_dim - crop_h) // 2
+            square_img.paste(cropped, (x_center, y_center), cropped)
+            cropped = square_img
+        
+        # Scale to final target size
+        final_result = cropped.resize((target_size, target_size), Image.Resampling.LANCZOS)
+    
+    debug_print(f"Final result size: {final_result.size}")
+    return final_result
+
+def union_bounds(bounds):
+    """Smallest box around all given (min_x, min_y, max_x, max_y) bounds, None if there are none"""
+    bounds = [box for box in bounds if box is not None]
+    if not bounds:
+        return None
+    return (min(box[0] for box in bounds), min(box[1] for box in bounds),
+            max(box[2] for box in bounds), max(box[3] for box in bounds))
+
+def process_animation(img, size=300, threshold=50, invert=False, alpha_threshold=30, quality=DEFAULT_QUALITY,
+                      workers=DEFAULT_FRAME_WORKERS):
+    """process_image for animated inputs: every frame runs through the pipeline on a thread pool
+    All frames share the thresholds (automatic ones are chosen on the first frame) and one crop
+    box around the bright pixels of all frames, so the framing stays stable over the animation
+    Returns (Animation, (threshold, alpha_threshold))
+    """
+    loop = img.info.get('loop', 1)  # Without a loop count GIFs play once
+    with span('decode', img.width * img.height * frame_count(img)):
+        frames, durations = read_frames(img)
+    debug_print(f"Animated input: {len(frames)} frames of {img.size}, {sum(durations)} ms")
+    
+    if threshold is None or alpha_threshold is None:
+        gray, alpha = prepare_planes(frames[0], size, quality)
+        threshold, alpha_threshold = auto_thresholds(gray, alpha, threshold, alpha_threshold, invert)
+    brightness_threshold = bbox_brightness_threshold(alpha_threshold)
+    
+    def frame_coverage(frame):
+        gray, alpha = prepare_planes(frame, size, quality)
+        coverage = render_coverage(gray, alpha, size, threshold, invert, alpha_threshold)
+        with span('bbox', size * size):
+            return coverage, coverage_bboxes(coverage, (brightness_threshold, FALLBACK_THRESHOLD))
+    
+    rendered = map_frames(frame_coverage, frames, workers)
+    del frames
+    
+    # Union of the per-frame bounds; the fallback only if no frame has content above the threshold
+    bounds = union_bounds(frame_bounds for _, (frame_bounds, _) in rendered)
+    fallback_bounds = union_bounds(frame_fallback for _, (_, frame_fallback) in rendered)
+    crop_bbox = smart_crop_box(bounds, fallback_bounds, brightness_threshold, size, size)
+    
+    outputs = map_frames(lambda item: crop_coverage(item[0], crop_bbox, size), rendered, workers)
+    return Animation(outputs, durations, loop), (threshold, alpha_threshold)
+
+# Output sizes (square) of single images and icon sets; below 2 the padded bounding box has no room
+MIN_SIZE = 2
+MAX_SIZE = 4096
+# Icon set limit: number of sizes per request
+MAX_ICON_SIZES = 12
+# ICO entries cannot be larger than 256x256
+MAX_ICO_SIZE = 256
+ARCHIVE_MIMETYPES = {'zip': 'application/zip', 'ico': 'image/x-icon'}
+
+def parse_size(value, default=300):
+    """Parse an output size parameter: an integer from MIN_SIZE to MAX_SIZE, empty means the default"""
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid size '{value}'") from None
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f'Size {size} out of range ({MIN_SIZE}-{MAX_SIZE})')
+    return size
+
+def parse_sizes(spec):
+    """Parse a sizes list like "32,64,128,300,512" - empty means no icon set"""
+    sizes = sorted({parse_size(token) for token in spec.split(',') if token.strip()}, reverse=True)
+    if len(sizes) > MAX_ICON_SIZES:
+        raise ValueError(f'Too many sizes (max {MAX_ICON_SIZES})')
+    return sizes
+
+def parse_archive(value, sizes):
+    """Validate the icon set container format (zip or ico)"""
+    archive = value.strip().lower()
+    if archive not in ARCHIVE_MIMETYPES:
+        raise ValueError(f"Unknown archive '{value}' (use zip or ico)")
+    if archive == 'ico' and sizes and sizes[0] > MAX_ICO_SIZE:
+        raise ValueError(f'ICO sizes must be {MAX_ICO_SIZE} or smaller')
+    return archive
+
+def process_icon_set(img, sizes, threshold=50, invert=False, alpha_threshold=30, quality=DEFAULT_QUALITY,
+                     geometry=DEFAULT_GEOMETRY):
+    """Render several square sizes from one pipeline run
+    Mapping and smart bounding box run once at the largest size, smaller sizes are derived
+    as a resize pyramid: each from the smallest already rendered level that is at least twice as large
+    Returns a dict {size: image}
+    """
+    ordered = sorted(set(sizes), reverse=True)
+    largest = process_image(img, ordered[0], threshold, invert, alpha_threshold, quality, geometry)
+    icons = {ordered[0]: largest}
+    
+    for size in ordered[1:]:
+        sources = [icon for level, icon in icons.items() if level >= size * 2]
+        source = min(sources, key=lambda icon: icon.width) if sources else largest
+        icons[size] = source.resize((size, size), Image.Resampling.LANCZOS)
+        debug_print(f"Derived {size}x{size} from {source.width}x{source.height}")
+    return icons
+
+def encode_icon_set(icons, archive='zip', invert=False):
+    """Encode an icon set as ZIP of PNGs or as multi-resolution ICO"""
+    output = io.BytesIO()
+    ordered = sorted(icons, reverse=True)
+    if archive == 'ico':
+        largest = icons[ordered[0]]
+        with span('encode', sum(size * size for size in ordered)):
+            largest.save(output, format='ICO', sizes=[(size, size) for size in ordered],
+                         append_images=[icons[size] for size in ordered[1:]])
+    else:
+        prefix = 'band_logo_inverted' if invert else 'band_logo'
+        # PNGs are already compressed, store them as-is
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive_file:
+            for size in ordered:
+                archive_file.writestr(f'{prefix}_{size}x{size}.png', encode_png(icons[size]))
+    return output.getvalue()
+
+def recolor(img, fill_color):
+    """Replace the white fill of a processed logo with another colour, keeping its alpha"""
+    fill = Image.new('RGB', img.size, fill_color)
+    fill.putalpha(img.getchannel('A'))
+    return fill
+
+def encode_png(img):
+    """Encode a processed image as PNG bytes (default effort)"""
+    return encode_image(img, 'png')
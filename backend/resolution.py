@@ -0,0 +1,89 @@
+"""
+Processing resolution planner with quality tiers.
+
+process_image historically always worked at max(size * 2, original, 1024).
+The tiers below pick smaller working resolutions where the output does not
+need them, and shrink large sources already while decoding:
+- max:      the historical behaviour (default, bit-identical output)
+- balanced: work at 2x the output size, reduce larger sources down to that
+- fast:     work at the output size, reduce larger sources down to that
+"""
+
+import math
+
+QUALITY_TIERS = {
+    'fast': {'oversample': 1, 'min_size': 0, 'reduce': True},
+    'balanced': {'oversample': 2, 'min_size': 0, 'reduce': True},
+    'max': {'oversample': 2, 'min_size': 1024, 'reduce': False},
+}
+
+DEFAULT_QUALITY = 'max'
+
+# Modes Image.reduce() handles; the pipeline reduces before its RGBA conversion
+REDUCE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+
+def parse_quality(value):
+    """Validate a quality tier name from a request, empty means the default tier"""
+    quality = (value or DEFAULT_QUALITY).strip().lower()
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality '{value}' (use {', '.join(QUALITY_TIERS)})")
+    return quality
+
+
+def max_input_dimension(size, quality=DEFAULT_QUALITY):
+    """Largest useful longest side of an input for the given output size and tier
+
+    The working resolution of sources that are at least this large. Clients may
+    shrink bigger images to it before uploading (see /upload-limits): 'fast' and
+    'balanced' reduce them to about this size anyway, 'max' would keep the extra
+    pixels but only resample them away again.
+    """
+    tier = QUALITY_TIERS[quality]
+    return max(size * tier['oversample'], tier['min_size'])
+
+
+def plan_processing_size(max_original_dim, size, quality=DEFAULT_QUALITY):
+    """Longest side the pipeline should work at for the given output size and tier"""
+    processing_size = max_input_dimension(size, quality)
+    if not QUALITY_TIERS[quality]['reduce']:
+        # Never go below the original resolution
+        processing_size = max(processing_size, max_original_dim)
+    return processing_size
+
+
+def reduce_factor(max_original_dim, size, quality=DEFAULT_QUALITY):
+    """Integer shrink factor that keeps the source at or above the processing size"""
+    if not QUALITY_TIERS[quality]['reduce']:
+        return 1
+    return max(1, max_original_dim // plan_processing_size(max_original_dim, size, quality))
+
+
+def draft_for_processing(img, size, quality=DEFAULT_QUALITY):
+    """Ask the JPEG decoder for a reduced-size decode (DCT scaling) before loading
+
+    Only has an effect on JPEG images that have not been loaded yet. The decoder
+    picks the smallest scale that is still at least the requested size.
+    """
+    if not QUALITY_TIERS[quality]['reduce'] or img.format != 'JPEG':
+        return img
+    width, height = img.size
+    max_dim = max(width, height)
+    scale = plan_processing_size(max_dim, size, quality) / max_dim
+    if scale < 1:
+        img.draft(img.mode, (math.ceil(width * scale), math.ceil(height * scale)))
+    return img
+
+
+def reduce_for_processing(img, size, quality=DEFAULT_QUALITY):
+    """Box-reduce an already decoded image by an integer factor if it is much too large
+
+    Modes Image.reduce() cannot handle (P, CMYK, I, ...) are converted to RGB, or RGBA
+    if they carry transparency, first.
+    """
+    factor = reduce_factor(max(img.size), size, quality)
+    if factor > 1:
+        if img.mode not in REDUCE_MODES:
+            img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+        img = img.reduce(factor)
+    return img
@@ -0,0 +1,239 @@
+"""
+Content-addressed cache for processed logos.
+
+Keys are a SHA-256 over the uploaded bytes plus the normalized processing
+parameters, values are the encoded output bytes. Two tiers:
+- memory: per-process LRU bounded by total bytes
+- disk (optional): one file per key in a directory shared by all Gunicorn
+  workers, bounded by total size (oldest files are evicted first). Each
+  process tracks the size it has seen and only scans the directory when that
+  exceeds the limit; eviction then frees down to DISK_LOW_WATER of it.
+
+PlaneCache keeps decoded intermediate planes (Pillow images) per process,
+so parameter-only follow-up requests skip decoding and upscaling.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# Disk eviction frees down to this share of max_disk_bytes, so the next directory scan
+# only comes after that much has been written again
+DISK_LOW_WATER = 0.9
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_upload_id(value):
+    """True for strings that look like a content hash (safe to use as cache key and file name)"""
+    return bool(value) and UPLOAD_ID_PATTERN.fullmatch(value) is not None
+
+
+def cache_key(digest, **params):
+    """Combine an upload digest with normalized parameters into a cache key"""
+    normalized = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+    return hashlib.sha256(f'{digest}|{normalized}'.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional shared disk) byte cache with hit/miss counters"""
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # Tracked size of the disk tier, None until the first scan
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return cached bytes for key or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return value
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._memory_put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store bytes under key in both tiers"""
+        with self._lock:
+            self.stats['stores'] += 1
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def snapshot(self):
+        """Counters and current tier sizes (memory tier and counters are per process)"""
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot['memory_entries'] = len(self._entries)
+            snapshot['memory_bytes'] = self._memory_bytes
+        snapshot['disk_enabled'] = bool(self.disk_dir)
+        if self.disk_dir:
+            snapshot['disk_bytes'] = sum(size for _, size, _ in self._disk_files())
+        snapshot['pid'] = os.getpid()
+        return snapshot
+
+    def _memory_put(self, key, value):
+        if len(value) > self.max_memory_bytes:
+            return
+        if key in self._entries:
+            self._memory_bytes -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self._memory_bytes += len(value)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats['memory_evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key)
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)  # Mark as recently used for eviction order
+            return value
+        except OSError:
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir or len(value) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        try:
+            # Write to a temp file and rename so other workers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(value) - replaced
+            full = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if full:
+            self._disk_evict()
+
+    def _disk_files(self):
+        files = []
+        try:
+            entries = list(os.scandir(self.disk_dir))
+        except OSError:
+            return files
+        for entry in entries:
+            if entry.name.startswith('.tmp-'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Removed by another worker in the meantime
+            files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _disk_evict(self):
+        """Scan the directory (it includes other workers' files) and evict the oldest files down to the low water"""
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        if total > self.max_disk_bytes:
+            for path, size, _ in sorted(files, key=lambda item: item[2]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                with self._lock:
+                    self.stats['disk_evictions'] += 1
+                if total <= self.max_disk_bytes * DISK_LOW_WATER:
+                    break
+        with self._lock:
+            self._disk_bytes = total
+
+
+class PlaneCache:
+    """Per-process LRU of image plane tuples, bounded by their total pixel bytes"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def _size(planes):
+        return sum(plane.width * plane.height * len(plane.getbands()) for plane in planes)
+
+    def get(self, key):
+        """Return the cached planes for key or None"""
+        with self._lock:
+            planes = self._entries.get(key)
+            if planes is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return planes
+
+    def put(self, key, planes):
+        """Store a tuple of images under key (planes must not be modified afterwards)"""
+        size = self._size(planes)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self.stats['stores'] += 1
+            if key in self._entries:
+                self._bytes -= self._size(self._entries.pop(key))
+            self._entries[key] = planes
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        """Counters and current size of this process's plane cache"""
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot['entries'] = len(self._entries)
+            snapshot['bytes'] = self._bytes
+        snapshot['pid'] = os.getpid()
+        return snapshot
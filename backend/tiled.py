@@ -0,0 +1,122 @@
+"""
+Strip-based building blocks for very large inputs.
+
+The in-memory pipeline holds the decoded source, its RGBA copy and the full
+grayscale/alpha/mapped planes at working resolution at the same time. For
+large inputs processing.render_tiled instead walks the decoded source in
+horizontal strips: each strip is converted, reduced, split and mapped on its
+own, and the mapped rows are streamed through StripDownsampler straight into
+the output-size canvas. Besides the decoded source, only one strip and a few
+rows of filter margin are alive at any time.
+
+The strip downsampler resamples each output band from the rows it needs
+(including the LANCZOS support), so it matches one big resize up to
+floating-point differences in the filter coefficients.
+"""
+
+import math
+
+from PIL import Image
+
+from resolution import DEFAULT_QUALITY, plan_processing_size, reduce_factor
+
+# Inputs from this many pixels on are processed in strips by process_image
+TILED_MIN_PIXELS = 24_000_000
+
+# Working-resolution rows per strip
+DEFAULT_STRIP_ROWS = 256
+
+# Support radius of the LANCZOS filter in source pixels per output pixel
+LANCZOS_SUPPORT = 3.0
+
+
+def working_geometry(width, height, size, quality=DEFAULT_QUALITY):
+    """(reduce factor, working width, working height) as prepare_planes would use them,
+    or None if prepare_planes would upscale (small inputs are not worth tiling)
+    """
+    factor = reduce_factor(max(width, height), size, quality)
+    work_w, work_h = -(-width // factor), -(-height // factor)  # Image.reduce rounds up
+    if max(work_w, work_h) < plan_processing_size(max(work_w, work_h), size, quality) * 0.8:
+        return None
+    return factor, work_w, work_h
+
+
+def use_tiled(img, size, quality=DEFAULT_QUALITY, min_pixels=TILED_MIN_PIXELS):
+    """True if img is large enough for strip processing and needs no upscale"""
+    return img.width * img.height >= min_pixels and working_geometry(img.width, img.height, size, quality) is not None
+
+
+def working_strips(img, factor=1, strip_rows=DEFAULT_STRIP_ROWS):
+    """Yield (grayscale, alpha) strips of the working-resolution planes, top to bottom
+
+    Each strip is cropped from the decoded source, converted to RGBA and box-reduced on
+    its own; strips are aligned to the reduce factor, so they join up to exactly the
+    planes prepare_planes computes for the whole image.
+    """
+    source_rows = strip_rows * factor
+    for top in range(0, img.height, source_rows):
+        strip = img.crop((0, top, img.width, min(img.height, top + source_rows))).convert('RGBA')
+        if factor > 1:
+            strip = strip.reduce(factor)
+        yield strip.convert('L'), strip.getchannel('A')
+
+
+class StripDownsampler:
+    """LANCZOS-downsample an 'L' plane that arrives as horizontal strips
+
+    feed() takes the next strip and returns the output bands (top row, image) that
+    can be computed from the rows seen so far; finish() returns the rest. Only the
+    rows still inside the filter support of pending output rows are kept.
+    """
+
+    def __init__(self, width, height, out_width, out_height):
+        self.width = width
+        self.height = height
+        self.out_width = out_width
+        self.out_height = out_height
+        self.scale = height / out_height
+        self.support = LANCZOS_SUPPORT * max(self.scale, 1.0)
+        self._buffer = None
+        self._buffer_top = 0
+        self._next_row = 0
+
+    def _append(self, strip):
+        if self._buffer is None:
+            self._buffer = strip
+            return
+        joined = Image.new('L', (self.width, self._buffer.height + strip.height))
+        joined.paste(self._buffer, (0, 0))
+        joined.paste(strip, (0, self._buffer.height))
+        self._buffer = joined
+
+    def _emit(self, last_row):
+        """Resample output rows [next_row, last_row) from the buffer and drop rows no longer needed"""
+        if last_row <= self._next_row:
+            return []
+        top = self._next_row * self.scale - self._buffer_top
+        bottom = last_row * self.scale - self._buffer_top
+        band = self._buffer.resize((self.out_width, last_row - self._next_row), Image.Resampling.LANCZOS,
+                                   box=(0, top, self.width, bottom))
+        bands = [(self._next_row, band)]
+        self._next_row = last_row
+
+        # Keep the rows the next output row can still reach
+        keep_from = max(0, math.floor((self._next_row + 0.5) * self.scale - self.support) - 1)
+        drop = min(keep_from - self._buffer_top, self._buffer.height)
+        if drop >= self._buffer.height:
+            self._buffer = None
+            self._buffer_top += drop
+        elif drop > 0:
+            self._buffer = self._buffer.crop((0, drop, self.width, self._buffer.height))
+            self._buffer_top += drop
+        return bands
+
+    def feed(self, strip):
+        self._append(strip)
+        available = self._buffer_top + self._buffer.height
+        # Output row j reads input rows up to (j + 0.5) * scale + support
+        last_row = math.floor((available - 1 - self.support) / self.scale - 0.5) + 1
+        return self._emit(max(self._next_row, min(self.out_height, last_row)))
+
+    def finish(self):
+        return self._emit(self.out_height)
@@ -0,0 +1,265 @@
+"""
+Request-scoped tracing and Prometheus metrics for the processing pipeline.
+
+Each request gets its own Trace (held in a ContextVar, so concurrent requests
+in threaded workers never see each other's logs). Pipeline code records
+stages with `span()` and messages with `log()`; when the trace is finished
+its spans are folded into per-stage latency histograms that `/metrics`
+renders in the Prometheus text format. Metrics are per worker process.
+No Flask imports - safe to use from scripts and worker processes.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import json
+import threading
+import time
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Input size buckets (pixel count upper bound, label)
+INPUT_BUCKETS = ((250_000, '0.25mp'), (1_000_000, '1mp'), (4_000_000, '4mp'), (16_000_000, '16mp'))
+
+# Frames per animated output
+FRAME_BUCKETS = (2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Number of finished traces kept per worker for /debug-logs
+RECENT_TRACES = 20
+
+_current_trace = contextvars.ContextVar('imagescale_trace', default=None)
+
+
+def input_bucket(pixels):
+    """Label of the input size bucket for a pixel count"""
+    if pixels is None:
+        return 'unknown'
+    for limit, label in INPUT_BUCKETS:
+        if pixels <= limit:
+            return label
+    return 'larger'
+
+
+class Trace:
+    """Logs and stage spans of one request"""
+
+    def __init__(self, name):
+        self.name = name
+        self.logs = []
+        self.spans = []
+        self.pipeline = {}
+        self.input_pixels = None
+        self.duration = None
+        self._started = time.perf_counter()
+        self._token = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'input_pixels': self.input_pixels,
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 2),
+            'spans': [
+                {'stage': span['stage'], 'ms': round(span['seconds'] * 1000, 2), 'pixels': span['pixels']}
+                for span in self.spans
+            ],
+            'pipeline_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.pipeline.items()},
+            'logs': list(self.logs),
+        }
+
+
+class Histogram:
+    """Minimal thread-safe Prometheus histogram with labels"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+                lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class Counter:
+    """Minimal thread-safe Prometheus counter with labels"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._series.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._series.items()):
+                label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+
+stage_seconds = Histogram('imagescale_stage_seconds', 'Wall time per pipeline stage', ('stage', 'input'))
+stage_pixels = Counter('imagescale_stage_pixels_total', 'Pixels handled per pipeline stage', ('stage',))
+request_seconds = Histogram('imagescale_request_seconds', 'Wall time per traced request', ('endpoint', 'input'))
+encoded_bytes = Counter('imagescale_encoded_bytes_total', 'Encoded output bytes per format and effort',
+                        ('format', 'effort'))
+upload_bytes = Counter('imagescale_upload_bytes_total',
+                       'Uploaded image bytes: received, and saved by client-side pre-shrinking', ('kind',))
+uploads = Counter('imagescale_uploads_total', 'Uploaded images, pre-shrunk by the client or not', ('preshrunk',))
+pipeline_stage_seconds = Histogram('imagescale_pipeline_stage_seconds', 'Wall time per pipeline engine stage',
+                                   ('strategy', 'stage'))
+animation_frames = Histogram('imagescale_animation_frames', 'Frames per encoded animation', ('format',),
+                             buckets=FRAME_BUCKETS)
+
+_recent = deque(maxlen=RECENT_TRACES)
+_recent_lock = threading.Lock()
+
+
+def start_trace(name):
+    """Start a new trace for the current request/context and return it"""
+    trace = Trace(name)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    """The trace of the current request, or None outside of a traced request"""
+    return _current_trace.get()
+
+
+def finish_trace(trace):
+    """Stop the trace, fold its spans into the metrics and detach it from the context"""
+    trace.duration = time.perf_counter() - trace._started
+    bucket = input_bucket(trace.input_pixels)
+    for span in trace.spans:
+        stage_seconds.observe(span['seconds'], span['stage'], bucket)
+        if span['pixels']:
+            stage_pixels.inc(span['pixels'], span['stage'])
+    if trace.spans:
+        request_seconds.observe(trace.duration, trace.name, bucket)
+        with _recent_lock:
+            _recent.append(trace.to_dict())
+    if trace._token is not None:
+        _current_trace.reset(trace._token)
+        trace._token = None
+
+
+def recent_traces():
+    """Finished traces of this worker, oldest first"""
+    with _recent_lock:
+        return list(_recent)
+
+
+def log(message):
+    """Print a message and attach it to the current trace (if any)"""
+    print(message)  # Still print to console
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.logs.append(message)
+
+
+def set_input_pixels(pixels):
+    """Record the decoded input size used for the input-size metric buckets"""
+    trace = _current_trace.get()
+    if trace is not None and trace.input_pixels is None:
+        trace.input_pixels = pixels
+
+
+@contextmanager
+def span(stage, pixels=None):
+    """Time a pipeline stage; the yielded dict's 'pixels' may be updated inside the block"""
+    record = {'stage': stage, 'seconds': 0.0, 'pixels': pixels}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(record)
+
+
+def record_pipeline_stage(strategy, stage, seconds):
+    """Time of one pipeline engine stage (see pipeline.py), summed per stage in the current trace"""
+    pipeline_stage_seconds.observe(seconds, strategy, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.pipeline[stage] = trace.pipeline.get(stage, 0.0) + seconds
+
+
+def record_upload(received, original=None):
+    """Bytes of a new upload; original is the size of the file before the client shrank it (or None)"""
+    upload_bytes.inc(received, 'received')
+    uploads.inc(1, 'true' if original is not None else 'false')
+    if original is not None:
+        upload_bytes.inc(max(0, original - received), 'saved')
+
+
+def upload_stats():
+    """Upload counters of this worker for /cache-stats"""
+    return {
+        'uploads': uploads.value('false') + uploads.value('true'),
+        'preshrunk_uploads': uploads.value('true'),
+        'received_bytes': upload_bytes.value('received'),
+        'saved_bytes': upload_bytes.value('saved'),
+    }
+
+
+def server_timing(trace):
+    """Server-Timing header value with the pipeline stage times of a trace, '' if there are none"""
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in trace.pipeline.items())
+
+
+def trace_header(trace, max_bytes=8192):
+    """JSON summary of a trace for a response header, capped at max_bytes
+
+    Spans are always kept; logs are dropped oldest-first until the header fits.
+    """
+    data = trace.to_dict()
+    encoded = json.dumps(data)
+    while len(encoded) > max_bytes and data['logs']:
+        data['logs'] = data['logs'][max(1, len(data['logs']) // 4):]
+        data['logs_truncated'] = True
+        encoded = json.dumps(data)
+    if len(encoded) > max_bytes:
+        encoded = json.dumps({'name': data['name'], 'duration_ms': data['duration_ms'], 'truncated': True})
+    return encoded
+
+
+def render_metrics(extra_lines=()):
+    """All metrics of this worker in the Prometheus text exposition format"""
+    lines = (stage_seconds.render() + stage_pixels.render() + request_seconds.render() + encoded_bytes.render()
+             + upload_bytes.render() + uploads.render() + pipeline_stage_seconds.render()
+             + animation_frames.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Sprite sheets: N /upload requests against one /atlas request
+
+For each case a set of synthetic logos (some of them repeated, as in a show
+where one band plays twice) is sent through the Flask test client once per
+logo to /upload and once as a whole to /atlas. Reported: requests, server
+time, encode time and response bytes of both, and how many cells the
+content-hash deduplication saved.
+
+Check: every cell of the atlas has the same pixels as the /upload result of
+its logo.
+
+Usage:
+    python bench_atlas.py [repeat]
+"""
+
+from PIL import Image
+import base64
+import contextlib
+import io
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+# (distinct logos, repeated logos, output size, format)
+CASES = [
+    (12, 0, 128, 'png'),
+    (24, 6, 256, 'png'),
+    (24, 6, 256, 'webp'),
+    (48, 12, 128, 'webp'),
+]
+MODES = ('RGBA', 'RGB', 'P')
+
+def logos(distinct, repeated):
+    """(name, PNG bytes) of distinct logos plus repeats of the first ones"""
+    files = []
+    for i in range(distinct):
+        mode = MODES[i % len(MODES)]
+        buffer = io.BytesIO()
+        img = create_logo((240 + 40 * (i % 7), 120 + 30 * (i % 5)), mode, 'opaque' if mode == 'RGB' else 'holes')
+        img.putpixel((0, 0), (i % 256,) * len(img.getbands()) if mode != 'P' else i % 256)  # Distinct content
+        img.save(buffer, format='PNG')
+        files.append((f'band{i:02d}.png', buffer.getvalue()))
+    return files + [(f'encore{i:02d}.png', files[i % distinct][1]) for i in range(repeated)]
+
+def per_logo(client, files, size, output_format):
+    """(ms, encode ms, bytes, {name: RGBA bytes}) of one /upload per logo"""
+    elapsed = encode = length = 0.0
+    images = {}
+    for name, data in files:
+        start = time.perf_counter()
+        response = client.post('/upload', data={'image': (io.BytesIO(data), name), 'size': str(size),
+                                                'format': output_format})
+        elapsed += time.perf_counter() - start
+        assert response.status_code == 200, response.get_json()
+        encode += float(response.headers['X-Encode-Time-Ms'])
+        length += len(response.data)
+        images[name] = Image.open(io.BytesIO(response.data)).convert('RGBA').tobytes()
+    return elapsed * 1000, encode, length, images
+
+def atlas(client, files, size, output_format):
+    """(ms, encode ms, bytes, response JSON) of one /atlas request"""
+    start = time.perf_counter()
+    response = client.post('/atlas', data={'image': [(io.BytesIO(data), name) for name, data in files],
+                                           'size': str(size), 'format': output_format})
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.get_json()
+    encode = next(float(part.split('dur=')[1]) for part in response.headers['Server-Timing'].split(', ')
+                  if part.startswith('encode;'))
+    return elapsed * 1000, encode, len(response.data), response.get_json()
+
+if __name__ == "__main__":
+    # No result caching, so every round does the full work
+    os.environ['IMAGESCALE_CACHE_MEMORY_MB'] = '0'
+    os.environ['IMAGESCALE_PLANE_CACHE_MB'] = '0'
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    client = app.app.test_client()
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("SPRITE SHEETS (one /upload per logo vs. one /atlas)")
+    print("=" * 50)
+    ok = True
+    for distinct, repeated, size, output_format in CASES:
+        files = logos(distinct, repeated)
+        with contextlib.redirect_stdout(io.StringIO()):
+            single = min((per_logo(client, files, size, output_format) for _ in range(repeat)), key=lambda r: r[0])
+            packed = min((atlas(client, files, size, output_format) for _ in range(repeat)), key=lambda r: r[0])
+        index = packed[3]
+        sheet = Image.open(io.BytesIO(base64.b64decode(index['atlas']['data']))).convert('RGBA')
+        same = all(sheet.crop((entry['x'], entry['y'], entry['x'] + size, entry['y'] + size)).tobytes()
+                   == single[3][entry['name']] for entry in index['images'])
+        ok = ok and same
+        print(f"\n{len(files)} logos ({repeated} repeated) -> {size}x{size} {output_format}, "
+              f"atlas {index['atlas']['width']}x{index['atlas']['height']} with {index['cells']} cells")
+        print(f"  /upload x{len(files):<3d} {single[0]:8.1f} ms | encode {single[1]:7.1f} ms | "
+              f"{single[2] / 1024:8.1f} KB")
+        print(f"  /atlas  x1   {packed[0]:8.1f} ms | encode {packed[1]:7.1f} ms | {packed[2] / 1024:8.1f} KB "
+              f"(JSON with Base64) | cells {'ok' if same else 'MISMATCH'}")
+
+    print("\nCheck passed!" if ok else "\nCheck FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Compare the staged geometry with the single-resample planner
+
+For each case both geometries run on the same synthetic logo. Reported per
+geometry: time per image, the resampling stages taken from the request
+trace (upscale, resize, final_resize), edge sharpness of the output alpha
+(mean of a FIND_EDGES pass - higher is crisper) and the content box, which
+should stay within a pixel or two between both geometries.
+"""
+
+from PIL import ImageFilter, ImageStat
+import contextlib
+import io
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+# (input size, mode, output size)
+CASES = [
+    ((300, 180), 'RGBA', 300),
+    ((64, 64), 'P', 128),
+    ((900, 1200), 'RGB', 512),
+    ((2000, 1400), 'RGBA', 512),
+    ((1200, 800), 'RGB', 2048),
+]
+
+RESAMPLE_STAGES = ('upscale', 'resize', 'final_resize')
+
+def run(img, size, geometry, repeat):
+    """(ms per image, resample stages, output) of process_image with one geometry"""
+    from processing import process_image
+    from tracing import finish_trace, start_trace
+
+    elapsed = 0.0
+    for _ in range(repeat):
+        trace = start_trace('bench_geometry')
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = process_image(img.copy(), size, 50, False, 30, geometry=geometry)
+        elapsed += time.perf_counter() - start
+        finish_trace(trace)
+    stages = [span['stage'] for span in trace.spans if span['stage'] in RESAMPLE_STAGES]
+    return elapsed / repeat * 1000, stages, result
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("GEOMETRY COMPARISON (staged vs. single resample)")
+    print("=" * 50)
+    for input_size, mode, size in CASES:
+        img = create_logo(input_size, mode, 'holes' if mode in ('RGBA', 'P') else 'opaque')
+        print(f"\n{input_size[0]}x{input_size[1]} {mode} -> {size}x{size}")
+        for geometry in ('staged', 'single'):
+            ms, stages, result = run(img, size, geometry, repeat)
+            alpha = result.getchannel('A')
+            sharpness = ImageStat.Stat(alpha.filter(ImageFilter.FIND_EDGES)).mean[0]
+            print(f"  {geometry:7s} {ms:8.1f} ms | resamples: {', '.join(stages) or '-':28s} | "
+                  f"edge sharpness {sharpness:6.2f} | content box {alpha.getbbox()}")
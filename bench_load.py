@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Load test: replay frontend-like upload traffic against backend.app:app
+
+Simulated users (--concurrency threads) loop over sessions for --duration
+seconds. A session is what a frontend does for one logo:
+- variants:       one /upload-variants request with normal,inverted - what the
+                  current frontend does (default)
+- pair:           /upload normal and /upload inverted at the same time, both
+                  with the file (the frontend before /upload-variants)
+- pair-upload-id: /upload normal, then /upload inverted with its upload_id
+
+Every session picks an input from a weighted mix of image sizes and
+parameters (DEFAULT_MIX, or --mix with a JSON list of the same fields).
+Uploads get a unique suffix after the image data, so caches only hit for
+the share of sessions given by --cache-ratio, which resend an earlier file.
+
+Targets:
+- inprocess: the Flask app through its test client (no server, one process)
+- gunicorn:  a local Gunicorn started like the Dockerfile, with --workers,
+             --worker-class, --threads, --timeout and --preload
+
+Reported: p50/p95/p99/max latency per request kind, throughput, error rate
+(by status) and RSS per worker over time.
+
+Usage:
+    python bench_load.py --target inprocess --concurrency 4 --duration 20
+    python bench_load.py --target gunicorn --workers 4 --worker-class gthread --threads 2
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+from bench_startup import GUNICORN_CONFIG, ROOT, children, multipart
+
+# name -> weight, input size, mode, output size, extra form fields
+DEFAULT_MIX = {
+    'logo-png': {'weight': 5, 'input': (400, 240), 'mode': 'RGBA', 'size': 300, 'params': {}},
+    'photo-jpeg': {'weight': 3, 'input': (2000, 1500), 'mode': 'RGB', 'size': 300, 'params': {'quality': 'balanced'}},
+    'print-png': {'weight': 1, 'input': (4000, 3000), 'mode': 'RGBA', 'size': 512, 'params': {}},
+    'auto-webp': {'weight': 1, 'input': (900, 540), 'mode': 'P', 'size': 300,
+                  'params': {'threshold': 'auto', 'alpha_threshold': 'auto', 'format': 'webp'}},
+}
+
+PATTERNS = ('variants', 'pair', 'pair-upload-id')
+
+def load_mix(path):
+    """Traffic mix from a JSON file: {name: {weight, input: [w, h], mode, size, params}}"""
+    with open(path) as f:
+        mix = json.load(f)
+    for entry in mix.values():
+        entry['input'] = tuple(entry['input'])
+        entry.setdefault('weight', 1)
+        entry.setdefault('params', {})
+    return mix
+
+def encode_inputs(mix):
+    """Encoded image per mix entry (JPEG for RGB inputs, PNG otherwise)"""
+    encoded = {}
+    for name, entry in mix.items():
+        buffer = io.BytesIO()
+        img = create_logo(entry['input'], entry['mode'], 'holes' if entry['mode'] in ('RGBA', 'P') else 'opaque')
+        img.save(buffer, format='JPEG' if entry['mode'] == 'RGB' else 'PNG')
+        encoded[name] = buffer.getvalue()
+    return encoded
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def rss_mb(pid):
+    """Resident set size of a process in MB (0 if it is gone)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+class InProcessTarget:
+    """The Flask app in this process, one test client per user thread"""
+
+    def __init__(self, tmp_dir):
+        os.environ.setdefault('IMAGESCALE_ADMISSION_DIR', os.path.join(tmp_dir, 'admission'))
+        os.environ.setdefault('IMAGESCALE_JOBS_DB', os.path.join(tmp_dir, 'jobs.sqlite3'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        self.app = app.app
+        self._local = threading.local()
+
+    def pids(self):
+        return [os.getpid()]
+
+    def post(self, path, fields, files):
+        """(status, headers)"""
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        data = dict(fields)
+        for name, (filename, payload) in files.items():
+            data[name] = (io.BytesIO(payload), filename)
+        response = self._local.client.post(path, data=data)
+        return response.status_code, response.headers
+
+    def close(self):
+        pass
+
+class GunicornTarget:
+    """A local Gunicorn with the given options"""
+
+    def __init__(self, tmp_dir, port, workers, worker_class, threads, timeout, preload):
+        config_path = os.path.join(tmp_dir, 'gunicorn.conf.py')
+        with open(config_path, 'w') as f:
+            f.write(GUNICORN_CONFIG)
+        env = dict(os.environ,
+                   IMAGESCALE_CACHE_DIR=os.path.join(tmp_dir, 'cache'),
+                   IMAGESCALE_UPLOAD_DIR=os.path.join(tmp_dir, 'uploads'),
+                   IMAGESCALE_ADMISSION_DIR=os.path.join(tmp_dir, 'admission'),
+                   IMAGESCALE_JOBS_DB=os.path.join(tmp_dir, 'jobs.sqlite3'))
+        command = [sys.executable, '-m', 'gunicorn', '--config', config_path, '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--worker-class', worker_class, '--threads', str(threads),
+                   '--timeout', str(timeout)] + (['--preload'] if preload else []) + ['backend.app:app']
+        self.url = f'http://127.0.0.1:{port}'
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True)
+        ready = 0
+        while ready < workers:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError('gunicorn exited before all workers were ready')
+            ready += line.startswith('READY ')
+        # Keep draining the hook output of restarted workers
+        threading.Thread(target=self.process.stdout.read, daemon=True).start()
+
+    def pids(self):
+        return [self.process.pid] + children(self.process.pid)
+
+    def post(self, path, fields, files):
+        """(status, headers); the body is read and dropped"""
+        body, content_type = multipart(fields, files)
+        request = urllib.request.Request(self.url + path, data=body, headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+class LoadTest:
+    def __init__(self, target, mix, inputs, pattern, cache_ratio, think, seed):
+        self.target = target
+        self.mix = mix
+        self.inputs = inputs
+        self.pattern = pattern
+        self.cache_ratio = cache_ratio
+        self.think = think
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sent = []  # (name, bytes) of earlier sessions, for cache hits
+        self.results = []  # (finished at, kind, status, ms)
+        self.sessions = 0
+        self.counter = 0
+
+    def pick(self):
+        """(mix entry name, upload bytes) for the next session"""
+        with self.lock:
+            if self.sent and self.random.random() < self.cache_ratio:
+                return self.random.choice(self.sent)
+            names = list(self.mix)
+            name = self.random.choices(names, weights=[self.mix[n]['weight'] for n in names])[0]
+            self.counter += 1
+            # Decoders stop at the end of the image, the suffix only makes the upload unique
+            data = self.inputs[name] + f'load-{self.counter}'.encode()
+            self.sent.append((name, data))
+            return name, data
+
+    def request(self, kind, path, fields, files):
+        started = time.perf_counter()
+        try:
+            status, headers = self.target.post(path, fields, files)
+        except Exception:
+            status, headers = 0, {}
+        finished = time.perf_counter()
+        with self.lock:
+            self.results.append((finished, kind, status, (finished - started) * 1000))
+        return status, headers
+
+    def session(self, pool):
+        """One session; pool (two threads) sends the requests of the pair pattern at the same time"""
+        name, data = self.pick()
+        entry = self.mix[name]
+        fields = {'size': str(entry['size']), **{key: str(value) for key, value in entry['params'].items()}}
+        files = {'image': (f'{name}.bin', data)}
+        if self.pattern == 'variants':
+            variant_fields = {key: value for key, value in fields.items() if key not in ('format', 'effort')}
+            self.request('upload-variants', '/upload-variants', dict(variant_fields, variants='normal,inverted'), files)
+        elif self.pattern == 'pair':
+            concurrent.futures.wait([pool.submit(self.request, f'upload {version}', '/upload',
+                                                 dict(fields, version=version), files)
+                                     for version in ('normal', 'inverted')])
+        else:
+            # The second request needs the upload_id of the first
+            status, headers = self.request('upload normal', '/upload', dict(fields, version='normal'), files)
+            if status == 200:
+                self.request('upload inverted', '/upload',
+                             dict(fields, version='inverted', upload_id=headers.get('X-Upload-Id')), {})
+            else:
+                self.request('upload inverted', '/upload', dict(fields, version='inverted'), files)
+        with self.lock:
+            self.sessions += 1
+
+    def user(self, deadline):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            while time.perf_counter() < deadline:
+                self.session(pool)
+                if self.think:
+                    time.sleep(self.think)
+
+def sample_rss(target, interval, stop, samples, started):
+    """Record (seconds since start, {pid: RSS MB}) until stop is set"""
+    while not stop.is_set():
+        samples.append((time.perf_counter() - started, {pid: rss_mb(pid) for pid in target.pids()}))
+        stop.wait(interval)
+
+def report(test, samples, started, elapsed):
+    results = test.results
+    summary = {'sessions': test.sessions, 'requests': len(results), 'seconds': round(elapsed, 2),
+               'requests_per_second': round(len(results) / elapsed, 2),
+               'sessions_per_second': round(test.sessions / elapsed, 2), 'kinds': {}, 'statuses': {}}
+    print(f"\n{test.sessions} sessions, {len(results)} requests in {elapsed:.1f} s: "
+          f"{summary['requests_per_second']:.1f} requests/s, {summary['sessions_per_second']:.1f} sessions/s")
+    print(f"\n  {'request':16s} {'count':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}  errors")
+    for kind in sorted({kind for _, kind, _, _ in results}):
+        latencies = [ms for _, k, _, ms in results if k == kind]
+        errors = sum(1 for _, k, status, _ in results if k == kind and status != 200 and status != 304)
+        stats = {'count': len(latencies), 'p50_ms': percentile(latencies, 0.50), 'p95_ms': percentile(latencies, 0.95),
+                 'p99_ms': percentile(latencies, 0.99), 'max_ms': max(latencies), 'errors': errors}
+        summary['kinds'][kind] = {key: round(value, 1) for key, value in stats.items()}
+        print(f"  {kind:16s} {stats['count']:6d} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} "
+              f"{stats['p99_ms']:8.1f} {stats['max_ms']:8.1f}  {errors} ({errors / len(latencies) * 100:.1f} %)")
+    for _, _, status, _ in results:
+        summary['statuses'][str(status)] = summary['statuses'].get(str(status), 0) + 1
+    errors = sum(count for status, count in summary['statuses'].items() if status not in ('200', '304'))
+    summary['error_rate'] = round(errors / max(1, len(results)), 4)
+    print(f"\n  error rate {summary['error_rate'] * 100:.2f} % | statuses "
+          + ', '.join(f'{status}: {count}' for status, count in sorted(summary['statuses'].items()))
+          + " (0 = connection error)")
+
+    print(f"\n  {'t (s)':>6s}  RSS per process (MB; gunicorn: master first)")
+    step = max(1, len(samples) // 12)
+    for seconds, rss in samples[::step]:
+        print(f"  {seconds:6.1f}  " + ' '.join(f'{value:6.1f}' for value in rss.values()))
+    peak = {}
+    for _, rss in samples:
+        for pid, value in rss.items():
+            peak[pid] = max(peak.get(pid, 0.0), value)
+    print(f"  {'peak':>6s}  " + ' '.join(f'{value:6.1f}' for value in peak.values()))
+    summary['rss_mb'] = [{'t': round(seconds, 2), 'processes': {str(pid): round(value, 1) for pid, value in rss.items()}}
+                         for seconds, rss in samples]
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test with frontend-like upload traffic')
+    parser.add_argument('--target', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--concurrency', type=int, default=4, help='simulated users (default 4)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of traffic (default 20)')
+    parser.add_argument('--think', type=float, default=0.0, help='pause between sessions of a user in s')
+    parser.add_argument('--pattern', choices=PATTERNS, default='variants',
+                        help='requests per session (default variants, as the frontend)')
+    parser.add_argument('--mix', help='JSON file with the traffic mix (default: DEFAULT_MIX)')
+    parser.add_argument('--cache-ratio', type=float, default=0.0, help='share of sessions resending an earlier file')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='RSS sampling interval in s')
+    parser.add_argument('--json', help='write the summary (with the RSS timeline) to this file')
+    group = parser.add_argument_group('gunicorn target (defaults as in the Dockerfile)')
+    group.add_argument('--workers', type=int, default=4)
+    group.add_argument('--worker-class', default='sync')
+    group.add_argument('--threads', type=int, default=1)
+    group.add_argument('--timeout', type=int, default=60)
+    group.add_argument('--preload', action='store_true')
+    group.add_argument('--port', type=int, default=18725)
+    args = parser.parse_args()
+
+    mix = load_mix(args.mix) if args.mix else DEFAULT_MIX
+    inputs = encode_inputs(mix)
+    print("LOAD TEST")
+    print("=" * 50)
+    print(f"target {args.target}" + (f" ({args.workers} x {args.worker_class}, {args.threads} threads, "
+                                     f"timeout {args.timeout}{', preload' if args.preload else ''})"
+                                     if args.target == 'gunicorn' else '')
+          + f" | {args.concurrency} users, pattern {args.pattern}, {args.duration:.0f} s, "
+            f"cache ratio {args.cache_ratio}")
+    print("mix: " + ', '.join(f"{name} ({entry['input'][0]}x{entry['input'][1]} -> {entry['size']}, "
+                              f"weight {entry['weight']})" for name, entry in mix.items()))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.target == 'gunicorn':
+            target = GunicornTarget(tmp_dir, args.port, args.workers, args.worker_class, args.threads,
+                                    args.timeout, args.preload)
+        else:
+            target = InProcessTarget(tmp_dir)
+        try:
+            test = LoadTest(target, mix, inputs, args.pattern, args.cache_ratio, args.think, args.seed)
+            samples, stop = [], threading.Event()
+            started = time.perf_counter()
+            sampler = threading.Thread(target=sample_rss, args=(target, args.sample_interval, stop, samples, started))
+            sampler.start()
+            users = [threading.Thread(target=test.user, args=(started + args.duration,))
+                     for _ in range(args.concurrency)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for user in users:
+                    user.start()
+                for user in users:
+                    user.join()
+            elapsed = time.perf_counter() - started
+            stop.set()
+            sampler.join()
+        finally:
+            target.close()
+
+    summary = report(test, samples, started, elapsed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Benchmark and golden-output regression suite for the processing pipeline
+
+Golden check: runs process_image (both geometries) and apply_smart_bounding_box
+over a grid of synthetic logos (input sizes, modes RGB/RGBA/P/L, alpha patterns,
+parameters) and compares SHA-256 hashes of the raw output pixels with bench_golden.json.
+Any optimization must keep these bit-identical.
+
+Performance check: runs a few larger cases, each in a fresh process, records
+per-stage times (from the request traces), peak RSS and throughput, and fails
+if throughput drops more than --tolerance below bench_baseline.json.
+
+Usage:
+    python bench_pipeline.py                    # golden + performance check
+    python bench_pipeline.py --golden-only
+    python bench_pipeline.py --update-golden    # after an intended output change
+    python bench_pipeline.py --update-baseline  # on the machine you compare on
+"""
+
+from PIL import Image, ImageDraw
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_golden.json')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# Golden grid
+INPUT_SIZES = [(64, 64), (300, 180), (900, 1200)]
+MODES = ['RGB', 'RGBA', 'P', 'L']
+ALPHA_PATTERNS = ['opaque', 'gradient', 'holes']
+# (output size, threshold, alpha_threshold, invert)
+PARAMETER_SETS = [(300, 50, 30, False), (64, 20, 0, True), (512, 120, 80, False), (128, 50, 100, True)]
+# Modes also checked with the single-resample geometry (see backend/geometry.py)
+SINGLE_RESAMPLE_MODES = ['RGBA', 'L']
+# (canvas size, brightness threshold, dimmed) - 150, 177 and 240 give different bounds on create_logo,
+# 255 never matches and forces the fallback threshold (200), dimmed logos (all pixels <= 200)
+# fail the fallback too and come back uncropped
+BBOX_CASES = [(300, 150, False), (300, 177, False), (300, 240, False), (300, 255, False), (64, 150, False),
+              (64, 240, False), (300, 177, True), (64, 255, True)]
+
+# Performance cases: (name, input size, mode, output size, quality)
+PERF_CASES = [
+    ('logo-300-to-300', (300, 300), 'RGBA', 300, 'max'),
+    ('export-2000-to-512', (2000, 1400), 'RGBA', 512, 'max'),
+    ('export-2000-to-2048', (2000, 1400), 'RGB', 2048, 'max'),
+    ('photo-4000-to-300-balanced', (4000, 3000), 'RGB', 300, 'balanced'),
+]
+
+def create_logo(size, mode, alpha_pattern='opaque'):
+    """Deterministic synthetic logo: dark background, bright lettering, coloured ring
+
+    Everything is inset from the edges, and the brighter a bar, the shorter it is and the
+    further right it sits, so every brightness threshold gives its own bounding box
+    (ring: brightness 160, bars: 138 to 246).
+    """
+    width, height = size
+    img = Image.new('RGB', size, (25, 25, 35))
+    draw = ImageDraw.Draw(img)
+    step = max(width // 9, 1)
+    for i in range(1, 8):
+        shade = 120 + i * 18
+        inset = height // 4 + i * height // 40
+        draw.rectangle((i * step, inset, i * step + step // 2, height - 1 - inset), fill=(shade, shade, shade))
+    draw.ellipse((width // 5, height // 10, width * 4 // 5, height * 9 // 10), outline=(205, 160, 40),
+                 width=max(1, width // 40))
+
+    if mode in ('RGBA', 'P') and alpha_pattern != 'opaque':
+        if alpha_pattern == 'gradient':
+            alpha = Image.linear_gradient('L').rotate(90).resize(size)
+        else:
+            alpha = Image.new('L', size, 255)
+            alpha_draw = ImageDraw.Draw(alpha)
+            for i in range(0, width, max(step, 2)):
+                alpha_draw.rectangle((i, 0, i + step // 3, height // 4), fill=0)
+        img.putalpha(alpha)
+
+    if mode == 'RGBA':
+        return img.convert('RGBA')
+    if mode == 'P':
+        if img.mode == 'RGBA':
+            # Palette with a transparency index for fully transparent pixels
+            paletted = img.convert('RGB').quantize(colors=63)
+            transparent = img.getchannel('A').point(lambda a: 255 if a < 128 else 0)
+            paletted.paste(63, mask=transparent)
+            paletted.info['transparency'] = 63
+            return paletted
+        return img.quantize(colors=64)
+    return img.convert(mode)
+
+def golden_cases():
+    """All (case id, callable returning an image) pairs of the golden grid"""
+    from processing import apply_smart_bounding_box, process_image
+
+    cases = []
+    for size in INPUT_SIZES:
+        for mode in MODES:
+            patterns = ALPHA_PATTERNS if mode in ('RGBA', 'P') else ['opaque']
+            for pattern in patterns:
+                for out_size, threshold, alpha_threshold, invert in PARAMETER_SETS:
+                    case_id = (f'process/{size[0]}x{size[1]}/{mode}/{pattern}/'
+                               f'{out_size}-{threshold}-{alpha_threshold}-{"inv" if invert else "norm"}')
+                    cases.append((case_id, lambda size=size, mode=mode, pattern=pattern, args=(
+                        out_size, threshold, invert, alpha_threshold):
+                        process_image(create_logo(size, mode, pattern), *args)))
+
+    for size in INPUT_SIZES:
+        for mode in SINGLE_RESAMPLE_MODES:
+            pattern = 'holes' if mode == 'RGBA' else 'opaque'
+            for out_size, threshold, alpha_threshold, invert in PARAMETER_SETS:
+                case_id = (f'single/{size[0]}x{size[1]}/{mode}/{pattern}/'
+                           f'{out_size}-{threshold}-{alpha_threshold}-{"inv" if invert else "norm"}')
+                cases.append((case_id, lambda size=size, mode=mode, pattern=pattern, args=(
+                    out_size, threshold, invert, alpha_threshold):
+                    process_image(create_logo(size, mode, pattern), *args, geometry='single')))
+
+    for canvas_size, brightness_threshold, dimmed in BBOX_CASES:
+        case_id = f'bbox/{canvas_size}/{brightness_threshold}' + ('/dim' if dimmed else '')
+        cases.append((case_id, lambda canvas_size=canvas_size, brightness_threshold=brightness_threshold,
+                      dimmed=dimmed: apply_smart_bounding_box(bbox_input(canvas_size, dimmed), canvas_size,
+                                                              brightness_threshold)))
+    return cases
+
+def bbox_input(canvas_size, dimmed=False):
+    """RGBA logo for the bounding box cases; dimmed halves the colours (brightest pixel 123)"""
+    img = create_logo((canvas_size, canvas_size), 'RGBA', 'holes')
+    if dimmed:
+        red, green, blue, alpha = img.split()
+        img = Image.merge('RGBA', [channel.point(lambda v: v // 2) for channel in (red, green, blue)] + [alpha])
+    return img
+
+def output_hash(img):
+    """Hash of mode, size and raw pixels (independent of PNG encoder settings)"""
+    digest = hashlib.sha256(f'{img.mode}{img.size}'.encode('ascii'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+def run_golden(update):
+    print("GOLDEN OUTPUT CHECK")
+    print("=" * 50)
+    start = time.perf_counter()
+    hashes = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for case_id, run in golden_cases():
+            hashes[case_id] = output_hash(run())
+    elapsed = time.perf_counter() - start
+
+    if update or not os.path.exists(GOLDEN_PATH):
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump({'pillow': Image.__version__, 'hashes': hashes}, f, indent=1, sort_keys=True)
+        print(f"Wrote {len(hashes)} golden hashes to {os.path.basename(GOLDEN_PATH)} ({elapsed:.1f} s)")
+        return True
+
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    if golden.get('pillow') != Image.__version__:
+        print(f"WARNING: golden hashes were made with Pillow {golden.get('pillow')}, running {Image.__version__}")
+
+    failures = [case_id for case_id, digest in hashes.items() if golden['hashes'].get(case_id) != digest]
+    missing = [case_id for case_id in golden['hashes'] if case_id not in hashes]
+    for case_id in failures:
+        print(f"  MISMATCH {case_id}")
+    for case_id in missing:
+        print(f"  MISSING  {case_id}")
+    print(f"{len(hashes) - len(failures)}/{len(hashes)} cases bit-identical ({elapsed:.1f} s)")
+    return not failures and not missing
+
+def run_perf_case(case, repeat, queue):
+    """Child process: run one performance case, report stage times, throughput and peak RSS"""
+    from processing import process_image
+    from tracing import finish_trace, start_trace
+
+    name, size, mode, out_size, quality = case
+    buffer = io.BytesIO()
+    create_logo(size, mode, 'gradient' if mode == 'RGBA' else 'opaque').save(
+        buffer, format='JPEG' if mode == 'RGB' else 'PNG')
+    data = buffer.getvalue()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stages = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        trace = start_trace(name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_image(Image.open(io.BytesIO(data)), out_size, 50, False, 30, quality=quality)
+        finish_trace(trace)
+        for span in trace.spans:
+            stages[span['stage']] = stages.get(span['stage'], 0) + span['seconds'] / repeat
+    elapsed = (time.perf_counter() - start) / repeat
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        'seconds': elapsed,
+        'images_per_second': 1 / elapsed,
+        'input_mpx_per_second': size[0] * size[1] / 1e6 / elapsed,
+        'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()},
+        'peak_rss_mb': round(rss_after / 1024, 1),
+        'peak_rss_delta_mb': round((rss_after - rss_before) / 1024, 1),
+    })
+
+def measure(case, repeat):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_perf_case, args=(case, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def run_perf(update, tolerance, repeat):
+    print("\nPERFORMANCE CHECK")
+    print("=" * 50)
+    results = {}
+    for case in PERF_CASES:
+        result = measure(case, repeat)
+        results[case[0]] = result
+        stages = ', '.join(f'{stage} {ms:.1f}' for stage, ms in result['stages_ms'].items())
+        print(f"  {case[0]:28s} {result['seconds'] * 1000:8.1f} ms | {result['images_per_second']:6.2f} img/s | "
+              f"peak RSS {result['peak_rss_mb']:6.1f} MB (+{result['peak_rss_delta_mb']:.1f})")
+        print(f"    stages (ms): {stages}")
+
+    if update or not os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({'machine': platform.platform(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+                       'pillow': Image.__version__, 'results': results}, f, indent=1, sort_keys=True)
+        print(f"Wrote baseline to {os.path.basename(BASELINE_PATH)}")
+        return True
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    if baseline.get('machine') != platform.platform():
+        print(f"NOTE: baseline was recorded on {baseline.get('machine')}")
+
+    ok = True
+    for name, result in results.items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f"  NO BASELINE {name}")
+            continue
+        ratio = result['images_per_second'] / reference['images_per_second']
+        status = 'ok'
+        if ratio < 1 - tolerance:
+            status = 'REGRESSION'
+            ok = False
+        print(f"  {name:28s} {ratio * 100:6.1f}% of baseline throughput  {status}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pipeline benchmark and golden-output regression suite')
+    parser.add_argument('--golden-only', action='store_true', help='skip the performance check')
+    parser.add_argument('--perf-only', action='store_true', help='skip the golden output check')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite bench_golden.json')
+    parser.add_argument('--update-baseline', action='store_true', help='rewrite bench_baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed throughput drop against the baseline (default 0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per performance case')
+    args = parser.parse_args()
+
+    ok = True
+    if not args.perf_only:
+        ok = run_golden(args.update_golden) and ok
+    if not args.golden_only:
+        ok = run_perf(args.update_baseline, args.tolerance, args.repeat) and ok
+
+    print("\nSuite passed!" if ok else "\nSuite FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the pixel stages of process_image
+
+Compares the old per-pixel Python loops (brightness->alpha mapping and the
+smart bounding box scan) with pixel_engine and checks that both produce
+identical results.
+"""
+
+from PIL import Image, ImageDraw
+import sys
+import os
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from pixel_engine import bright_bboxes, map_alpha, white_with_alpha
+
+def legacy_map(img, threshold, invert, alpha_threshold):
+    """The original per-pixel loop from process_image (reference implementation)"""
+    gray = img.convert('L')
+    result_data = []
+    gray_data = gray.getdata()
+    rgba_data = img.getdata()
+
+    for i, pixel_brightness in enumerate(gray_data):
+        original_alpha = rgba_data[i][3] if len(rgba_data[i]) == 4 else 255
+
+        if original_alpha <= alpha_threshold:
+            result_data.append((255, 255, 255, 0))
+            continue
+
+        if invert:
+            pixel_brightness = 255 - pixel_brightness
+
+        if pixel_brightness > threshold:
+            final_alpha = original_alpha
+        else:
+            calculated_alpha = max(0, min(255, int((pixel_brightness / threshold) * 255)))
+            final_alpha = min(calculated_alpha, original_alpha)
+
+        if final_alpha <= alpha_threshold:
+            final_alpha = 0
+
+        if pixel_brightness <= threshold:
+            test_alpha = int((pixel_brightness / threshold) * 255)
+            if test_alpha <= alpha_threshold:
+                final_alpha = 0
+
+        result_data.append((255, 255, 255, final_alpha))
+
+    white_img = Image.new('RGBA', img.size)
+    white_img.putdata(result_data)
+    return white_img
+
+def engine_map(img, threshold, invert, alpha_threshold):
+    """The new LUT based mapping"""
+    gray = img.convert('L')
+    return white_with_alpha(map_alpha(gray, img.getchannel('A'), threshold, invert, alpha_threshold))
+
+def legacy_bbox(img, brightness_threshold):
+    """The original getpixel scan from apply_smart_bounding_box (reference implementation)"""
+    gray = img.convert('L')
+    width, height = img.size
+    min_x, min_y, max_x, max_y = width, height, 0, 0
+    found_bright = False
+
+    for y in range(height):
+        for x in range(width):
+            gray_val = gray.getpixel((x, y))
+            alpha_val = img.getpixel((x, y))[3] if img.mode == 'RGBA' else 255
+
+            if gray_val > brightness_threshold and alpha_val > 100:
+                found_bright = True
+                min_x = min(min_x, x)
+                min_y = min(min_y, y)
+                max_x = max(max_x, x)
+                max_y = max(max_y, y)
+
+    return (min_x, min_y, max_x, max_y) if found_bright else None
+
+def create_test_image(size):
+    """Synthetic logo: full gray/alpha gradient plus a bright shape"""
+    img = Image.new('RGBA', (size, size))
+    img.putdata([
+        (x * 255 // (size - 1), (x + y) % 256, y * 255 // (size - 1), (x * y) % 256)
+        for y in range(size) for x in range(size)
+    ])
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((size // 4, size // 4, size * 3 // 4, size * 3 // 4), fill=(255, 255, 255, 255))
+    return img
+
+def check_identical():
+    """Compare both implementations over a grid of parameters"""
+    img = create_test_image(256)
+    checked = 0
+    for threshold in [1, 20, 50, 127, 200, 255]:
+        for alpha_threshold in [0, 30, 60, 100, 254]:
+            for invert in [False, True]:
+                expected = legacy_map(img, threshold, invert, alpha_threshold)
+                actual = engine_map(img, threshold, invert, alpha_threshold)
+                if expected.tobytes() != actual.tobytes():
+                    print(f"MISMATCH: threshold={threshold}, alpha_threshold={alpha_threshold}, invert={invert}")
+                    return False
+                checked += 1
+    print(f"Bit-identical for {checked} parameter combinations")
+
+    small = create_test_image(96)
+    thresholds = [0, 150, 177, 200, 240, 254, 255]
+    engine = bright_bboxes(small, thresholds)
+    for brightness_threshold, bounds in zip(thresholds, engine):
+        if legacy_bbox(small, brightness_threshold) != bounds:
+            print(f"BBOX MISMATCH: brightness_threshold={brightness_threshold}")
+            return False
+    print(f"Identical bounding boxes for {len(thresholds)} brightness thresholds")
+    return True
+
+def benchmark(size, repeat=3):
+    """Time both implementations on a size x size image"""
+    img = create_test_image(size)
+
+    start = time.perf_counter()
+    legacy_map(img, 50, False, 30)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine_map(img, 50, False, 30)
+    engine_time = (time.perf_counter() - start) / repeat
+
+    print(f"  map  {size}x{size}: loop {legacy_time * 1000:9.1f} ms | engine {engine_time * 1000:7.1f} ms | "
+          f"speedup {legacy_time / engine_time:6.1f}x")
+
+    # Bounding box: old code scanned twice when the primary threshold found nothing
+    start = time.perf_counter()
+    if legacy_bbox(img, 255) is None:
+        legacy_bbox(img, 200)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bright_bboxes(img, (255, 200))
+    engine_time = (time.perf_counter() - start) / repeat
+
+    print(f"  bbox {size}x{size}: loop {legacy_time * 1000:9.1f} ms | engine {engine_time * 1000:7.1f} ms | "
+          f"speedup {legacy_time / engine_time:6.1f}x")
+
+if __name__ == "__main__":
+    print("PIXEL ENGINE BENCHMARK")
+    print("=" * 50)
+
+    if not check_identical():
+        sys.exit(1)
+
+    for size in [512, 1024, 2048]:
+        benchmark(size)
+
+    print("\nBenchmark complete!")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Upload pre-shrinking: bytes and server time saved, and what it does to the output
+
+For each case a large synthetic logo is uploaded twice through the Flask test
+client: as the full-size file, and shrunk to /upload-limits' max_dimension
+the way the frontend does it (high-quality downscale, lossless PNG - the
+original is sent instead if that PNG is not smaller). Reported: upload bytes,
+server time per request and the max/mean alpha difference of the results.
+The pipeline works at about that resolution anyway, the differences come from
+mapping thresholds on an already resampled image (edge pixels only).
+
+Usage:
+    python bench_preshrink.py [repeat]
+"""
+
+from PIL import Image, ImageChops
+import contextlib
+import io
+import os
+import sys
+import time
+import warnings
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+# (input size, mode, output size, quality)
+CASES = [
+    ((4000, 3000), 'RGB', 300, 'max'),
+    ((4000, 3000), 'RGB', 300, 'balanced'),
+    ((6000, 4000), 'RGBA', 512, 'fast'),
+    ((3000, 3000), 'RGBA', 1000, 'max'),
+]
+
+def encode(img, format):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format, **({'quality': 92} if format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+def post(client, data, size, quality, original_bytes=None):
+    """(ms, alpha plane) of one /upload request"""
+    fields = {'image': (io.BytesIO(data), 'logo'), 'size': str(size), 'quality': quality, 'format': 'png'}
+    if original_bytes is not None:
+        fields['original_bytes'] = str(original_bytes)
+    start = time.perf_counter()
+    response = client.post('/upload', data=fields)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.get_json()
+    return elapsed * 1000, Image.open(io.BytesIO(response.data)).getchannel('A')
+
+if __name__ == "__main__":
+    warnings.simplefilter('ignore')
+    os.environ['IMAGESCALE_CACHE_MEMORY_MB'] = '0'
+    os.environ['IMAGESCALE_PLANE_CACHE_MB'] = '0'
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    client = app.app.test_client()
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("UPLOAD PRE-SHRINKING (full upload vs. shrunk to /upload-limits)")
+    print("=" * 50)
+    for input_size, mode, size, quality in CASES:
+        img = create_logo(input_size, mode, 'holes' if mode == 'RGBA' else 'opaque')
+        full = encode(img, 'JPEG' if mode == 'RGB' else 'PNG')
+        max_dimension = client.get(f'/upload-limits?size={size}&quality={quality}').get_json()['max_dimension']
+        scale = max_dimension / max(img.size)
+        shrunk = encode(img.resize((round(img.width * scale), round(img.height * scale)),
+                                   Image.Resampling.LANCZOS), 'PNG')
+        if len(shrunk) >= len(full):
+            print(f"\n{input_size[0]}x{input_size[1]} {mode} -> {size} {quality}: shrunk PNG not smaller, "
+                  f"original is sent")
+            continue
+
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, data, original in (('full', full, None), ('shrunk', shrunk, len(full))):
+                times = []
+                for _ in range(repeat):
+                    ms, alpha = post(client, data, size, quality, original)
+                    times.append(ms)
+                results[name] = (len(data), min(times), alpha)
+        difference = ImageChops.difference(results['full'][2], results['shrunk'][2])
+        mean = sum(i * count for i, count in enumerate(difference.histogram())) / (size * size)
+        print(f"\n{input_size[0]}x{input_size[1]} {mode} -> {size} {quality} (max_dimension {max_dimension})")
+        for name, (length, ms, _) in results.items():
+            print(f"  {name:6s} {length / 1024:9.1f} KB upload | {ms:8.1f} ms")
+        print(f"  saved {(1 - results['shrunk'][0] / results['full'][0]) * 100:5.1f} % bytes, "
+              f"{(1 - results['shrunk'][1] / results['full'][1]) * 100:5.1f} % server time | "
+              f"alpha difference max {difference.getextrema()[1]}, mean {mean:.2f}")
+
+    stats = client.get('/cache-stats').get_json()['uploads']
+    print(f"\nServer stats: {stats['preshrunk_uploads']} of {stats['uploads']} uploads pre-shrunk, "
+          f"{stats['saved_bytes']} bytes saved")
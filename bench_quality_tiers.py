@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Measure time and peak RSS of process_image per quality tier
+
+Every run happens in a fresh process so ru_maxrss is the peak of that run only.
+The alpha difference column compares each tier against the 'max' output.
+"""
+
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+import multiprocessing
+import resource
+import sys
+import os
+import tempfile
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+def create_source(path, width, height, fmt):
+    """Synthetic logo: bright lettering-like shapes on a dark background"""
+    img = Image.new('RGB', (width, height), (20, 20, 30))
+    draw = ImageDraw.Draw(img)
+    step = max(width // 8, 1)
+    for i in range(1, 7):
+        draw.rectangle((i * step, height // 3, i * step + step // 2, height * 2 // 3), fill=(240, 240, 240))
+    draw.ellipse((width // 4, height // 8, width * 3 // 4, height // 3), fill=(200, 180, 60))
+    img.save(path, format=fmt)
+
+def run_tier(path, size, quality, queue):
+    """Child process: process one file with one tier, report time, peak RSS and output"""
+    from app import process_image
+    import contextlib
+    import io
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = process_image(Image.open(path), size, 50, False, 30, quality=quality)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, rss_before, rss_after, result.getchannel('A').tobytes()))
+
+def measure(path, size, quality):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_tier, args=(path, size, quality, queue))
+    proc.start()
+    outcome = queue.get()
+    proc.join()
+    return outcome
+
+if __name__ == "__main__":
+    print("QUALITY TIER MEASUREMENTS")
+    print("=" * 50)
+
+    cases = [
+        ('camera.jpg', 6000, 4000, 'JPEG', 300),
+        ('export.png', 4000, 2000, 'PNG', 300),
+        ('small.png', 300, 300, 'PNG', 64),
+        ('logo.png', 800, 400, 'PNG', 512),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, width, height, fmt, size in cases:
+            path = os.path.join(tmp, name)
+            create_source(path, width, height, fmt)
+            print(f"\n{name} ({width}x{height} {fmt}) -> {size}x{size}")
+
+            reference = None
+            for quality in ['max', 'balanced', 'fast']:
+                elapsed, rss_before, rss_after, alpha = measure(path, size, quality)
+                if reference is None:
+                    reference = alpha
+                diff = ImageStat.Stat(ImageChops.difference(
+                    Image.frombytes('L', (size, size), reference),
+                    Image.frombytes('L', (size, size), alpha))).mean[0]
+                print(f"  {quality:9s} {elapsed * 1000:8.1f} ms | peak RSS {rss_after / 1024:7.1f} MB "
+                      f"(+{(rss_after - rss_before) / 1024:6.1f} MB) | mean alpha diff vs max {diff:5.2f}")
+
+    print("\nMeasurements complete!")
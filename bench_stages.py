@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Per-stage timings of the pipeline engine, fused and unfused
+
+For each case every strategy runs decode..encode twice: with fused stages
+(as the server does) and stage by stage. Reported per run: the time of each
+stage (or fused run of stages) from the request trace and the total.
+
+Checks: fused and unfused runs of a strategy give the same pixels, and the
+smart strategy gives the same pixels as process_image - the engine only
+reorganizes the code, it does not change the output.
+
+Usage:
+    python bench_stages.py [repeat]
+"""
+
+from PIL import Image
+import contextlib
+import io
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+# (input size, mode, output size, geometry)
+CASES = [
+    ((300, 180), 'RGBA', 300, 'staged'),
+    ((64, 64), 'P', 128, 'staged'),
+    ((900, 1200), 'RGB', 512, 'staged'),
+    ((2000, 1400), 'RGBA', 512, 'single'),
+]
+# (threshold, invert, alpha_threshold)
+SETTING = (50, False, 30)
+
+def run(data, size, geometry, strategy, fuse, repeat):
+    """(stage ms per image, total ms per image, output) of one strategy"""
+    from pipeline import new_state, run_pipeline
+    from tracing import finish_trace, start_trace
+
+    threshold, invert, alpha_threshold = SETTING
+    stages, total = {}, 0.0
+    for _ in range(repeat):
+        trace = start_trace('bench_stages')
+        state = new_state(Image.open(io.BytesIO(data)), size, threshold, invert, alpha_threshold,
+                          geometry=geometry)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_pipeline(strategy, state, fuse=fuse)
+        total += time.perf_counter() - start
+        finish_trace(trace)
+        for stage, seconds in trace.pipeline.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return ({stage: seconds / repeat * 1000 for stage, seconds in stages.items()}, total / repeat * 1000,
+            state['output'])
+
+def reference(data, size, geometry):
+    """process_image output for the smart strategy check"""
+    from processing import process_image
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return process_image(Image.open(io.BytesIO(data)), size, *SETTING, geometry=geometry)
+
+if __name__ == "__main__":
+    from pipeline import STRATEGIES
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("PIPELINE STAGES (fused vs. stage by stage)")
+    print("=" * 50)
+    ok = True
+    for input_size, mode, size, geometry in CASES:
+        buffer = io.BytesIO()
+        create_logo(input_size, mode, 'holes' if mode in ('RGBA', 'P') else 'opaque').save(buffer, format='PNG')
+        data = buffer.getvalue()
+        print(f"\n{input_size[0]}x{input_size[1]} {mode} -> {size}x{size} ({geometry})")
+        for strategy in STRATEGIES:
+            outputs = []
+            for fuse in (True, False):
+                stages, total, output = run(data, size, geometry, strategy, fuse, repeat)
+                outputs.append(output.tobytes())
+                timings = ', '.join(f'{stage} {ms:.1f}' for stage, ms in stages.items())
+                print(f"  {strategy:6s} {'fused' if fuse else 'stages':6s} {total:8.1f} ms | {timings}")
+            same = outputs[0] == outputs[1]
+            if strategy == 'smart':
+                same = same and outputs[0] == reference(data, size, geometry).tobytes()
+            ok = ok and same
+            print(f"  {strategy:6s} output {'ok' if same else 'MISMATCH'}")
+
+    print("\nCheck passed!" if ok else "\nCheck FAILED")
+    sys.exit(0 if ok else 1)
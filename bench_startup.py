@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Gunicorn worker startup: boot time, first-request latency and memory per worker
+
+Starts a local Gunicorn (as in the Dockerfile) once per configuration:
+- lazy:    every worker imports the app itself, all Pillow plugins, no warm-up
+           (IMAGESCALE_CODECS=all, IMAGESCALE_WARMUP=0) - the previous behaviour
+- workers: restricted codecs and warm-up, but still once per worker
+- preload: restricted codecs and warm-up once in the master (--preload), workers
+           share it copy-on-write
+
+Reported per configuration: time until the first and the last worker is ready
+(post_worker_init), latency of the first requests after boot and, after those
+requests, RSS / PSS / private memory per worker from /proc/<pid>/smaps_rollup.
+PSS counts shared pages proportionally, so it shows what copy-on-write saves.
+Every configuration is started --rounds times, the medians are reported.
+
+Usage:
+    python bench_startup.py [--workers 4] [--requests 8] [--rounds 3]
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CONFIGURATIONS = [
+    ('lazy', False, {'IMAGESCALE_CODECS': 'all', 'IMAGESCALE_WARMUP': '0'}),
+    ('workers', False, {}),
+    ('preload', True, {}),
+]
+
+# Gunicorn hook: report when a worker has loaded the app and is about to serve
+GUNICORN_CONFIG = """
+import os
+import time
+
+def post_worker_init(worker):
+    # One write() per line, so lines of concurrently booting workers do not interleave
+    os.write(1, f'READY {worker.pid} {time.time()}\\n'.encode())
+"""
+
+def multipart(fields, files):
+    """(body, content type) of a multipart/form-data request"""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(data + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+def memory(pid):
+    """(RSS, PSS, private) in MB of a process"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return (values['Rss'] / 1024, values['Pss'] / 1024,
+            (values['Private_Clean'] + values['Private_Dirty']) / 1024)
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+def run(name, preload, env_overrides, workers, requests, port, logo):
+    """Boot one Gunicorn, returns (first ready s, last ready s, [request ms], [(RSS, PSS, private) per worker],
+    master (RSS, PSS, private))
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'gunicorn.conf.py')
+        with open(config_path, 'w') as f:
+            f.write(GUNICORN_CONFIG)
+        env = dict(os.environ, IMAGESCALE_CACHE_DIR='', IMAGESCALE_CACHE_MEMORY_MB='0',
+                   IMAGESCALE_PLANE_CACHE_MB='0', IMAGESCALE_UPLOAD_DIR='',
+                   IMAGESCALE_ADMISSION_DIR=os.path.join(tmp_dir, 'admission'),
+                   IMAGESCALE_JOBS_DB=os.path.join(tmp_dir, 'jobs.sqlite3'), **env_overrides)
+        command = [sys.executable, '-m', 'gunicorn', '--config', config_path, '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--timeout', '60'] + (['--preload'] if preload else []) + \
+                  ['backend.app:app']
+        started = time.time()
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, text=True)
+        try:
+            ready = []
+            while len(ready) < workers:
+                line = process.stdout.readline()
+                if not line:
+                    raise RuntimeError(f'{name}: gunicorn exited before all workers were ready')
+                if line.startswith('READY '):
+                    ready.append(float(line.split()[2]) - started)
+
+            time.sleep(0.5)  # Let the arbiter settle, the CPU may be shared with the booting workers
+            body, content_type = multipart({'size': '300', 'format': 'png'}, {'image': ('logo.png', logo)})
+            latencies = []
+            for _ in range(requests):
+                request = urllib.request.Request(f'http://127.0.0.1:{port}/upload', data=body,
+                                                 headers={'Content-Type': content_type})
+                request_started = time.perf_counter()
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                latencies.append((time.perf_counter() - request_started) * 1000)
+
+            worker_memory = [memory(pid) for pid in children(process.pid)]
+            master_memory = memory(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return min(ready), max(ready), latencies, worker_memory, master_memory
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Gunicorn worker startup benchmark')
+    parser.add_argument('--workers', type=int, default=4, help='Gunicorn workers (default 4, as in the Dockerfile)')
+    parser.add_argument('--requests', type=int, default=8, help='requests after boot (default 8)')
+    parser.add_argument('--rounds', type=int, default=3, help='starts per configuration (default 3)')
+    parser.add_argument('--port', type=int, default=18724, help='local port (default 18724)')
+    args = parser.parse_args()
+
+    buffer = io.BytesIO()
+    create_logo((900, 540), 'RGBA', 'holes').save(buffer, format='PNG')
+
+    print(f"WORKER STARTUP ({args.workers} workers)")
+    print("=" * 50)
+    for name, preload, env_overrides in CONFIGURATIONS:
+        runs = [run(name, preload, env_overrides, args.workers, args.requests, args.port, buffer.getvalue())
+                for _ in range(args.rounds)]
+        first_ready, last_ready = (median([r[i] for r in runs]) * 1000 for i in (0, 1))
+        first_request = median([r[2][0] for r in runs])
+        later_requests = median([ms for r in runs for ms in r[2][1:]])
+        rss, pss, private = (median(column) for column in zip(*[values for r in runs for values in r[3]]))
+        master_rss = median([r[4][0] for r in runs])
+        print(f"  {name:8s} ready {first_ready:5.0f} / {last_ready:5.0f} ms | first request {first_request:6.1f} ms, "
+              f"later {later_requests:6.1f} ms | per worker RSS {rss:5.1f} MB, PSS {pss:5.1f} MB, "
+              f"private {private:5.1f} MB | master RSS {master_rss:5.1f} MB")
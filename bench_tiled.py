@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Accuracy and memory check for strip processing of very large inputs
+
+Accuracy: renders a grid of synthetic logos with the in-memory pipeline
+(prepare_planes + render_planes) and with render_tiled (strip by strip) and
+fails if any premultiplied channel differs by more than --max-diff or the
+mean alpha difference exceeds --max-mean. Both paths share geometry and mapping; only
+the banded LANCZOS downsampling rounds differently at band edges (by 1 on the
+coverage canvas, a few levels after the bounding box step zooms the cropped logo).
+
+Memory: runs both paths on large inputs, each in a fresh process, and
+reports time and peak RSS above the decoded source, so the bounded working
+set of the strip path is visible next to the in-memory path.
+
+Usage:
+    python bench_tiled.py
+    python bench_tiled.py --accuracy-only
+"""
+
+from PIL import Image, ImageChops
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+from bench_pipeline import create_logo
+
+# (input size, mode, output size, quality, strip rows)
+ACCURACY_CASES = [
+    ((3000, 2000), 'RGBA', 300, 'max', 256),
+    ((3000, 2000), 'RGBA', 300, 'max', 7),
+    ((2500, 3100), 'RGB', 512, 'balanced', 64),
+    ((4000, 1500), 'P', 256, 'fast', 100),
+    ((2048, 2048), 'L', 1000, 'max', 33),
+]
+# (threshold, invert, alpha_threshold)
+SETTINGS = [(50, False, 30), (120, True, 80)]
+
+# (name, input size, mode, output size)
+MEMORY_CASES = [
+    ('24mpx-to-512', (6000, 4000), 'RGBA', 512),
+    ('48mpx-to-512', (8000, 6000), 'RGBA', 512),
+    ('48mpx-to-2048', (8000, 6000), 'RGB', 2048),
+]
+
+def compare(img, size, quality, strip_rows):
+    """(max channel difference, mean alpha difference) between both paths for all SETTINGS"""
+    from processing import prepare_planes, render_planes, render_tiled
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        gray, alpha = prepare_planes(img.copy(), size, quality)
+        expected = [render_planes(gray, alpha, size, *setting) for setting in SETTINGS]
+        tiled = render_tiled(img.copy(), size, SETTINGS, quality, strip_rows)
+
+    max_diff, mean_diff = 0, 0.0
+    for reference, (output, _) in zip(expected, tiled):
+        if reference.size != output.size:
+            return 255, 255.0
+        # Premultiplied, so colour noise in nearly transparent pixels does not count
+        difference = ImageChops.difference(reference.convert('RGBa'), output.convert('RGBa'))
+        max_diff = max(max_diff, max(high for _, high in difference.getextrema()))
+        histogram = difference.getchannel('a').histogram()
+        mean_diff = max(mean_diff, sum(i * count for i, count in enumerate(histogram)) / (size * size))
+    return max_diff, mean_diff
+
+def run_accuracy(max_diff, max_mean):
+    print("STRIP PROCESSING ACCURACY")
+    print("=" * 50)
+    ok = True
+    for input_size, mode, size, quality, strip_rows in ACCURACY_CASES:
+        img = create_logo(input_size, mode, 'gradient' if mode in ('RGBA', 'P') else 'opaque')
+        diff, mean = compare(img, size, quality, strip_rows)
+        status = 'ok' if diff <= max_diff and mean <= max_mean else 'MISMATCH'
+        ok = ok and status == 'ok'
+        print(f"  {input_size[0]}x{input_size[1]} {mode:4s} -> {size:4d} {quality:8s} strips {strip_rows:3d}: "
+              f"max diff {diff:3d}, mean alpha diff {mean:.4f}  {status}")
+    return ok
+
+def run_memory_case(path, size, tiled, queue):
+    """Child process: render one large input with one path, report time and peak RSS"""
+    from processing import prepare_planes, render_planes, render_tiled
+
+    source = Image.open(path)
+    source.load()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if tiled:
+            render_tiled(source, size, [SETTINGS[0]])
+        else:
+            gray, alpha = prepare_planes(source, size)
+            render_planes(gray, alpha, size, *SETTINGS[0])
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        'seconds': elapsed,
+        'peak_rss_mb': round(rss_after / 1024, 1),
+        'peak_rss_delta_mb': round((rss_after - rss_before) / 1024, 1),
+    })
+
+def measure(path, size, tiled):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_memory_case, args=(path, size, tiled, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def run_memory():
+    print("\nPEAK MEMORY (in-memory vs. strips)")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, input_size, mode, size in MEMORY_CASES:
+            path = os.path.join(tmp_dir, f'{name}.png')
+            create_logo(input_size, mode).save(path, compress_level=1)
+            for tiled in (False, True):
+                result = measure(path, size, tiled)
+                print(f"  {name:16s} {'strips' if tiled else 'in-memory':9s} {result['seconds'] * 1000:8.1f} ms | "
+                      f"peak RSS {result['peak_rss_mb']:7.1f} MB (+{result['peak_rss_delta_mb']:.1f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Strip processing accuracy and memory check')
+    parser.add_argument('--accuracy-only', action='store_true', help='skip the memory measurement')
+    parser.add_argument('--max-diff', type=int, default=6, help='allowed channel difference (default 6)')
+    parser.add_argument('--max-mean', type=float, default=0.05, help='allowed mean alpha difference (default 0.05)')
+    args = parser.parse_args()
+
+    ok = run_accuracy(args.max_diff, args.max_mean)
+    if not args.accuracy_only:
+        run_memory()
+
+    print("\nCheck passed!" if ok else "\nCheck FAILED")
+    sys.exit(0 if ok else 1)